@@ -0,0 +1,130 @@
+'''
+asyncio API for looking up beads and accessing archives.
+
+Boxes and archives do blocking file I/O, which must not run in an event loop.
+Here the same operations run in worker threads, on the same objects, so they share
+the metadata caches (box indexes, filters, .xmeta files) with the sync API.
+
+At most `concurrency` operations run at the same time, the rest wait in the event loop.
+Cancelling a waiting operation drops it. A running operation can not be interrupted
+in its thread: lookups complete in the background, validation and extraction stop
+before the next file.
+'''
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import functools
+import threading
+from typing import Callable, List, Optional, TypeVar, Union
+
+from .archive import Archive
+from .archivemap import get_archive
+from .bead import Bead
+from .box import Box, UnionBox
+from .storage import LOCAL, Storage
+from .timeline import BeadContext, Timeline
+from . import layouts
+from . import tech
+
+Path = tech.fs.Path
+T = TypeVar('T')
+
+
+DEFAULT_CONCURRENCY = 16
+
+
+class AsyncBox:
+    '''
+    Async lookups in a box (or UnionBox), and async access to the archives found.
+    '''
+
+    def __init__(self, box: Union[Box, UnionBox], concurrency: int = DEFAULT_CONCURRENCY):
+        self.box = box
+        self.concurrency = concurrency
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._executor = ThreadPoolExecutor(
+            max_workers=concurrency, thread_name_prefix='bead-aio')
+
+    async def _run(self, function: Callable[..., T], *args) -> T:
+        # waiting for the semaphore, not in the executor queue: cancelling drops the call
+        async with self._semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, functools.partial(function, *args))
+
+    async def _run_stoppable(self, function: Callable[..., T], *args) -> T:
+        '''
+        Run function(*args, stop), where stop is an Event set, when the call is cancelled.
+        '''
+        stop = threading.Event()
+        try:
+            return await self._run(function, *args, stop)
+        except asyncio.CancelledError:
+            stop.set()
+            raise
+
+    # lookups
+
+    async def get_context(self, check_type, check_param, time: datetime) -> BeadContext:
+        return await self._run(self.box.get_context, check_type, check_param, time)
+
+    async def get_at(self, check_type, check_param, time: datetime) -> Archive:
+        context = await self.get_context(check_type, check_param, time)
+        return context.best
+
+    async def find_bead(self, name, content_id) -> Optional[Archive]:
+        return await self._run(self.box.find_bead, name, content_id)
+
+    async def timeline(self, name) -> Timeline:
+        return await self._run(self.box.timeline, name)
+
+    async def latest(self, name) -> Bead:
+        '''
+        Newest version of bead name.
+
+        raises LookupError, if there is no bead with name.
+        '''
+        timeline = await self.timeline(name)
+        if not len(timeline):
+            raise LookupError(name)
+        *_, latest = timeline
+        return latest
+
+    async def all_beads(self) -> List[Archive]:
+        return await self._run(lambda: list(self.box.all_beads()))
+
+    # archives
+
+    async def load_archive(
+        self, filename: Path, box_name: str = '', storage: Storage = LOCAL
+    ) -> Archive:
+        '''
+        Archive with its metadata loaded (from its .xmeta file, if it has one).
+
+        The same Archive the sync API has for the file (see archivemap.get_archive).
+        '''
+        return await self._run(functools.partial(get_archive, filename, box_name, storage))
+
+    async def validate(self, archive: Archive):
+        '''
+        raises InvalidArchive
+        '''
+        await self._run_stoppable(lambda stop: archive.validate(stop=stop))
+
+    async def extract_dir(self, archive: Archive, zip_dir: str, fs_dir: Path):
+        await self._run_stoppable(lambda stop: archive.extract_dir(zip_dir, fs_dir, stop=stop))
+
+    async def unpack_code_to(self, archive: Archive, fs_dir: Path):
+        await self.extract_dir(archive, layouts.Archive.CODE, fs_dir)
+
+    async def unpack_data_to(self, archive: Archive, fs_dir: Path):
+        await self.extract_dir(archive, layouts.Archive.DATA, fs_dir)
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
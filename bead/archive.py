@@ -1,15 +1,18 @@
 import os
 import re
-
-from cached_property import cached_property
+import threading
+from typing import Dict, Optional
 
 from tracelog import TRACELOG
 from .bead import UnpackableBead
+from . import layouts
 from . import meta
 from . import tech
 
 from .ziparchive import ZipArchive
+from .zipmembers import Member, dump_members, load_members
 from .exceptions import InvalidArchive
+from .storage import BOOKKEEPING_PREFIX, LOCAL, Storage
 
 persistence = tech.persistence
 
@@ -19,6 +22,29 @@ __all__ = ('Archive', 'InvalidArchive')
 CACHE_CONTENT_ID = 'content_id'
 CACHE_INPUT_MAP = 'input_map'
 
+# all the keys a fully populated cache has
+CACHE_KEYS = (
+    meta.META_VERSION,
+    CACHE_CONTENT_ID,
+    meta.KIND,
+    meta.FREEZE_TIME,
+    meta.INPUTS,
+    CACHE_INPUT_MAP,
+)
+
+# .xmeta files without version are version 1: they have no fingerprint and are trusted blindly
+CACHE_XMETA_VERSION = 'xmeta_version'
+XMETA_VERSION = 2
+# [size, mtime_ns, central directory offset] of the zip file the .xmeta was made from
+# (the offset is None, when the .xmeta was saved without opening the zip file)
+CACHE_FINGERPRINT = 'fingerprint'
+# name of the file with the member table of the zip file (see zipmembers.py) -
+# kept apart, as it is big for archives with many files, and needed only to read the zip
+CACHE_MEMBERS_FILE = 'members_file'
+# keys of the members file
+MEMBERS_FINGERPRINT = 'fingerprint'
+MEMBERS = 'members'
+
 
 def _cached_zip_attribute(cache_key: str, ziparchive_attribute):
     """Make a cache accessor @property with a self.ziparchive.attribute fallback
@@ -35,13 +61,29 @@ def _cached_zip_attribute(cache_key: str, ziparchive_attribute):
 
 
 class Archive(UnpackableBead):
-    def __init__(self, filename: tech.fs.Path, box_name=''):
+    # there can be many thousands of archives in memory, e.g. for `bead web`
+    __slots__ = (
+        'archive_filename', 'archive_path', 'box_name', 'storage', 'name', 'cache',
+        '_ziparchive', '_inputs', '_freeze_time', '__weakref__')
+
+    def __init__(
+        self, filename: tech.fs.Path, box_name='', cache=None, storage: Storage = LOCAL
+    ):
         self.archive_filename = filename
         self.archive_path = tech.fs.Path(filename)
         self.box_name = box_name
+        self.storage = storage
         self.name = bead_name_from_file_path(filename)
         self.cache = {}
-        self.load_cache()
+        self._ziparchive: Optional[ZipArchive] = None
+        self._inputs = None
+        self._freeze_time = None
+        if cache is None:
+            self.load_cache()
+        else:
+            # already known meta, e.g. from a box index
+            self.cache = dict(cache)
+        _intern_values(self.cache)
 
         # Check that we can get access to metadata
         #  - either through the cache or through the archive
@@ -52,20 +94,93 @@ class Archive(UnpackableBead):
         self.kind
 
     def load_cache(self):
+        cache = self._read_xmeta()
+        if cache is not None:
+            self.cache = cache
+
+    def _read_xmeta(self) -> Optional[dict]:
+        '''
+        -> the .xmeta content, None if it is missing, malformed or stale
+        '''
         try:
-            try:
-                self.cache = persistence.loads(self.cache_path.read_text())
-            except persistence.ReadError:
-                TRACELOG(f"Ignoring existing, malformed bead meta cache {self.cache_path}")
+            cache = read_xmeta(self.storage, self.cache_path)
         except FileNotFoundError:
-            pass
+            return None
+        return cache if self._is_fresh(cache) else None
+
+    def _is_fresh(self, cache: Optional[dict]) -> bool:
+        '''
+        Is cache made from the current archive file? - costs a single stat
+        '''
+        if cache is None:
+            return False
+        try:
+            stat = self.storage.stat(self.archive_path)
+        except OSError:
+            return False
+        if not xmeta_is_fresh(cache, stat):
+            TRACELOG(f"Ignoring stale bead meta cache {self.cache_path}")
+            return False
+        return True
+
+    def has_fresh_xmeta(self) -> bool:
+        '''
+        Is there an .xmeta made from the current archive file?
+        '''
+        return self._read_xmeta() is not None
 
     def save_cache(self):
+        '''
+        Write .xmeta atomically: readers see either the old or the new one.
+
+        The zip file is not opened: the meta known is written.
+        '''
         try:
-            self.cache_path.write_text(persistence.dumps(self.cache))
+            cache_path = self.cache_path
+            if CACHE_FINGERPRINT not in self.cache:
+                stat = self.storage.stat(self.archive_path)
+                self.cache[CACHE_XMETA_VERSION] = XMETA_VERSION
+                self.cache[CACHE_FINGERPRINT] = [stat.size, stat.mtime_ns, None]
+            self._write_atomically(cache_path, self.cache)
         except FileNotFoundError:
             pass
 
+    def save_member_table(self):
+        '''
+        Write the member table of the zip file next to it - zip directories are not parsed then.
+
+        The .xmeta refers to it after the next save_cache().
+        raises InvalidArchive
+        '''
+        ziparchive = self.ziparchive
+        if CACHE_FINGERPRINT not in self.cache:
+            return
+        try:
+            members_path = self.cache_path.with_name(members_file_name(self.cache_path.name))
+            self._write_atomically(members_path, {
+                MEMBERS_FINGERPRINT: self.cache[CACHE_FINGERPRINT],
+                MEMBERS: dump_members(ziparchive.members)})
+        except FileNotFoundError:
+            return
+        self.cache[CACHE_MEMBERS_FILE] = members_path.name
+
+    def _write_atomically(self, path, content):
+        temp_path = path.with_name(
+            f'{BOOKKEEPING_PREFIX}xmeta.{os.getpid()}.{threading.get_ident()}.{path.name}')
+        self.storage.write_bytes(temp_path, persistence.dumps(content).encode('utf-8'))
+        self.storage.replace(temp_path, path)
+
+    def complete_cache(self):
+        '''
+        Make sure, that all meta attributes are cached - open the zip only if needed.
+
+        -> the meta attributes
+        raises InvalidArchive if the backing ziparchive is needed, but not valid.
+        '''
+        if not all(key in self.cache for key in CACHE_KEYS):
+            self.ziparchive
+        return {key: self.cache[key] for key in CACHE_KEYS}
+
     @property
     def cache_path(self):
         if self.archive_path.suffix != '.zip':
@@ -90,20 +205,47 @@ class Archive(UnpackableBead):
         self.cache[CACHE_INPUT_MAP] = input_map
         self.save_cache()
 
-    @cached_property
-    def ziparchive(self):
-        ziparchive = ZipArchive(self.archive_filename, self.box_name)
-
-        self._check_and_populate_cache(ziparchive)
-
-        return ziparchive
+    @property
+    def ziparchive(self) -> ZipArchive:
+        if self._ziparchive is None:
+            ziparchive = self._open_ziparchive()
+            self._check_and_populate_cache(ziparchive)
+            self._ziparchive = ziparchive
+        return self._ziparchive
+
+    def _open_ziparchive(self) -> ZipArchive:
+        return ZipArchive(
+            self.archive_filename, self.box_name, self.storage, self._member_table())
+
+    def _member_table(self) -> Optional[Dict[str, Member]]:
+        '''
+        Member table from the members file of the .xmeta - None, if there is no fresh one.
+        '''
+        try:
+            members_path = self.cache_path.with_name(
+                self.cache.get(CACHE_MEMBERS_FILE) or members_file_name(self.cache_path.name))
+            content = read_xmeta(self.storage, members_path)
+            stat = self.storage.stat(self.archive_path)
+        except OSError:
+            return None
+        if content is None or not _fingerprint_matches(content.get(MEMBERS_FINGERPRINT), stat):
+            return None
+        try:
+            members = load_members(content[MEMBERS])
+        except (LookupError, ValueError):
+            TRACELOG(f"Ignoring malformed member table in {members_path}")
+            return None
+        if not self._has_fingerprint():
+            self.cache[CACHE_XMETA_VERSION] = XMETA_VERSION
+            self.cache[CACHE_FINGERPRINT] = content[MEMBERS_FINGERPRINT]
+        return members
 
     def _check_and_populate_cache(self, ziparchive):
         def ensure(cache_key, value):
             try:
                 if self.cache[cache_key] != value:
-                    raise InvalidArchive(
-                        'Cache disagrees with zip meta', self.archive_filename, cache_key)
+                    TRACELOG(f'Cache disagrees with zip meta on {cache_key}')
+                    raise InvalidArchive(self.archive_filename, layouts.Archive.BEAD_META)
             except KeyError:
                 self.cache[cache_key] = value
 
@@ -116,22 +258,61 @@ class Archive(UnpackableBead):
         # need not match
         self.cache.setdefault(CACHE_INPUT_MAP, ziparchive.input_map)
 
-    def validate(self):
-        self.ziparchive.validate()
+        if not self._has_fingerprint():
+            self._populate_fingerprint(ziparchive)
+
+    def _has_fingerprint(self) -> bool:
+        '''
+        Is the fingerprint with the central directory offset known?
+        '''
+        fingerprint = self.cache.get(CACHE_FINGERPRINT)
+        return bool(fingerprint and fingerprint[-1] is not None)
+
+    def _populate_fingerprint(self, ziparchive):
+        try:
+            stat = self.storage.stat(self.archive_path)
+        except OSError:
+            return
+        self.cache[CACHE_XMETA_VERSION] = XMETA_VERSION
+        self.cache[CACHE_FINGERPRINT] = [
+            stat.size, stat.mtime_ns, ziparchive.central_directory_offset]
+
+    def validate(self, workers: Optional[int] = None, stop: Optional[threading.Event] = None):
+        '''
+        raises InvalidArchive, see ZipArchive.validate
+        '''
+        self.ziparchive.validate(workers, stop)
 
     @property
     def inputs(self):
-        try:
-            return tuple(meta.parse_inputs({meta.INPUTS: self.cache[meta.INPUTS]}))
-        except LookupError:
-            return self.ziparchive.inputs
+        if self._inputs is None:
+            try:
+                self._inputs = tuple(meta.parse_inputs({meta.INPUTS: self.cache[meta.INPUTS]}))
+            except LookupError:
+                self._inputs = self.ziparchive.inputs
+        return self._inputs
 
-    def extract_dir(self, zip_dir, fs_dir):
-        return self.ziparchive.extract_dir(zip_dir, fs_dir)
+    @property
+    def freeze_time(self):
+        if self._freeze_time is None:
+            self._freeze_time = super().freeze_time
+        return self._freeze_time
+
+    def extract_dir(
+        self, zip_dir, fs_dir, workers: Optional[int] = None, readonly=False,
+        stop: Optional[threading.Event] = None,
+    ):
+        return self.ziparchive.extract_dir(zip_dir, fs_dir, workers, readonly, stop)
 
     def extract_file(self, zip_path, fs_path):
         return self.ziparchive.extract_file(zip_path, fs_path)
 
+    def extract_dirs_verified(self, extractions, workers: Optional[int] = None, readonly=False):
+        '''
+        raises InvalidArchive, see ZipArchive.extract_dirs_verified
+        '''
+        self.ziparchive.extract_dirs_verified(extractions, workers, readonly)
+
     def unpack_code_to(self, fs_dir):
         self.ziparchive.unpack_code_to(fs_dir)
 
@@ -143,6 +324,56 @@ class Archive(UnpackableBead):
         workspace.input_map = self.input_map
 
 
+def read_xmeta(storage: Storage, path: tech.fs.Path) -> Optional[dict]:
+    '''
+    -> the .xmeta content at path, None if it is malformed
+
+    raises FileNotFoundError
+    '''
+    try:
+        cache = persistence.loads(storage.read_bytes(path).decode('utf-8'))
+    except (persistence.ReadError, UnicodeDecodeError):
+        cache = None
+    if not isinstance(cache, dict):
+        TRACELOG(f"Ignoring existing, malformed bead meta cache {path}")
+        return None
+    return cache
+
+
+def xmeta_is_fresh(cache: dict, archive_stat) -> bool:
+    '''
+    Is the .xmeta content cache made from the archive file having archive_stat?
+    '''
+    version = cache.get(CACHE_XMETA_VERSION, 1)
+    if version == 1:
+        return True
+    if version != XMETA_VERSION:
+        return False
+    return _fingerprint_matches(cache.get(CACHE_FINGERPRINT), archive_stat)
+
+
+def members_file_name(archive_file_name: str) -> str:
+    '''
+    Default name of the member table file of an archive - ignored by box listings.
+    '''
+    root, _ext = os.path.splitext(archive_file_name)
+    return f'{BOOKKEEPING_PREFIX}{root}.members'
+
+
+def _fingerprint_matches(fingerprint, archive_stat) -> bool:
+    try:
+        size, mtime_ns, _central_directory_offset = fingerprint
+    except (TypeError, ValueError):
+        return False
+    return (archive_stat.size, archive_stat.mtime_ns) == (size, mtime_ns)
+
+
+def _intern_values(cache: dict):
+    for key in (meta.META_VERSION, CACHE_CONTENT_ID, meta.KIND, meta.FREEZE_TIME):
+        if key in cache:
+            cache[key] = meta.intern(cache[key])
+
+
 def bead_name_from_file_path(path):
     '''
     Parse bead name from a file path.
@@ -152,7 +383,7 @@ def bead_name_from_file_path(path):
     name_with_timestamp, ext = os.path.splitext(os.path.basename(path))
     # assert ext == '.zip'  # not enforced to allow having beads with different extensions
     name = re.sub('_[0-9]{8}(?:[tT][-+0-9]*)?$', '', name_with_timestamp)
-    return meta.BeadName(name)
+    return meta.BeadName.interned(name)
 
 
 assert 'bead-2015v3' == bead_name_from_file_path('bead-2015v3.zip')
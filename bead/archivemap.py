@@ -0,0 +1,110 @@
+'''
+Process-wide identity map of Archive objects.
+
+Within a command the same archive is looked up several times (resolving a reference,
+verifying it, scanning boxes), and every new Archive re-reads and parses its .xmeta file.
+Here archives are remembered by path, the (size, mtime_ns) of the zip file
+and the mtime_ns of its .xmeta file, so that a repeated lookup costs at most two stats,
+and a changed archive or .xmeta (e.g. a new input map) is loaded again.
+
+The map is bounded: the least recently used archives are forgotten.
+'''
+
+from collections import OrderedDict
+import threading
+from typing import Callable, Hashable, Optional, Tuple
+
+from tracelog import TRACELOG
+from .archive import Archive
+from .storage import LOCAL, Storage
+from . import tech
+
+Path = tech.fs.Path
+
+# (size, mtime_ns) of the zip file, mtime_ns of its .xmeta file (None, if it has none)
+Fingerprint = Tuple[int, int, Optional[int]]
+
+DEFAULT_MAX_SIZE = 1024
+
+
+class ArchiveMap:
+    '''
+    I remember the most recently used archives - safe to use from multiple threads.
+    '''
+
+    def __init__(self, max_size: int = DEFAULT_MAX_SIZE):
+        self.max_size = max_size
+        self._archives: 'OrderedDict[Hashable, Archive]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, load: Callable[[], Archive]) -> Archive:
+        '''
+        Archive remembered for key, or the one returned by load() - which is remembered.
+
+        Exceptions from load() are propagated, nothing is remembered for them.
+        '''
+        with self._lock:
+            archive = self._archives.get(key)
+            if archive is not None:
+                self._archives.move_to_end(key)
+                return archive
+        # loading reads files: not holding the lock
+        archive = load()
+        with self._lock:
+            archive = self._archives.setdefault(key, archive)
+            self._archives.move_to_end(key)
+            while len(self._archives) > self.max_size:
+                forgotten, _ = self._archives.popitem(last=False)
+                TRACELOG(f'forget {forgotten}')
+        return archive
+
+    def clear(self):
+        with self._lock:
+            self._archives.clear()
+
+    def __len__(self):
+        return len(self._archives)
+
+
+_ARCHIVES = ArchiveMap()
+
+
+def get_archive(
+    path: Path,
+    box_name: str = '',
+    storage: Storage = LOCAL,
+    fingerprint: Optional[Fingerprint] = None,
+    load: Optional[Callable[[], Archive]] = None,
+) -> Archive:
+    '''
+    The Archive for the zip file at path - shared within the process.
+
+    fingerprint is the (size, mtime_ns, .xmeta mtime_ns) of the file, when already known -
+    otherwise the files are stat-ed.
+    load() creates the archive, when it is not known - by default from the file and its .xmeta.
+
+    raises InvalidArchive, or FileNotFoundError for a missing file
+    '''
+    if fingerprint is None:
+        fingerprint = _fingerprint_of(storage, Path(path))
+    if load is None:
+        def load():
+            return Archive(path, box_name, storage=storage)
+    key = (storage, Path(path), box_name, *fingerprint)
+    return _ARCHIVES.get(key, load)
+
+
+def _fingerprint_of(storage: Storage, path: Path) -> Fingerprint:
+    stat = storage.stat(path)
+    try:
+        xmeta_mtime_ns: Optional[int] = storage.stat(path.with_suffix('.xmeta')).mtime_ns
+    except FileNotFoundError:
+        xmeta_mtime_ns = None
+    return stat.size, stat.mtime_ns, xmeta_mtime_ns
+
+
+def clear():
+    '''
+    Forget all archives - e.g. after their metadata was changed by other means.
+    '''
+    _ARCHIVES.clear()
@@ -17,6 +17,9 @@ class Bead:
     or how to find the referenced input beads (see input_map).
     '''
 
+    # subclasses are free to have slots
+    __slots__ = ()
+
     # high level view of computation
     kind: str
     # kind is deprecated. Humans naturally agree on domain specific names instead.
@@ -45,6 +48,8 @@ class UnpackableBead(Bead, metaclass=ABCMeta):
     Provide high-level access to content of a bead.
     '''
 
+    __slots__ = ()
+
     def unpack_to(self, workspace):
         self.unpack_code_to(workspace.directory)
         workspace.create_directories()
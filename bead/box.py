@@ -14,21 +14,39 @@ Boxes can be used to:
   (this is naive access control, but could work)
 '''
 
+import contextlib
 from datetime import datetime, timedelta
+import fnmatch
+import itertools
 import os
-from typing import Iterator, Iterable, Sequence
-
-from .archive import Archive, InvalidArchive
+import queue
+import tempfile
+import threading
+from time import monotonic
+from typing import Callable, Dict, Iterator, Iterable, List, Optional, Sequence, Tuple, TypeVar
+
+from tracelog import TRACELOG
+from .archive import Archive
+from .boxfeed import Changes, FeedToken
+from .boxfilter import BoxFilter, directory_state
+from . import boxfeed
+from .boxindex import BOOKKEEPING_PREFIX, BoxIndex
 from .exceptions import BoxError
+from .meta import BeadName
+from .storage import LOCAL, Storage, copy_between
 from . import spec as bead_spec
-from .tech.timestamp import time_from_timestamp
+from .tech.timestamp import (
+    microseconds_from_time, microseconds_from_timestamp, time_from_timestamp)
+from .timeline import Timeline
 from .import tech
 Path = tech.fs.Path
 
+T = TypeVar('T')
+
 
-# private and specific to Box implementation, when Box gains more power,
-# it should change how it handles queries (e.g. using BEAD_NAME, KIND,
-# or CONTENT_ID directly through an index)
+# private and specific to Box implementation: queries are answered from
+# the box index (see boxindex.py), which knows BEAD_NAME, KIND, and CONTENT_ID
+# without opening the archives, the conditions are just filters over it
 
 
 def _make_checkers():
@@ -71,6 +89,25 @@ def compile_conditions(conditions):
     return match
 
 
+def _archive_file_name_glob(bead_name):
+    # beadname_20170615T075813302092+0200.zip
+    return bead_name + '_????????T????????????[-+]????.zip'
+
+
+# presence of this file in the box directory means sharded layout:
+# archives are stored in sub-directories named after the bead
+SHARDED_MARKER = '.bead-sharded'
+SHARDED_MARKER_CONTENT = '''\
+Archives in this box are stored in sub-directories named after the bead.
+'''
+
+
+class _FileNamesDisagree(Exception):
+    '''
+    Archive file names do not follow the freeze times of the archives.
+    '''
+
+
 ARCHIVE_COMMENT = '''
 This file is a BEAD zip archive.
 
@@ -103,31 +140,121 @@ class Box:
     Store Beads.
     """
 
-    def __init__(self, name: str, location: Path):
+    def __init__(self, name: str, location: Path, storage: Storage = LOCAL):
         self.location = location
         self.name = name
+        # where the files of the box are (see storage.py)
+        self.storage = storage
+        self._indexes: Dict[Path, BoxIndex] = {}
+        self._filter: Optional[BoxFilter] = None
+        # an outdated filter is rebuilt by the first query needing it - not by every one
+        self._filter_rebuilt = False
+        # bead name -> (states of its directories, timeline)
+        self._timelines: Dict[str, Tuple[tuple, Timeline]] = {}
 
     @property
     def directory(self):
         '''
-        Location as a Path.
+        Location as a Path - in the box storage.
+        '''
+        return self.storage.path(self.location)
 
-        Valid only for local boxes.
+    @property
+    def index(self) -> BoxIndex:
+        '''
+        Metadata index of the archives in the box directory (not in shards).
         '''
-        return Path(self.location)
+        return self._index_for(self.directory)
+
+    def _index_for(self, directory: Path) -> BoxIndex:
+        try:
+            return self._indexes[directory]
+        except KeyError:
+            # atomic: threads racing here get the same index
+            return self._indexes.setdefault(directory, BoxIndex(directory, self.storage))
+
+    @property
+    def is_sharded(self) -> bool:
+        '''
+        Are archives stored in per bead name sub-directories?
+
+        Archives directly in the box directory are found in sharded boxes as well.
+        '''
+        return self.storage.exists(self.directory / SHARDED_MARKER)
+
+    def indexes(self, bead_name=None) -> List[BoxIndex]:
+        '''
+        Indexes for all directories possibly having archives [named bead_name].
+        '''
+        indexes = [self.index]
+        if self.is_sharded:
+            if bead_name is not None:
+                # do not let malformed names point outside of the box
+                shard_names = [bead_name] if BeadName.is_wellformed(bead_name) else []
+            else:
+                shard_names = self.storage.list_directories(self.directory)
+            for shard_name in shard_names:
+                shard = self.directory / shard_name
+                if self.storage.is_directory(shard):
+                    indexes.append(self._index_for(shard))
+        return indexes
+
+    @property
+    def filter(self) -> BoxFilter:
+        '''
+        Membership filter of bead names and content_ids (see boxfilter.py).
+        '''
+        if self._filter is None:
+            self._filter = BoxFilter(self.directory, self.storage)
+        return self._filter
+
+    def may_contain(self, name, content_id=None) -> bool:
+        '''
+        False, if there is surely no bead in the box with name [and complete content_id].
+        '''
+        may_contain = self.filter.may_contain(name, content_id)
+        if self.filter.outdated and not self._filter_rebuilt:
+            self._filter_rebuilt = True
+            self.rebuild_filter()
+            may_contain = self.filter.may_contain(name, content_id)
+        return may_contain
+
+    def rebuild_filter(self):
+        self.filter.touch()
+        indexes = self.indexes()
+        states = {
+            self._relpath(index.directory):
+                directory_state(index.directory, self.storage, settled=True)
+            for index in indexes}
+        beads = list(itertools.chain.from_iterable(
+            index.archives(self.name) for index in indexes))
+        self.filter.rebuild(states, beads)
+
+    def _relpath(self, directory: Path) -> str:
+        return '' if directory == self.directory else directory.name
+
+    def _update_filter(self, directory: Path, bead):
+        new_entries = {self._relpath(directory): [bead.archive_path.name]}
+        if directory != self.directory and directory.name not in self.filter.directories:
+            # new shard
+            new_entries[''] = [directory.name]
+        # otherwise the filter is left outdated: a save must not rescan the box
+        self.filter.add(bead, new_entries)
 
     def find_bead(self, name, content_id):
         query = ((bead_spec.BEAD_NAME, name), (bead_spec.CONTENT_ID, content_id))
         for bead in self._beads(query):
             return bead
 
-    def all_beads(self) -> Iterator[Archive]:
+    def all_beads(self, workers: int = 1) -> Iterator[Archive]:
         '''
         Iterator for all beads in this Box
+
+        Archives not yet in the index are loaded by `workers` threads, when it is > 1.
         '''
-        return iter(self._beads([]))
+        return iter(self._beads([], workers))
 
-    def _beads(self, conditions) -> Iterable[Archive]:
+    def _beads(self, conditions, workers: int = 1) -> Iterable[Archive]:
         '''
         Retrieve matching beads.
         '''
@@ -141,36 +268,97 @@ class Box:
             if len(bead_names) > 1:
                 # easy path: names disagree
                 return []
-            # beadname_20170615T075813302092+0200.zip
-            glob = bead_names.pop() + '_????????T????????????[-+]????.zip'
+            bead_name = bead_names.pop()
+            glob = _archive_file_name_glob(bead_name)
         else:
+            bead_name = None
             glob = '*'
 
-        paths = self.directory.glob(glob)
-        beads = self._archives_from(paths)
+        beads = itertools.chain.from_iterable(
+            index.archives(self.name, glob, workers)
+            for index in self.indexes(bead_name))
         candidates = (bead for bead in beads if match(bead))
         return candidates
 
-    def _archives_from(self, paths: Iterable[Path]):
-        for path in paths:
-            try:
-                archive = Archive(path, self.name)
-            except InvalidArchive:
-                # TODO: log/report problem
-                pass
-            else:
-                yield archive
-
     def store(self, workspace, freeze_time):
         # -> Bead
-        if not self.directory.exists():
+        directory = self.archive_directory(workspace.name)
+        zipfilename = directory / f'{workspace.name}_{freeze_time}.zip'
+        # readers must never see a partially written archive:
+        # write under a name they ignore, then publish it in one step
+        temp_path = directory / (
+            f'{BOOKKEEPING_PREFIX}store.{os.getpid()}.{threading.get_ident()}.{zipfilename.name}')
+        try:
+            self._pack(workspace, temp_path, freeze_time)
+            self.add_archive(temp_path, zipfilename.name)
+        finally:
+            if self.storage.exists(temp_path):
+                self.storage.remove(temp_path)
+        return zipfilename
+
+    def _pack(self, workspace, temp_path: Path, freeze_time):
+        if self.storage is LOCAL:
+            workspace.pack(temp_path, freeze_time=freeze_time, comment=ARCHIVE_COMMENT)
+            return
+        # archives are created locally
+        with tempfile.TemporaryDirectory() as local_directory:
+            local_path = Path(local_directory) / temp_path.name
+            workspace.pack(local_path, freeze_time=freeze_time, comment=ARCHIVE_COMMENT)
+            copy_between(LOCAL, local_path, self.storage, temp_path)
+
+    def archive_directory(self, bead_name: str) -> Path:
+        '''
+        Directory to store the archives of bead_name in - created, if needed.
+        '''
+        if not self.storage.exists(self.directory):
             raise BoxError(f'Box "{self.name}": directory {self.directory} does not exist')
-        if not self.directory.is_dir():
+        if not self.storage.is_directory(self.directory):
             raise BoxError(f'Box "{self.name}": {self.directory} is not a directory')
-        zipfilename = (
-            self.directory / f'{workspace.name}_{freeze_time}.zip')
-        workspace.pack(zipfilename, freeze_time=freeze_time, comment=ARCHIVE_COMMENT)
-        return zipfilename
+        directory = self.directory
+        if self.is_sharded:
+            directory = directory / bead_name
+            self.storage.make_directory(directory)
+        return directory
+
+    def add_archive(self, temp_path: Path, file_name: str) -> Optional[Archive]:
+        '''
+        Publish a completely written archive under its final name.
+
+        temp_path must be in the archive directory, with a name starting with BOOKKEEPING_PREFIX,
+        so that it is ignored until published.
+        -> the published archive (None, if it is not valid)
+        '''
+        directory = temp_path.parent
+        try:
+            # never overwriting
+            self.storage.publish(temp_path, directory / file_name)
+        except FileExistsError:
+            raise BoxError(f'Archive {directory / file_name} already exists')
+        bead = self._index_for(directory).get_archive(file_name, self.name)
+        if bead is not None:
+            self._update_filter(directory, bead)
+        return bead
+
+    def shard(self):
+        '''
+        Switch to the sharded layout, moving archives into per bead name directories.
+
+        Can be repeated, e.g. to move archives copied directly into the box directory.
+        -> number of archives moved
+        '''
+        self.storage.write_bytes(
+            self.directory / SHARDED_MARKER, SHARDED_MARKER_CONTENT.encode('utf-8'))
+        moved = 0
+        for bead in list(self.index.archives(self.name)):
+            file_name = bead.archive_path.name
+            if not fnmatch.fnmatchcase(file_name, _archive_file_name_glob(bead.name)):
+                # not found by name anyway
+                continue
+            shard = self.directory / bead.name
+            self.storage.make_directory(shard)
+            self.index.move(file_name, self._index_for(shard))
+            moved += 1
+        return moved
 
     def find_names(self, kind, content_id, timestamp):
         '''
@@ -182,12 +370,7 @@ class Box:
             names                  = sequence of names (kind matched)
         '''
         assert isinstance(timestamp, datetime)
-        try:
-            filenames = os.listdir(self.directory)
-        except FileNotFoundError:
-            filenames = []
-        paths = (self.directory / fname for fname in filenames)
-        beads = self._archives_from(paths)
+        beads = self._beads([])
         candidates = (bead for bead in beads if bead.kind == kind)
 
         exact_match            = None
@@ -222,81 +405,346 @@ class Box:
     def get_context(self, check_type, check_param, time):
         # in theory timestamps can be [intentionally] duplicated, but let's
         # treat that as an error condition to be fixed ASAP
+        if check_type == bead_spec.BEAD_NAME:
+            try:
+                return self._get_context_by_file_names(check_param, time)
+            except _FileNamesDisagree:
+                return self._timeline(check_param).context(time)
         conditions = [(check_type, check_param)]
         return make_context(time, self._beads(conditions))
 
+    def consumers(self, content_id=None, bead_name=None) -> List[Archive]:
+        '''
+        Beads having an input with content_id [and] from bead_name.
+
+        Answered from the box indexes, archives are not opened.
+        '''
+        return [
+            bead
+            for index in self.indexes()
+            for bead in index.consumers(self.name, content_id, bead_name)]
+
+    def timeline(self, name) -> Timeline:
+        '''
+        All versions of bead name in the box, ordered by freeze time.
+
+        The timeline is shared by the calls - it must not be changed.
+        '''
+        return self._timeline(name)
+
+    def _timeline(self, name) -> Timeline:
+        '''
+        Timeline of name, rebuilt only when a directory having its archives has changed.
+        '''
+        state = tuple(
+            directory_state(index.directory, self.storage) for index in self.indexes(name))
+        cached = self._timelines.get(name)
+        if cached is not None and cached[0] == state:
+            return cached[1]
+        timeline = Timeline(self._beads([(bead_spec.BEAD_NAME, name)]))
+        self._timelines[name] = (state, timeline)
+        return timeline
+
+    def changes(self, since: Optional[FeedToken] = None) -> Changes:
+        '''
+        Archives added to and removed from the box since token `since` (see boxfeed.py).
+
+        Pass changes.token to the next call - with no token all archives are added.
+        Only changed directories are listed, and only added archives are opened.
+        '''
+        return boxfeed.changes(self.indexes(), self.name, since)
+
+    def _get_context_by_file_names(self, name, time):
+        '''
+        Find context using the freeze times encoded in the archive file names.
+
+        Only the nearest candidates are opened - to confirm the file name.
+        '''
+        candidates = []
+        for index in self.indexes(name):
+            for file_name in index.file_names(_archive_file_name_glob(name)):
+                try:
+                    file_time = microseconds_from_timestamp(file_name[len(name) + 1:-len('.zip')])
+                except ValueError:
+                    raise _FileNamesDisagree(file_name)
+                candidates.append((file_time, file_name, index))
+        candidates.sort(key=lambda candidate: candidate[:2])
+
+        def first_valid(candidates):
+            for file_time, file_name, index in candidates:
+                bead = index.get_archive(file_name, self.name)
+                if bead is None:
+                    # invalid or deleted since listed
+                    continue
+                if microseconds_from_timestamp(bead.freeze_time_str) != file_time:
+                    raise _FileNamesDisagree(file_name)
+                return bead
+
+        microseconds = microseconds_from_time(time)
+        prev = first_valid(reversed([c for c in candidates if c[0] < microseconds]))
+        match = first_valid(c for c in candidates if c[0] == microseconds)
+        next = first_valid(c for c in candidates if c[0] > microseconds)
+        return make_context(time, (bead for bead in (prev, match, next) if bead))
+
 
 class UnionBox:
-    def __init__(self, boxes: Sequence[Box]):
+    '''
+    Boxes queried together.
+
+    Boxes are queried concurrently, so a slow box (e.g. on a hung network mount)
+    does not delay the answers of the others:
+    exact matches are returned as soon as any box has one, and boxes not answering
+    (or not producing their next item) within `timeout` seconds are left out of the answer
+    and reported to `on_slow_box`.
+    '''
+
+    def __init__(
+        self,
+        boxes: Sequence[Box],
+        timeout: Optional[float] = None,
+        on_slow_box: Optional[Callable[[Box], None]] = None,
+    ):
         self.boxes = tuple(boxes)
+        self.timeout = timeout
+        self.on_slow_box = on_slow_box
+
+    def _fan_out(self, query: Callable[[Box], T]) -> Iterator[T]:
+        '''
+        Run query on all boxes concurrently, yield results in order of completion.
+
+        Boxes raising LookupError are skipped.
+        '''
+        return self._stream_out(lambda box: (query(box),))
+
+    def _stream_out(self, stream: Callable[[Box], Iterable[T]]) -> Iterator[T]:
+        '''
+        Iterate stream of all boxes concurrently, yield items as they are produced.
+
+        Boxes raising LookupError are skipped.
+        '''
+        if len(self.boxes) <= 1 and self.timeout is None:
+            yield from _stream_serially(self.boxes, stream)
+            return
+
+        # set when we are done - answered early, timed out or failed
+        cancel = threading.Event()
+        items = _stream_concurrently(self.boxes, stream, cancel)
+        # a box has timeout for its first item and then for each next one,
+        # the time spent by our consumer is not counted against the boxes
+        deadlines = _Deadlines(self.boxes, self.timeout)
+        try:
+            while deadlines:
+                try:
+                    box, item, error = items.get(timeout=deadlines.time_left())
+                except queue.Empty:
+                    for box in deadlines.expired():
+                        self._report_slow_box(box)
+                    continue
+                if box not in deadlines:
+                    # reported as slow already
+                    continue
+                if error is None:
+                    deadlines.restart(box)
+                    with deadlines.paused():
+                        yield item
+                    continue
+                deadlines.remove(box)
+                if not isinstance(error, (_StreamEnd, LookupError)):
+                    raise error
+        finally:
+            cancel.set()
+
+    def _report_slow_box(self, box):
+        TRACELOG(f'box {box.name} did not answer in {self.timeout}s')
+        if self.on_slow_box is not None:
+            self.on_slow_box(box)
+
+    def find_bead(self, name, content_id):
+        # content_id is matched as a prefix, the filter knows only complete ones
+        complete_content_id = (
+            content_id if len(content_id) == tech.securehash.HEXDIGEST_LENGTH else None)
+
+        def find(box):
+            if box.may_contain(name, complete_content_id):
+                return box.find_bead(name, content_id)
+
+        for bead in self._fan_out(find):
+            if bead:
+                return bead
 
     def get_context(self, check_type, check_param, time):
+        def get_context(box):
+            if check_type == bead_spec.BEAD_NAME and not box.may_contain(check_param):
+                raise LookupError
+            return box.get_context(check_type, check_param, time)
+
         context = None
-        for box in self.boxes:
-            try:
-                box_context = box.get_context(check_type, check_param, time)
-            except LookupError:
-                continue
-            else:
-                context = merge_contexts(box_context, context)
+        for box_context in self._fan_out(get_context):
+            context = merge_contexts(box_context, context)
 
         if context:
             return context
         raise LookupError
 
+    def timeline(self, name) -> Timeline:
+        '''
+        All versions of bead name in all boxes, ordered by freeze time.
+        '''
+        def timeline(box):
+            if box.may_contain(name):
+                return box.timeline(name)
+            return Timeline()
+
+        merged = Timeline()
+        for box_timeline in self._fan_out(timeline):
+            merged = merged.merge(box_timeline)
+        return merged
+
+    def consumers(self, content_id=None, bead_name=None) -> List[Archive]:
+        '''
+        Beads in all boxes having an input with content_id [and] from bead_name.
+        '''
+        return [
+            bead
+            for beads in self._fan_out(lambda box: box.consumers(content_id, bead_name))
+            for bead in beads]
+
     def get_at(self, check_type, check_param, time):
         context = self.get_context(check_type, check_param, time)
         return context.best
 
-    def all_beads(self) -> Iterator[Archive]:
+    def all_beads(self, workers: int = 1) -> Iterator[Archive]:
         '''
         Iterator for all beads in this Box
+
+        See Box.all_beads for `workers`.
         '''
-        for box in self.boxes:
-            yield from box.all_beads()
+        return self._stream_out(lambda box: box.all_beads(workers))
 
 
-class BeadContext:
-    def __init__(self, time, bead, prev, next):
-        assert bead is None or bead.freeze_time == time
-        assert prev is None or prev.freeze_time < time
-        assert next is None or next.freeze_time > time
-        assert bead or prev or next
-        self.time = time
-        self.bead = bead
-        self.prev = prev
-        self.next = next
+# items a box streams ahead of the consumer of a UnionBox query
+STREAM_BUFFER_SIZE = 64
+# seconds a box waiting for the consumer goes without checking for cancellation
+STREAM_CANCEL_POLL_INTERVAL = 0.1
 
-    @property
-    def best(self):
-        if self.bead:
-            return self.bead
-        if not self.prev:
-            return self.next
-        if not self.next:
-            return self.prev
-        if self.time - self.prev.freeze_time < self.next.freeze_time - self.time:
-            return self.prev
-        return self.next
+
+class _StreamEnd(Exception):
+    '''
+    Marks the end of the items of a box.
+    '''
+
+
+def _stream_serially(boxes, stream):
+    for box in boxes:
+        try:
+            yield from stream(box)
+        except LookupError:
+            pass
+
+
+class _Deadlines:
+    '''
+    Deadlines of the boxes still streaming - none, when timeout is None.
+    '''
+
+    def __init__(self, boxes: Sequence[Box], timeout: Optional[float]):
+        self.timeout = timeout
+        self._deadlines: Dict[Box, float] = {}
+        for box in boxes:
+            self.restart(box)
+
+    def __bool__(self):
+        return bool(self._deadlines)
+
+    def __contains__(self, box):
+        return box in self._deadlines
+
+    def restart(self, box: Box):
+        self._deadlines[box] = monotonic() + (self.timeout or 0)
+
+    def remove(self, box: Box):
+        del self._deadlines[box]
+
+    def time_left(self) -> Optional[float]:
+        '''
+        Seconds until the nearest deadline.
+        '''
+        if self.timeout is None:
+            return None
+        return max(0, min(self._deadlines.values()) - monotonic())
+
+    def expired(self) -> List[Box]:
+        '''
+        Remove and return the boxes past their deadline.
+        '''
+        now = monotonic()
+        expired = [box for box, deadline in self._deadlines.items() if deadline <= now]
+        for box in expired:
+            self.remove(box)
+        return expired
+
+    @contextlib.contextmanager
+    def paused(self):
+        '''
+        The time spent in the block is added to all deadlines.
+        '''
+        start = monotonic()
+        try:
+            yield
+        finally:
+            pause = monotonic() - start
+            for box in self._deadlines:
+                self._deadlines[box] += pause
+
+
+def _stream_concurrently(boxes, stream, cancel: threading.Event) -> queue.Queue:
+    '''
+    Start stream on all boxes -> queue of (box, item, exception)-s as they are produced.
+
+    The last entry of a box has an exception: _StreamEnd, if all its items are produced.
+    Boxes stop streaming between items, when cancel is set.
+    '''
+    # bounded: boxes produce at most a few items ahead of the consumer
+    items: queue.Queue = queue.Queue(maxsize=STREAM_BUFFER_SIZE * max(1, len(boxes)))
+    put = _cancellable_put(items, cancel)
+    # daemon threads: a hung box must not prevent exiting
+    for box in boxes:
+        threading.Thread(
+            target=_stream_box, args=(box, stream, put), name=f'box {box.name}', daemon=True,
+        ).start()
+    return items
+
+
+def _cancellable_put(items: queue.Queue, cancel: threading.Event) -> Callable[[tuple], bool]:
+    '''
+    -> put(entry), waiting for room in items -> False, if cancel is set before there is room
+    '''
+    def put(entry):
+        while not cancel.is_set():
+            try:
+                items.put(entry, timeout=STREAM_CANCEL_POLL_INTERVAL)
+                return True
+            except queue.Full:
+                pass
+        return False
+    return put
+
+
+def _stream_box(box, stream, put: Callable[[tuple], bool]):
+    '''
+    Put the (box, item, exception)-s of stream(box), until put refuses one.
+    '''
+    try:
+        for item in stream(box):
+            if not put((box, item, None)):
+                return
+        put((box, None, _StreamEnd()))
+    except BaseException as e:
+        put((box, None, e))
 
 
 def make_context(time, beads):
-    match, prev, next = None, None, None
-    for bead in beads:
-        if bead.freeze_time < time:
-            if prev is None or prev.freeze_time < bead.freeze_time:
-                prev = bead
-        elif bead.freeze_time > time:
-            if next is None or bead.freeze_time < next.freeze_time:
-                next = bead
-        else:
-            assert bead.freeze_time == time
-            assert match is None or match.content_id == bead.content_id, (
-                'multiple beads with same freeze time')
-            match = bead
-    if match or prev or next:
-        return BeadContext(time, match, prev, next)
-    raise LookupError
+    return Timeline(beads).context(time)
 
 
 def merge_contexts(context1, context2):
@@ -0,0 +1,96 @@
+'''
+Archives added to and removed from a box since a point in time - without rescanning it.
+
+A FeedToken remembers the archive file names and modification time of every box directory.
+Directories with unchanged modification time are not listed again,
+changed ones are listed and compared to the remembered names.
+
+Modification times are trusted only, when they are older than MTIME_GRANULARITY_NS:
+file systems with coarse timestamps can change a directory twice
+within the same timestamp, so a recent one says nothing about later changes.
+'''
+
+import time
+from typing import Dict, FrozenSet, Iterable, List, Optional
+
+import attr
+
+from .archive import Archive
+from .boxindex import BoxIndex
+from . import tech
+
+Path = tech.fs.Path
+
+
+MTIME_GRANULARITY_NS = 2 * 10**9
+
+
+@attr.s(frozen=True, auto_attribs=True)
+class _DirectoryState:
+    # None: must be listed next time
+    mtime_ns: Optional[int]
+    file_names: FrozenSet[str]
+
+
+@attr.s(frozen=True, auto_attribs=True)
+class FeedToken:
+    '''
+    Opaque state of a box - changes are reported relative to it.
+    '''
+    directories: Dict[Path, _DirectoryState] = attr.Factory(dict)
+
+
+@attr.s(frozen=True, auto_attribs=True)
+class Changes:
+    added: List[Archive]
+    # archive paths
+    removed: List[Path]
+    # for the next query
+    token: FeedToken
+
+    def __bool__(self):
+        return bool(self.added or self.removed)
+
+
+def changes(indexes: Iterable[BoxIndex], box_name: str, since: Optional[FeedToken]) -> Changes:
+    '''
+    Archives added to and removed from the directories of indexes since token.
+
+    With no token, all archives are added.
+    Invalid archives (e.g. ones being copied) are reported, when they become valid.
+    '''
+    now_ns = time.time_ns()
+    previous_states = since.directories if since is not None else {}
+    states: Dict[Path, _DirectoryState] = {}
+    added: List[Archive] = []
+    removed: List[Path] = []
+    for index in indexes:
+        directory = index.directory
+        previous = previous_states.get(directory, _DirectoryState(None, frozenset()))
+        try:
+            # stat first: a change after it will make the state outdated
+            stat_mtime_ns = index.storage.stat(directory).mtime_ns
+        except FileNotFoundError:
+            continue
+        # None: too recent to prove later changes
+        mtime_ns = stat_mtime_ns if now_ns - stat_mtime_ns >= MTIME_GRANULARITY_NS else None
+        if mtime_ns is not None and mtime_ns == previous.mtime_ns:
+            states[directory] = previous
+            continue
+        file_names = set(index.file_names('*.zip'))
+        for file_name in sorted(file_names - previous.file_names):
+            bead = index.get_archive(file_name, box_name)
+            if bead is not None:
+                added.append(bead)
+            else:
+                # completing it will not change the directory: look again next time
+                file_names.remove(file_name)
+                mtime_ns = None
+        removed.extend(
+            directory / file_name for file_name in sorted(previous.file_names - file_names))
+        states[directory] = _DirectoryState(mtime_ns, frozenset(file_names))
+
+    for directory, previous in previous_states.items():
+        if directory not in states:
+            removed.extend(directory / file_name for file_name in sorted(previous.file_names))
+    return Changes(added, removed, FeedToken(states))
@@ -0,0 +1,245 @@
+'''
+Persisted membership filter of the bead names and content_ids in a box.
+
+UnionBox asks every box for a bead, even though most boxes can not have it.
+With the filter, a box can answer "definitely not here" after a stat or two,
+without listing its (possibly huge, possibly remote) directories.
+
+The filter describes the directories as they were when it was written:
+for each directory it records the modification time and a digest of the entry names.
+The filter is trusted only while the directories are unchanged, so it has no
+false negatives - otherwise the box is searched as usual.
+A recent modification time proves nothing (see boxfeed.MTIME_GRANULARITY_NS),
+such directories are listed and compared by their names.
+
+Storing a bead updates the filter incrementally, when the directory listing proves,
+that nothing else has changed since the filter was written, otherwise it is left outdated
+(and rebuilt by the first query of the box needing it - see Box.may_contain).
+
+The filter file is rewritten in place (truncated), as replacing it would change the
+modification time of the directory it describes.
+A torn read makes it unusable (malformed), not wrong.
+'''
+
+import functools
+import hashlib
+import threading
+import time
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+
+from tracelog import TRACELOG
+from .boxfeed import MTIME_GRANULARITY_NS
+from .boxindex import BOOKKEEPING_PREFIX
+from .storage import LOCAL, Storage
+from . import tech
+
+persistence = tech.persistence
+BloomFilter = tech.bloomfilter.BloomFilter
+Path = tech.fs.Path
+
+
+FILTER_FILE_NAME = BOOKKEEPING_PREFIX + 'filter'
+
+# there is room for growth, before the filter needs to be rebuilt
+MIN_CAPACITY = 1024
+CAPACITY_FACTOR = 2
+
+# (mtime_ns, names digest), mtime_ns is None when it was too recent to be trusted
+DirectoryState = Tuple[Optional[int], int]
+
+# filter keys
+DIRECTORIES = 'directories'
+BLOOM = 'bloom'
+
+
+def _name_item(name):
+    return f'name:{name}'
+
+
+def _content_id_item(content_id):
+    return f'content_id:{content_id}'
+
+
+def _name_hash(name: str) -> int:
+    digest = hashlib.blake2b(name.encode('utf-8', 'surrogateescape'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little')
+
+
+def names_digest(names: Iterable[str]) -> int:
+    '''
+    Order independent digest of directory entry names, ignoring bead's own bookkeeping files
+    (like the index, or archives being stored).
+    '''
+    digest = 0
+    for name in names:
+        if not name.startswith(BOOKKEEPING_PREFIX):
+            digest ^= _name_hash(name)
+    return digest
+
+
+def directory_state(
+    directory: Path, storage: Storage = LOCAL, settled: bool = False,
+) -> Optional[DirectoryState]:
+    '''
+    With settled, a modification time too recent to prove later changes is dropped.
+    '''
+    now_ns = time.time_ns()
+    try:
+        # stat first: a change after it will make the state outdated
+        mtime_ns = storage.stat(directory).mtime_ns
+    except FileNotFoundError:
+        return None
+    names = list(storage.list_files(directory, stat=False)) + storage.list_directories(directory)
+    if settled and now_ns - mtime_ns < MTIME_GRANULARITY_NS:
+        return None, names_digest(names)
+    return mtime_ns, names_digest(names)
+
+
+def _locked(method):
+    @functools.wraps(method)
+    def locked(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return locked
+
+
+class BoxFilter:
+    '''
+    I know which bead names and content_ids are surely missing from a box.
+
+    Directories are identified by their path relative to the box directory.
+    '''
+
+    def __init__(self, directory: Path, storage: Storage = LOCAL):
+        self.directory = Path(directory)
+        self.storage = storage
+        self.bloom: Optional[BloomFilter] = None
+        self.directories: Dict[str, DirectoryState] = {}
+        # the last may_contain could not use the filter (missing, or directories changed)
+        self.outdated = False
+        self._loaded = False
+        # the filter is shared by threads (UnionBox, the asyncio API)
+        self._lock = threading.RLock()
+
+    @property
+    def path(self) -> Path:
+        return self.directory / FILTER_FILE_NAME
+
+    def load(self):
+        self.bloom = None
+        self.directories = {}
+        try:
+            content = persistence.loads(self.storage.read_bytes(self.path).decode('utf-8'))
+            self.directories = {
+                relpath: tuple(state) for relpath, state in content[DIRECTORIES].items()}
+            self.bloom = BloomFilter.from_dict(content[BLOOM])
+        except FileNotFoundError:
+            pass
+        except (persistence.ReadError, LookupError, TypeError, ValueError):
+            TRACELOG(f'Ignoring malformed box filter {self.path}')
+            self.directories = {}
+        self._loaded = True
+
+    def _is_unchanged(self, relpath: str) -> bool:
+        mtime_ns, digest = self.directories[relpath]
+        try:
+            if self.storage.stat(self.directory / relpath).mtime_ns == mtime_ns:
+                return True
+        except FileNotFoundError:
+            return False
+        # bookkeeping files (index, temporary files) also touch the directory
+        state = directory_state(self.directory / relpath, self.storage, settled=True)
+        if state is None or state[1] != digest:
+            return False
+        if state != self.directories[relpath]:
+            self.directories[relpath] = state
+            self.save()
+        return True
+
+    @_locked
+    def may_contain(self, name: str, content_id: Optional[str] = None) -> bool:
+        '''
+        False, if there is surely no bead in the box with name [and complete content_id].
+
+        Beads with name can be only in the box directory or in the shard named after them.
+        '''
+        if not self._loaded:
+            self.load()
+        self.outdated = True
+        if self.bloom is None:
+            return True
+        relpaths = [''] + [name] * (name in self.directories)
+        if not all(self._is_unchanged(relpath) for relpath in relpaths):
+            return True
+        self.outdated = False
+        if _name_item(name) not in self.bloom:
+            return False
+        if content_id is not None and _content_id_item(content_id) not in self.bloom:
+            return False
+        return True
+
+    @_locked
+    def rebuild(self, states: Dict[str, Optional[DirectoryState]], beads: Sequence):
+        '''
+        Replace the filter with one describing beads found in directories with states.
+
+        The states must be taken (settled) before the beads are searched.
+        '''
+        bloom = BloomFilter(max(MIN_CAPACITY, CAPACITY_FACTOR * 2 * len(beads)))
+        for bead in beads:
+            bloom.add(_name_item(bead.name))
+            bloom.add(_content_id_item(bead.content_id))
+        self.bloom = bloom
+        self.directories = {
+            relpath: state for relpath, state in states.items() if state is not None}
+        self._loaded = True
+        self.save()
+
+    @_locked
+    def add(self, bead, new_entries: Dict[str, Sequence[str]]) -> bool:
+        '''
+        Add a newly stored bead incrementally.
+
+        new_entries maps directories to entry names created while storing bead.
+        Returns False, if the directories have other changes as well,
+        when the filter must be rebuilt instead.
+        '''
+        if not self._loaded:
+            self.load()
+        if self.bloom is None or self.bloom.is_full:
+            return False
+        states = {}
+        for relpath, names in new_entries.items():
+            _mtime_ns, digest = self.directories.get(relpath, (None, 0))
+            expected_digest = digest ^ names_digest(names)
+            state = directory_state(self.directory / relpath, self.storage, settled=True)
+            if state is None or state[1] != expected_digest:
+                return False
+            states[relpath] = state
+        self.bloom.add(_name_item(bead.name))
+        self.bloom.add(_content_id_item(bead.content_id))
+        self.directories.update(states)
+        self.save()
+        return True
+
+    def touch(self):
+        '''
+        Make sure the filter file exists - creating it changes the box directory.
+        '''
+        if not self.storage.exists(self.path):
+            try:
+                self.storage.write_bytes(self.path, b'')
+            except OSError as e:
+                TRACELOG(f'Can not create box filter {self.path}: {e}')
+
+    def save(self):
+        assert self.bloom is not None
+        content = {
+            DIRECTORIES: self.directories,
+            BLOOM: self.bloom.to_dict(),
+        }
+        try:
+            # truncating an existing file leaves the directory unchanged
+            self.storage.write_bytes(self.path, persistence.dumps_line(content).encode('utf-8'))
+        except OSError as e:
+            TRACELOG(f'Can not update box filter {self.path}: {e}')
@@ -0,0 +1,430 @@
+'''
+Persistent metadata index of the archives stored directly in a box directory.
+
+Opening every archive (or even just its .xmeta file) on every query is slow,
+when there are thousands of archives in a box, especially on network mounts.
+The index remembers the cached meta attributes of each archive file
+together with the file's fingerprint (size and modification time of the archive
+and of its .xmeta file), so queries are answered with a single directory listing
+and the archives are opened only when they are new or have changed.
+
+The index is an append-only file of JSON lines, one record per archive file,
+later records overriding earlier ones.
+Appending a single line is safe even with concurrent writers, and a torn,
+half written last line is ignored on reading.
+The file is compacted (rewritten) when it has too many obsolete records -
+holding a lock, that appenders also take (shared), so that no appended record is lost.
+
+The index doubles as a journal of the stored beads: storing a bead appends its
+record, and readers tail the file from where they stopped reading, so beads
+stored concurrently by other processes are known without opening them.
+
+The index is a cache: it is never trusted over the files it describes,
+a lost or damaged index only costs time.
+'''
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import fnmatch
+import os
+import threading
+import uuid
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from tracelog import TRACELOG
+from .archive import Archive, CACHE_INPUT_MAP, InvalidArchive, members_file_name
+from .archivemap import get_archive
+from .meta import INPUTS, INPUT_CONTENT_ID
+from .storage import BOOKKEEPING_PREFIX, FileStat, LOCAL, Storage
+from . import tech
+
+persistence = tech.persistence
+Path = tech.fs.Path
+
+
+INDEX_FILE_NAME = BOOKKEEPING_PREFIX + 'index'
+# appending to the index takes it shared, compacting it exclusively
+LOCK_FILE_NAME = BOOKKEEPING_PREFIX + 'index.lock'
+XMETA_SUFFIX = '.xmeta'
+
+# record keys
+FILE = 'file'
+SIZE = 'size'
+MTIME_NS = 'mtime_ns'
+XMETA_MTIME_NS = 'xmeta_mtime_ns'
+META = 'meta'
+INVALID = 'invalid'
+# records are written with sorted keys
+RECORD_START = b'{"file":'
+
+# rewrite the index file, when it has more lines than this times the live records
+COMPACTION_RATIO = 2
+COMPACTION_MIN_LINES = 100
+
+Fingerprint = Tuple[int, int, Optional[int]]
+
+
+def _fingerprint_of(record) -> Fingerprint:
+    return record[SIZE], record[MTIME_NS], record[XMETA_MTIME_NS]
+
+
+class BoxIndex:
+    '''
+    I know the meta attributes of the archive files in a directory.
+    '''
+
+    def __init__(self, directory: Path, storage: Storage = LOCAL):
+        self.directory = Path(directory)
+        self.storage = storage
+        self._records: Dict[str, dict] = {}
+        # reverse dependencies: input key -> file names of archives having that input
+        self._consumers: Dict[str, Set[str]] = {}
+        self._line_count = 0
+        # tail position: which file and where the next unread record starts
+        self._file_id: Optional[Tuple[int, int]] = None
+        self._offset = 0
+        self._loaded = False
+        # the index is shared by threads (UnionBox, the asyncio API)
+        self._lock = threading.RLock()
+
+    @property
+    def path(self) -> Path:
+        return self.directory / INDEX_FILE_NAME
+
+    def load(self):
+        '''
+        Read the whole index file.
+        '''
+        self._file_id = None
+        self.refresh()
+
+    def refresh(self) -> List[dict]:
+        '''
+        Read records appended (by any process) since the last read -> the new records.
+
+        A replaced (compacted) index file is read from the beginning.
+        '''
+        with self._lock:
+            return self._refresh()
+
+    def _refresh(self) -> List[dict]:
+        try:
+            stat = self.storage.stat(self.path)
+            if stat.file_id != self._file_id or stat.size < self._offset:
+                self._records = {}
+                self._consumers = {}
+                self._line_count = 0
+                self._file_id = stat.file_id
+                self._offset = 0
+            data = self.storage.read_range(self.path, self._offset, stat.size - self._offset)
+        except FileNotFoundError:
+            data = b''
+        self._loaded = True
+        # an incomplete last line is probably being written: leave it for the next read
+        end = data.rfind(b'\n') + 1
+        self._offset += end
+        records = []
+        for line in data[:end].splitlines():
+            self._line_count += 1
+            record = self._parse(line)
+            if record is not None:
+                self._set_record(record)
+                records.append(record)
+        return records
+
+    def _parse(self, line: bytes) -> Optional[dict]:
+        try:
+            return persistence.loads(line.decode('utf-8'))
+        except (persistence.ReadError, UnicodeDecodeError, LookupError, TypeError):
+            pass
+        # a record appended after a torn line shares its line - records start with FILE
+        start = line.rfind(RECORD_START)
+        if start > 0:
+            return self._parse(line[start:])
+        TRACELOG(f'Ignoring malformed index record in {self.path}: {line!r}')
+        return None
+
+    def file_names(self, pattern: str = '*') -> List[str]:
+        '''
+        Names of files matching the glob pattern - a directory listing without stat-ing files.
+        '''
+        return [
+            file_name for file_name in self._list(stat=False)
+            if fnmatch.fnmatchcase(file_name, pattern)]
+
+    def archives(self, box_name: str, pattern: str = '*', workers: int = 1) -> Iterator[Archive]:
+        '''
+        Iterator for the valid archives with file names matching the glob pattern.
+
+        Only new or changed archive files are opened,
+        with `workers` > 1 concurrently, yielding them in order of completion.
+        '''
+        self.refresh()
+        # a full listing stats every file anyway, a narrower pattern stats only its matches
+        listing = self._list(stat=pattern == '*')
+        live_files = set()
+        changed = []
+        for file_name, stat in listing.items():
+            if file_name.endswith(XMETA_SUFFIX) or not fnmatch.fnmatchcase(file_name, pattern):
+                continue
+            if stat is None:
+                fingerprint = self._fingerprint(file_name, _xmeta_name(file_name) in listing)
+                if fingerprint is None:
+                    continue
+            else:
+                xmeta_stat = listing.get(_xmeta_name(file_name))
+                fingerprint = (
+                    stat.size,
+                    stat.mtime_ns,
+                    xmeta_stat.mtime_ns if xmeta_stat else None)
+            live_files.add(file_name)
+            record = self._fresh_record(file_name, fingerprint)
+            if record is None:
+                changed.append((file_name, fingerprint))
+            elif not record.get(INVALID):
+                yield self._archive_from(record, box_name)
+        yield from self._index_files(changed, box_name, workers)
+        if pattern == '*':
+            self._maybe_compact(live_files)
+
+    def get_archive(self, file_name: str, box_name: str = '') -> Optional[Archive]:
+        '''
+        Archive for a single file in the directory, None if it is missing or invalid.
+
+        The file is opened only if it is not yet indexed or has changed.
+        '''
+        self.refresh()
+        fingerprint = self._fingerprint(file_name)
+        if fingerprint is None:
+            return None
+        record = self._fresh_record(file_name, fingerprint)
+        if record is None:
+            for archive in self._index_files([(file_name, fingerprint)], box_name):
+                return archive
+            return None
+        if record.get(INVALID):
+            return None
+        return self._archive_from(record, box_name)
+
+    def _fingerprint(self, file_name: str, has_xmeta: bool = True) -> Optional[Fingerprint]:
+        '''
+        Fingerprint of a single file by stat-ing it (and its .xmeta), None if it is missing.
+        '''
+        path = self.directory / file_name
+        try:
+            stat = self.storage.stat(path)
+        except FileNotFoundError:
+            return None
+        xmeta_mtime_ns = None
+        if has_xmeta:
+            try:
+                xmeta_mtime_ns = self.storage.stat(_xmeta_name(path)).mtime_ns
+            except FileNotFoundError:
+                pass
+        return (stat.size, stat.mtime_ns, xmeta_mtime_ns)
+
+    def move(self, file_name: str, destination: 'BoxIndex'):
+        '''
+        Move an archive file (and its .xmeta, member table) to the directory of another index.
+
+        The index record moves with it, so the archive need not be opened again.
+        '''
+        self.storage.replace(self.directory / file_name, destination.directory / file_name)
+        for name in (_xmeta_name(file_name), members_file_name(file_name)):
+            try:
+                self.storage.replace(self.directory / name, destination.directory / name)
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            record = self._drop_record(file_name)
+        if record is not None:
+            destination._append(record)
+
+    def _archive_from(self, record, box_name) -> Archive:
+        path = self.directory / record[FILE]
+        return get_archive(
+            path, box_name, self.storage, _fingerprint_of(record),
+            load=lambda: Archive(path, box_name, cache=record[META], storage=self.storage))
+
+    def _set_record(self, record):
+        self._drop_record(record[FILE])
+        self._records[record[FILE]] = record
+        for key in _input_keys(record):
+            self._consumers.setdefault(key, set()).add(record[FILE])
+
+    def _drop_record(self, file_name) -> Optional[dict]:
+        record = self._records.pop(file_name, None)
+        if record is not None:
+            for key in _input_keys(record):
+                self._consumers[key].discard(file_name)
+        return record
+
+    def consumers(
+        self, box_name: str, content_id: Optional[str] = None, bead_name: Optional[str] = None,
+    ) -> List[Archive]:
+        '''
+        Archives having an input with content_id [and] from bead_name.
+
+        Only new archives and the matching ones are opened (or stat-ed).
+        '''
+        self.refresh()
+        file_names = set(
+            file_name for file_name in self._list(stat=False)
+            if not file_name.endswith(XMETA_SUFFIX))
+        with self._lock:
+            unknown = file_names - set(self._records)
+        for file_name in unknown:
+            self.get_archive(file_name, box_name)
+        keys = []
+        if content_id is not None:
+            keys.append(_content_id_key(content_id))
+        if bead_name is not None:
+            keys.append(_bead_name_key(bead_name))
+        with self._lock:
+            candidates = set.intersection(
+                *(self._consumers.get(key, set()) for key in keys)) if keys else set()
+        consumers = []
+        for file_name in sorted(candidates & file_names):
+            archive = self.get_archive(file_name, box_name)
+            # the archive is rechecked: it might have been replaced
+            record = self._records.get(file_name)
+            if archive is not None and record and set(keys) <= _input_keys(record):
+                consumers.append(archive)
+        return consumers
+
+    def _list(self, stat=True) -> Dict[str, Optional[FileStat]]:
+        return {
+            file_name: file_stat
+            for file_name, file_stat in self.storage.list_files(self.directory, stat).items()
+            # the index itself, its temporary files, etc.
+            if not file_name.startswith(BOOKKEEPING_PREFIX)}
+
+    def _fresh_record(self, file_name, fingerprint: Fingerprint) -> Optional[dict]:
+        record = self._records.get(file_name)
+        if record is not None and _fingerprint_of(record) == fingerprint:
+            return record
+        return None
+
+    def _index_files(self, files, box_name, workers=1) -> Iterator[Archive]:
+        '''
+        Open and index (file_name, fingerprint)-s, yield the valid archives.
+        '''
+        if workers <= 1 or len(files) <= 1:
+            results = (
+                _index_file(self.storage, self.directory, file_name, fingerprint, box_name)
+                for file_name, fingerprint in files)
+            for record, archive in results:
+                self._append(record)
+                if archive is not None:
+                    yield archive
+            return
+
+        # opening archives is mostly waiting for I/O, threads are fine
+        executor = ThreadPoolExecutor(max_workers=workers)
+        try:
+            futures = [
+                executor.submit(
+                    _index_file, self.storage, self.directory, file_name, fingerprint, box_name)
+                for file_name, fingerprint in files]
+            for future in as_completed(futures):
+                record, archive = future.result()
+                self._append(record)
+                if archive is not None:
+                    yield archive
+        finally:
+            # the consumer might have stopped early
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    @property
+    def _lock_path(self) -> Path:
+        return self.directory / LOCK_FILE_NAME
+
+    def _append(self, record):
+        with self._lock:
+            self._set_record(record)
+        line = (persistence.dumps_line(record) + '\n').encode('utf-8')
+        try:
+            # a single append, so that concurrent writers do not mix lines,
+            # under a shared lock, so that it is not lost by a concurrent compaction
+            with self.storage.lock(self._lock_path, exclusive=False):
+                self.storage.append(self.path, line)
+        except OSError as e:
+            # read-only boxes are still usable, just slower
+            TRACELOG(f'Can not update box index {self.path}: {e}')
+
+    def _maybe_compact(self, live_files):
+        with self._lock:
+            self._compact(live_files)
+
+    def _compact(self, live_files):
+        for file_name in set(self._records) - live_files:
+            self._drop_record(file_name)
+        if self._line_count <= max(COMPACTION_MIN_LINES, COMPACTION_RATIO * len(self._records)):
+            return
+        # unique, as other BoxIndex-es (even in this process) might compact at the same time
+        temp_path = self.path.with_name(f'{INDEX_FILE_NAME}.{uuid.uuid4().hex}.tmp')
+        try:
+            # appenders are excluded: no record is lost between the read below and the replace
+            with self.storage.lock(self._lock_path):
+                # records appended by others since our last read (e.g. of new archives)
+                self._refresh()
+                self.storage.write_bytes(temp_path, ''.join(
+                    persistence.dumps_line(record) + '\n'
+                    for record in self._records.values()).encode('utf-8'))
+                self.storage.replace(temp_path, self.path)
+                stat = self.storage.stat(self.path)
+            self._line_count = len(self._records)
+            self._file_id, self._offset = stat.file_id, stat.size
+        except OSError as e:
+            TRACELOG(f'Can not compact box index {self.path}: {e}')
+            try:
+                self.storage.remove(temp_path)
+            except OSError:
+                pass
+
+
+def _index_file(storage, directory, file_name, fingerprint: Fingerprint, box_name):
+    '''
+    Open an archive file -> (index record, archive or None if invalid).
+
+    Safe to call from multiple threads.
+    '''
+    size, mtime_ns, xmeta_mtime_ns = fingerprint
+    record = {FILE: file_name, SIZE: size, MTIME_NS: mtime_ns, XMETA_MTIME_NS: xmeta_mtime_ns}
+    try:
+        archive = get_archive(directory / file_name, box_name, storage, fingerprint)
+        record[META] = archive.complete_cache()
+    except InvalidArchive:
+        # TODO: log/report problem
+        archive = None
+        record[INVALID] = True
+    return record, archive
+
+
+def _content_id_key(content_id):
+    return f'content_id:{content_id}'
+
+
+def _bead_name_key(bead_name):
+    return f'name:{bead_name}'
+
+
+def _input_keys(record) -> Set[str]:
+    '''
+    Keys of the inputs of an indexed archive, both by content_id and bead name.
+    '''
+    keys = set()
+    try:
+        meta = record[META]
+        input_map = meta.get(CACHE_INPUT_MAP) or {}
+        for input_nick, input_spec in meta[INPUTS].items():
+            keys.add(_content_id_key(input_spec[INPUT_CONTENT_ID]))
+            keys.add(_bead_name_key(input_map.get(input_nick, input_nick)))
+    except (LookupError, TypeError, AttributeError):
+        # invalid archive or malformed record
+        pass
+    return keys
+
+
+def _xmeta_name(file_name):
+    root, _ext = os.path.splitext(file_name)
+    return root + XMETA_SUFFIX
@@ -0,0 +1,93 @@
+'''
+Capacity and lookup cost of a box - to decide which boxes to index, shard or prune.
+'''
+
+from collections import Counter
+import time
+from typing import Dict
+
+import attr
+
+from .archive import Archive
+from .box import Box
+from .boxindex import BOOKKEEPING_PREFIX, XMETA_SUFFIX, BoxIndex
+from .exceptions import InvalidArchive
+
+
+@attr.s(auto_attribs=True)
+class BoxStats:
+    name: str
+    location: str
+    directories: int = 0
+    archives: int = 0
+    bytes: int = 0
+    without_xmeta: int = 0
+    invalid: int = 0
+    list_seconds: float = 0.0
+    # opening archives through the box index - or directly, for a cold measurement
+    open_seconds: float = 0.0
+    bytes_per_name: Dict[str, int] = attr.Factory(dict)
+    # number of versions -> number of bead names with that many versions
+    versions_per_name: Dict[int, int] = attr.Factory(dict)
+
+    def as_dict(self):
+        return attr.asdict(self)
+
+
+def box_stats(box: Box, cold: bool = False) -> BoxStats:
+    '''
+    Measure box.
+
+    With cold, all archives are opened directly, bypassing the box index,
+    which is what a lookup costs without (or with an outdated) index.
+    '''
+    stats = BoxStats(box.name, str(box.location))
+    bytes_per_name: Counter = Counter()
+    versions: Counter = Counter()
+    for index in box.indexes():
+        stats.directories += 1
+        start = time.perf_counter()
+        listing = _list(index)
+        stats.list_seconds += time.perf_counter() - start
+
+        archive_names = [name for name in listing if name.endswith('.zip')]
+        stats.archives += len(archive_names)
+        stats.bytes += sum(listing[name] for name in archive_names)
+        stats.without_xmeta += sum(
+            name[:-len('.zip')] + XMETA_SUFFIX not in listing for name in archive_names)
+
+        start = time.perf_counter()
+        if cold:
+            beads = list(_open_all(index, archive_names, box.name))
+        else:
+            beads = list(index.archives(box.name, '*.zip'))
+        stats.open_seconds += time.perf_counter() - start
+
+        stats.invalid += len(archive_names) - len(beads)
+        for bead in beads:
+            bytes_per_name[bead.name] += listing.get(bead.archive_path.name, 0)
+            versions[bead.name] += 1
+    stats.bytes_per_name = dict(bytes_per_name.most_common())
+    stats.versions_per_name = dict(sorted(Counter(versions.values()).items()))
+    return stats
+
+
+def _list(index: BoxIndex) -> Dict[str, int]:
+    '''
+    -> {file name: size}
+    '''
+    return {
+        file_name: stat.size
+        for file_name, stat in index.storage.list_files(index.directory).items()
+        if stat is not None and not file_name.startswith(BOOKKEEPING_PREFIX)}
+
+
+def _open_all(index: BoxIndex, file_names, box_name):
+    for file_name in file_names:
+        try:
+            archive = Archive(index.directory / file_name, box_name, storage=index.storage)
+            archive.content_id
+            yield archive
+        except (InvalidArchive, OSError):
+            # damaged, or deleted or unreadable since listed - counted as invalid
+            pass
@@ -0,0 +1,200 @@
+'''
+Copy beads between boxes - by (name, content_id), not by file.
+
+A bead is copied, when the destination box has no bead with the same name and content_id,
+whatever the archive file names or layouts (flat or sharded) of the boxes are.
+Queries are answered by the box indexes, so only the missing archives are read.
+
+Copies are written under temporary names ignored by readers, validated
+(all their files are hashed, see ZipArchive.validate), and published only then.
+An interrupted copy between local boxes is resumed by the next sync, from where it stopped;
+concurrent syncs of the same archive wait for each other, instead of writing the same copy.
+'''
+
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+import time
+from typing import List, Tuple
+
+import attr
+
+from tracelog import TRACELOG
+from .archive import (
+    Archive, CACHE_CONTENT_ID, CACHE_FINGERPRINT, CACHE_MEMBERS_FILE, CACHE_XMETA_VERSION,
+    XMETA_VERSION, read_xmeta, xmeta_is_fresh)
+from .box import Box
+from .boxindex import BOOKKEEPING_PREFIX
+from .exceptions import BoxError, InvalidArchive
+from .storage import LOCAL, copy_between
+from .ziparchive import ZipArchive
+from . import tech
+from . import zipopener
+
+persistence = tech.persistence
+Path = tech.fs.Path
+
+
+SYNC_PREFIX = BOOKKEEPING_PREFIX + 'sync.'
+LOCK_SUFFIX = '.lock'
+
+
+@attr.s(auto_attribs=True)
+class SyncResult:
+    copied: List[Archive] = attr.Factory(list)
+    present: int = 0
+    # (archive, reason)
+    failed: List[Tuple[Archive, str]] = attr.Factory(list)
+    bytes_copied: int = 0
+    seconds: float = 0.0
+
+    @property
+    def throughput(self) -> float:
+        '''
+        Bytes per second.
+        '''
+        return self.bytes_copied / self.seconds if self.seconds > 0 else 0.0
+
+
+def missing_beads(source: Box, destination: Box, workers: int = 1) -> Tuple[List[Archive], int]:
+    '''
+    -> (beads in source, but not in destination; number of beads already in destination)
+    '''
+    present = set(
+        (bead.name, bead.content_id) for bead in destination.all_beads(workers))
+    missing = {}
+    present_count = 0
+    for bead in source.all_beads(workers):
+        key = (bead.name, bead.content_id)
+        if key in present:
+            present_count += 1
+        elif key not in missing:
+            # the same bead might be there with multiple file names
+            missing[key] = bead
+    return list(missing.values()), present_count
+
+
+def sync(source: Box, destination: Box, workers: int = 1) -> SyncResult:
+    '''
+    Copy beads missing from destination, `workers` at a time.
+    '''
+    start = time.perf_counter()
+    missing, present = missing_beads(source, destination, workers)
+    result = SyncResult(present=present)
+
+    def copy(bead):
+        try:
+            return bead, copy_bead(bead, destination), None
+        except (OSError, BoxError, InvalidArchive) as e:
+            return bead, 0, str(e)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        for bead, bytes_copied, error in executor.map(copy, missing):
+            if error is None:
+                result.copied.append(bead)
+                result.bytes_copied += bytes_copied
+            else:
+                TRACELOG(f'sync failed {bead.archive_filename}: {error}')
+                result.failed.append((bead, error))
+    result.seconds = time.perf_counter() - start
+    return result
+
+
+def copy_bead(bead: Archive, destination: Box) -> int:
+    '''
+    Copy, validate and publish a single archive (and its .xmeta) -> bytes copied.
+    '''
+    file_name = bead.archive_path.name
+    directory = destination.archive_directory(bead.name)
+    storage = destination.storage
+    if bead.storage is LOCAL and storage is LOCAL:
+        temp_path = directory / f'{SYNC_PREFIX}{file_name}'
+        lock_path = directory / f'{SYNC_PREFIX}{file_name}{LOCK_SUFFIX}'
+        # the temp file is written (and resumed) only by the sync holding its lock
+        with storage.lock(lock_path):
+            try:
+                offset = _resumable_size(bead.archive_path, temp_path)
+                bytes_copied = tech.fs.copy_file(bead.archive_path, temp_path, offset)
+                _publish_copy(bead, destination, temp_path, file_name)
+            finally:
+                try:
+                    storage.remove(lock_path)
+                except OSError:
+                    # e.g. open files can not be removed on Windows
+                    pass
+    else:
+        # not resumed: a name of our own
+        temp_path = directory / (
+            f'{SYNC_PREFIX}{os.getpid()}.{threading.get_ident()}.{file_name}')
+        bytes_copied = copy_between(bead.storage, bead.archive_path, storage, temp_path)
+        _publish_copy(bead, destination, temp_path, file_name)
+    xmeta_path = directory / Path(file_name).with_suffix('.xmeta')
+    bytes_copied += _copy_xmeta(bead, destination, xmeta_path)
+    return bytes_copied
+
+
+def _publish_copy(bead: Archive, destination: Box, temp_path: Path, file_name: str):
+    storage = destination.storage
+    if not _is_valid_copy(bead, temp_path, storage):
+        storage.remove(temp_path)
+        raise InvalidArchive(bead.archive_filename)
+    # the .xmeta is written only for our archive: publishing fails for an existing one
+    try:
+        destination.add_archive(temp_path, file_name)
+    finally:
+        # an interrupted copy is resumed, but a rejected one is not kept
+        if storage.exists(temp_path):
+            storage.remove(temp_path)
+
+
+def _is_valid_copy(bead: Archive, path: Path, storage) -> bool:
+    try:
+        copy = ZipArchive(path, storage=storage)
+        copy.validate()
+        return copy.content_id == bead.content_id
+    except InvalidArchive:
+        return False
+    finally:
+        zipopener.close(path, storage)
+
+
+def _resumable_size(source: Path, temp_path: Path) -> int:
+    '''
+    Bytes of a previous, interrupted copy, that can be kept.
+    '''
+    try:
+        size = os.stat(temp_path).st_size
+    except FileNotFoundError:
+        return 0
+    if size > os.stat(source).st_size:
+        return 0
+    TRACELOG(f'resuming copy to {temp_path} at {size}')
+    return size
+
+
+def _copy_xmeta(bead: Archive, destination: Box, xmeta_path: Path) -> int:
+    '''
+    Copy .xmeta, if it is there and agrees with the published archive.
+
+    The fingerprint is rewritten for the copy of the archive (its modification time differs).
+    '''
+    source_path = bead.cache_path
+    try:
+        cache = read_xmeta(bead.storage, source_path)
+        fresh = cache is not None and xmeta_is_fresh(cache, bead.storage.stat(bead.archive_path))
+    except FileNotFoundError:
+        return 0
+    if cache is None or not fresh or cache.get(CACHE_CONTENT_ID) != bead.content_id:
+        TRACELOG(f'not copying disagreeing {source_path}')
+        return 0
+    if cache.get(CACHE_XMETA_VERSION) == XMETA_VERSION:
+        _size, _mtime_ns, central_directory_offset = cache[CACHE_FINGERPRINT]
+        stat = destination.storage.stat(xmeta_path.with_suffix('.zip'))
+        cache[CACHE_FINGERPRINT] = [stat.size, stat.mtime_ns, central_directory_offset]
+    # the member table is not copied
+    cache.pop(CACHE_MEMBERS_FILE, None)
+    content = persistence.dumps(cache).encode('utf-8')
+    temp_path = xmeta_path.with_name(f'{SYNC_PREFIX}{xmeta_path.name}')
+    destination.storage.write_bytes(temp_path, content)
+    destination.storage.replace(temp_path, xmeta_path)
+    return len(content)
@@ -0,0 +1,129 @@
+'''
+Write missing or stale .xmeta files for all archives of a box - in parallel.
+
+Without .xmeta files every archive must be opened (and its meta parsed) to answer queries,
+which makes boxes painfully slow, e.g. for rewiring or loading a web.
+
+An .xmeta is stale, when it was not made from the current archive file
+(see archive.xmeta_is_fresh), or is of an older version - version 1 files are
+trusted when reading, but have no fingerprint to detect a replaced archive.
+Archives are opened in worker processes, as parsing zip directories is CPU bound.
+Every .xmeta is written atomically, and the up-to-date ones are skipped,
+so an interrupted run is resumed by running it again.
+'''
+
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import os
+import time
+from typing import Callable, List, Optional, Tuple
+
+import attr
+
+from tracelog import TRACELOG
+from .archive import (
+    Archive, CACHE_INPUT_MAP, CACHE_XMETA_VERSION, XMETA_VERSION, read_xmeta, xmeta_is_fresh)
+from .box import Box
+from .boxindex import XMETA_SUFFIX
+from .exceptions import InvalidArchive
+from .storage import LOCAL, Storage
+from . import tech
+
+persistence = tech.persistence
+Path = tech.fs.Path
+
+
+@attr.s(auto_attribs=True)
+class XmetaResult:
+    written: int = 0
+    up_to_date: int = 0
+    # (archive path, reason)
+    failed: List[Tuple[Path, str]] = attr.Factory(list)
+    seconds: float = 0.0
+
+
+def stale_archives(box: Box) -> Tuple[List[Path], int]:
+    '''
+    -> (archives with missing or stale .xmeta, number of archives with up-to-date .xmeta)
+    '''
+    stale = []
+    up_to_date = 0
+    for index in box.indexes():
+        listing = box.storage.list_files(index.directory)
+        for file_name, stat in sorted(listing.items()):
+            if not file_name.endswith('.zip'):
+                continue
+            xmeta_name = file_name[:-len('.zip')] + XMETA_SUFFIX
+            xmeta_path = index.directory / xmeta_name
+            if xmeta_name in listing and _is_fresh(box.storage, xmeta_path, stat):
+                up_to_date += 1
+            else:
+                stale.append(index.directory / file_name)
+    return stale, up_to_date
+
+
+def _is_fresh(storage: Storage, xmeta_path: Path, archive_stat) -> bool:
+    try:
+        cache = read_xmeta(storage, xmeta_path)
+    except FileNotFoundError:
+        return False
+    return (
+        cache is not None
+        and cache.get(CACHE_XMETA_VERSION) == XMETA_VERSION
+        and xmeta_is_fresh(cache, archive_stat))
+
+
+def write_xmeta(storage: Storage, path: Path) -> Optional[str]:
+    '''
+    (Re)create the .xmeta of the archive at path from the archive -> error message or None
+
+    An input map set in the old .xmeta is kept.
+    '''
+    try:
+        archive = Archive(path, cache={}, storage=storage)
+        archive.complete_cache()
+        try:
+            old_cache = persistence.loads(storage.read_bytes(archive.cache_path).decode('utf-8'))
+            archive.cache[CACHE_INPUT_MAP] = old_cache[CACHE_INPUT_MAP]
+        except (FileNotFoundError, persistence.ReadError, LookupError, TypeError, ValueError):
+            pass
+        archive.save_member_table()
+        archive.save_cache()
+    except (InvalidArchive, OSError) as e:
+        return str(e) or e.__class__.__name__
+    return None
+
+
+def write_xmetas(
+    box: Box,
+    workers: Optional[int] = None,
+    on_progress: Optional[Callable[[int, int, Path, Optional[str]], None]] = None,
+) -> XmetaResult:
+    '''
+    Write the missing or stale .xmeta files of box, using `workers` processes.
+
+    on_progress(done, total, archive path, error or None) is called after each archive.
+    Boxes not in the local file system are processed in threads.
+    '''
+    start = time.perf_counter()
+    stale, up_to_date = stale_archives(box)
+    result = XmetaResult(up_to_date=up_to_date)
+    workers = workers or os.cpu_count() or 1
+    executor: Executor
+    if box.storage is LOCAL and workers > 1 and len(stale) > 1:
+        executor = ProcessPoolExecutor(max_workers=min(workers, len(stale)))
+    else:
+        executor = ThreadPoolExecutor(max_workers=max(1, min(workers, len(stale))))
+    with executor:
+        futures = {executor.submit(write_xmeta, box.storage, path): path for path in stale}
+        for done, future in enumerate(as_completed(futures), 1):
+            path = futures[future]
+            error = future.result()
+            if error is None:
+                result.written += 1
+            else:
+                TRACELOG(f'xmeta failed {path}: {error}')
+                result.failed.append((path, error))
+            if on_progress is not None:
+                on_progress(done, len(stale), path, error)
+    result.seconds = time.perf_counter() - start
+    return result
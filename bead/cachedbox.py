@@ -0,0 +1,215 @@
+'''
+Read-through local cache of archives for boxes on slow (network) mounts.
+
+Loading an input or developing a bead reads the whole archive,
+which is painful, when the box is on sshfs/NFS and the same popular beads
+are loaded again and again.
+
+A CachedBox answers queries exactly like a Box (metadata comes from the
+box index, no data is transferred for queries), but the archives it returns
+read their zip content from a local copy, which is made on first use.
+
+Local copies are named by content_id, so the same bead is cached only once,
+even if it is found in multiple boxes or under different names.
+A copy is validated (all its files are hashed, see ZipArchive.validate) before it is
+put in the cache.
+The cache is bounded in total size, least recently used archives are evicted first -
+except those in use by the archives of this process.
+
+Only the zip is cached: the metadata of the archives comes from the box
+(its index and .xmeta files) as usual.
+'''
+
+from collections import Counter
+import os
+import threading
+from typing import Iterator
+import weakref
+
+from tracelog import TRACELOG
+from .archive import Archive, CACHE_CONTENT_ID
+from .box import Box
+from .exceptions import InvalidArchive
+from .storage import LOCAL, Storage, copy_between
+from .timeline import BeadContext, Timeline
+from .ziparchive import ZipArchive
+from . import tech
+from . import zipopener
+
+Path = tech.fs.Path
+
+
+DEFAULT_MAX_SIZE = 10 * 1024 ** 3
+
+
+class ArchiveCache:
+    '''
+    I keep local copies of recently used archives in a directory.
+    '''
+
+    def __init__(self, directory: Path, max_size: int = DEFAULT_MAX_SIZE):
+        self.directory = Path(directory)
+        self.max_size = max_size
+        # local copies returned by get and not yet released -> number of users
+        self._in_use: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def _path(self, content_id: str, suffix: str) -> Path:
+        return self.directory / f'{content_id}{suffix}'
+
+    def get(self, archive: Archive) -> Path:
+        '''
+        Local path of a verified copy of archive - copying it if needed.
+
+        The copy is not evicted until it is released.
+        '''
+        content_id = archive.content_id
+        local_path = self._path(content_id, '.zip')
+        with self._lock:
+            self._in_use[local_path] += 1
+        try:
+            self._fill(archive, local_path)
+        except BaseException:
+            self.release(local_path)
+            raise
+        return local_path
+
+    def release(self, local_path: Path):
+        '''
+        The copy returned by get is not used anymore - it can be evicted.
+        '''
+        with self._lock:
+            self._in_use[local_path] -= 1
+            if not self._in_use[local_path]:
+                del self._in_use[local_path]
+
+    def _fill(self, archive: Archive, local_path: Path):
+        content_id = archive.content_id
+        try:
+            # mark as recently used
+            os.utime(local_path)
+            TRACELOG(f'cache hit {archive.archive_filename} -> {local_path}')
+            return
+        except FileNotFoundError:
+            pass
+
+        tech.fs.ensure_directory(self.directory)
+        # unique per thread: CachedBox is shared by threads (UnionBox)
+        temp_path = self._path(content_id, f'.{os.getpid()}.{threading.get_ident()}.tmp')
+        try:
+            copy_between(archive.storage, archive.archive_path, LOCAL, temp_path)
+            try:
+                copy = ZipArchive(temp_path)
+                copy.validate()
+                if copy.content_id != content_id:
+                    TRACELOG(f'cache copy {temp_path} has a different content_id')
+                    raise InvalidArchive(archive.archive_filename)
+            finally:
+                zipopener.close(temp_path)
+            os.replace(temp_path, local_path)
+        finally:
+            if temp_path.exists():
+                os.remove(temp_path)
+        TRACELOG(f'cache fill {archive.archive_filename} -> {local_path}')
+        self.evict()
+
+    def evict(self):
+        '''
+        Remove least recently used archives until the cache fits in max_size.
+
+        Copies in use (see get) are kept.
+        '''
+        archives = self._archives()
+        total_size = sum(size for _mtime, size, _path in archives)
+        with self._lock:
+            for _mtime, size, path in sorted(archives):
+                if total_size <= self.max_size:
+                    break
+                if path in self._in_use:
+                    continue
+                TRACELOG(f'cache evict {path}')
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total_size -= size
+
+    def _archives(self):
+        '''
+        -> [(mtime_ns, size, path)] of cached archives.
+        '''
+        archives = []
+        try:
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    if entry.name.endswith('.zip'):
+                        stat = entry.stat()
+                        archives.append((stat.st_mtime_ns, stat.st_size, Path(entry.path)))
+        except FileNotFoundError:
+            pass
+        return archives
+
+
+class CachedArchive(Archive):
+    '''
+    Archive with metadata from the original, but zip content from a local copy.
+    '''
+
+    def __init__(self, archive: Archive, archive_cache: ArchiveCache):
+        self.archive_cache = archive_cache
+        super().__init__(
+            archive.archive_filename, archive.box_name, cache=archive.cache,
+            storage=archive.storage)
+
+    def _open_ziparchive(self):
+        local_path = self.archive_cache.get(self)
+        # the local copy is kept while this archive can read it
+        weakref.finalize(self, self.archive_cache.release, local_path)
+        return ZipArchive(local_path, self.box_name)
+
+    @property
+    def content_id(self):
+        # the content_id is needed to find the local copy:
+        # get it from the original archive, if it is not cached
+        try:
+            return self.cache[CACHE_CONTENT_ID]
+        except LookupError:
+            content_id = ZipArchive(
+                self.archive_filename, self.box_name, self.storage).content_id
+            self.cache[CACHE_CONTENT_ID] = content_id
+            return content_id
+
+
+class CachedBox(Box):
+    '''
+    Box, that reads archive content through a local ArchiveCache.
+    '''
+
+    def __init__(
+        self, name: str, location: Path, archive_cache: ArchiveCache, storage: Storage = LOCAL
+    ):
+        super().__init__(name, location, storage)
+        self.archive_cache = archive_cache
+
+    def _cached(self, archive):
+        if archive is None:
+            return None
+        return CachedArchive(archive, self.archive_cache)
+
+    def find_bead(self, name, content_id):
+        return self._cached(super().find_bead(name, content_id))
+
+    def all_beads(self, workers: int = 1) -> Iterator[Archive]:
+        for archive in super().all_beads(workers):
+            yield self._cached(archive)
+
+    def timeline(self, name) -> Timeline:
+        return super().timeline(name).map(self._cached)
+
+    def get_context(self, check_type, check_param, time):
+        context = super().get_context(check_type, check_param, time)
+        return BeadContext(
+            context.time,
+            self._cached(context.bead),
+            self._cached(context.prev),
+            self._cached(context.next))
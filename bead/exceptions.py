@@ -1,5 +1,12 @@
 class InvalidArchive(Exception):
-    """Not a valid bead archive"""
+    """Not a valid bead archive
+
+    args are (archive filename[, name of the first bad file found])
+    """
+
+    @property
+    def bad_file(self):
+        return self.args[1] if len(self.args) > 1 else None
 
 
 class BoxError(Exception):
@@ -0,0 +1,365 @@
+'''
+Read-only boxes served over plain HTTP.
+
+Any static web server can serve a box directory, if it supports Range requests
+and the box has published listings (see write_listings).
+
+Directories are listed from their published listing file (LISTING_FILE_NAME),
+archives are read with Range requests: opening a bead reads the zip central directory
+and the members needed (e.g. only data files, when loading an input), not the whole archive.
+The box index and filter files published with the box are used as well,
+so queries need not open archives at all.
+
+Servers ignoring Range requests are detected on the first response,
+archives are downloaded whole from them afterwards - once, not for every part read.
+
+Connections are pooled and kept alive.
+'''
+
+import email.utils
+import http.client
+import io
+import posixpath
+import threading
+import time
+import weakref
+from typing import Dict, List, Optional, Tuple, Type
+import urllib.parse
+
+from tracelog import TRACELOG
+from .boxindex import BOOKKEEPING_PREFIX
+from .storage import FileStat, Storage
+from . import tech
+
+persistence = tech.persistence
+Path = tech.fs.Path
+
+
+# published in every directory of a box served over HTTP
+LISTING_FILE_NAME = BOOKKEEPING_PREFIX + 'files'
+
+DEFAULT_MAX_CONNECTIONS = 4
+DEFAULT_TIMEOUT = 30.0
+# listings are reused for this many seconds, instead of fetching them for every query
+LISTING_TTL = 1.0
+# bytes read by a single Range request at least, when archives are read sequentially
+READ_BUFFER_SIZE = 64 * 1024
+
+# listing keys
+MTIME_NS = 'mtime_ns'
+FILES = 'files'
+DIRECTORIES = 'directories'
+
+
+def is_url(location) -> bool:
+    return isinstance(location, str) and location.startswith(('http://', 'https://'))
+
+
+def write_listings(box) -> int:
+    '''
+    Publish listings of the box directories, so that the box can be served over HTTP.
+
+    Must be repeated after the box changes.
+    -> number of directories listed
+    '''
+    directories = [index.directory for index in box.indexes()]
+    for directory in directories:
+        storage = box.storage
+        # stat first: a change after it will make the listing outdated
+        mtime_ns = storage.stat(directory).mtime_ns
+        listing = {
+            MTIME_NS: mtime_ns,
+            FILES: {
+                name: [stat.size, stat.mtime_ns]
+                for name, stat in sorted(storage.list_files(directory).items())
+                if not name.startswith(BOOKKEEPING_PREFIX)},
+            DIRECTORIES: sorted(storage.list_directories(directory)),
+        }
+        # in place: replacing it would change the directory
+        storage.write_bytes(
+            directory / LISTING_FILE_NAME, persistence.dumps_line(listing).encode('utf-8'))
+    return len(directories)
+
+
+class _ConnectionPool:
+    '''
+    Keep-alive connections to a single server.
+    '''
+
+    def __init__(self, scheme: str, netloc: str, max_connections: int, timeout: float):
+        self._connection_class: Type[http.client.HTTPConnection]
+        if scheme == 'https':
+            self._connection_class = http.client.HTTPSConnection
+        else:
+            self._connection_class = http.client.HTTPConnection
+        self.netloc = netloc
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self._idle: List[http.client.HTTPConnection] = []
+        self._lock = threading.Lock()
+
+    def _acquire(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop(), True
+        return self._connection_class(self.netloc, timeout=self.timeout), False
+
+    def _release(self, connection):
+        with self._lock:
+            if len(self._idle) < self.max_connections:
+                self._idle.append(connection)
+                return
+        connection.close()
+
+    def request(self, method: str, target: str, headers: Dict[str, str]):
+        '''
+        -> (status, headers, body)
+        '''
+        while True:
+            connection, reused = self._acquire()
+            try:
+                connection.request(method, target, headers=headers)
+                response = connection.getresponse()
+                body = response.read()
+            except (http.client.HTTPException, ConnectionError):
+                connection.close()
+                if reused:
+                    # closed by the server while idle: retry on a new connection
+                    continue
+                raise
+            except BaseException:
+                connection.close()
+                raise
+            if response.will_close:
+                connection.close()
+            else:
+                self._release(connection)
+            return response.status, response.headers, body
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+
+class _RangeReader(io.RawIOBase):
+    '''
+    Seekable file, read with Range requests.
+    '''
+
+    def __init__(self, storage: 'HTTPStorage', path: Path, stat: FileStat):
+        self._storage = storage
+        self._path = path
+        self._stat = stat
+        self._size = stat.size
+        self._position = 0
+        # the whole file, when the server ignored a Range request
+        self._content: Optional[bytes] = None
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self._size
+        if offset < 0:
+            raise ValueError(f'negative seek position {offset}')
+        self._position = offset
+        return offset
+
+    def readinto(self, buffer):
+        if self._content is None:
+            data, self._content = self._storage._read_range(
+                self._path, self._position, len(buffer))
+            if self._content is not None:
+                self._storage._keep_whole_file(self._path, self._stat, self._content)
+        else:
+            data = self._content[self._position:self._position + len(buffer)]
+        buffer[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+
+class HTTPStorage(Storage):
+    '''
+    Files of a web server - read-only.
+
+    Paths are URL paths on the server, writing raises PermissionError.
+    '''
+
+    def __init__(
+        self,
+        url: str,
+        max_connections: int = DEFAULT_MAX_CONNECTIONS,
+        timeout: float = DEFAULT_TIMEOUT,
+    ):
+        parts = urllib.parse.urlsplit(url)
+        self.url = f'{parts.scheme}://{parts.netloc}'
+        self._pool = _ConnectionPool(parts.scheme, parts.netloc, max_connections, timeout)
+        weakref.finalize(self, self._pool.close)
+        # directory -> (fetch time, listing or None)
+        self._listings: Dict[Path, tuple] = {}
+        self._lock = threading.Lock()
+        # cleared on the first response ignoring a Range request
+        self._range_requests = True
+        # ((path, stat), content) of the last file downloaded whole
+        self._whole_file: Optional[Tuple[tuple, bytes]] = None
+
+    def path(self, location):
+        return Path(urllib.parse.unquote(urllib.parse.urlsplit(location).path) or '/')
+
+    @staticmethod
+    def _key(path) -> Path:
+        return Path(posixpath.normpath(Path(path).as_posix()))
+
+    def _request(self, method: str, path: Path, headers: Optional[Dict[str, str]] = None):
+        target = urllib.parse.quote(self._key(path).as_posix())
+        TRACELOG(f'{method} {target} {headers or ""}')
+        status, response_headers, body = self._pool.request(method, target, headers or {})
+        if status == 404:
+            raise FileNotFoundError(f'{self.url}{target}')
+        if status in (401, 403):
+            raise PermissionError(f'{self.url}{target}: HTTP {status}')
+        # no redirects: the served box directory is not to be left
+        if status >= 300 and status != 416:
+            raise OSError(f'{self.url}{target}: HTTP {status}')
+        return status, response_headers, body
+
+    def _listing(self, directory: Path) -> Optional[dict]:
+        directory = self._key(directory)
+        with self._lock:
+            fetch_time, listing = self._listings.get(directory, (None, None))
+        if fetch_time is not None and time.monotonic() - fetch_time < LISTING_TTL:
+            return listing
+        fetch_time = time.monotonic()
+        try:
+            _status, _headers, body = self._request('GET', directory / LISTING_FILE_NAME)
+            listing = persistence.loads(body.decode('utf-8'))
+            listing[MTIME_NS], listing[FILES], listing[DIRECTORIES]
+        except FileNotFoundError:
+            listing = None
+        except (persistence.ReadError, LookupError, TypeError, UnicodeDecodeError):
+            TRACELOG(f'Ignoring malformed listing of {self.url}{directory}')
+            listing = None
+        with self._lock:
+            self._listings[directory] = (fetch_time, listing)
+        return listing
+
+    def list_files(self, directory, stat=True):
+        listing = self._listing(directory) or {FILES: {}}
+        return {
+            name: FileStat(size, mtime_ns, (0, 0)) if stat else None
+            for name, (size, mtime_ns) in listing[FILES].items()}
+
+    def list_directories(self, directory):
+        listing = self._listing(directory) or {DIRECTORIES: []}
+        return list(listing[DIRECTORIES])
+
+    def stat(self, path):
+        path = self._key(path)
+        parent_listing = self._listing(path.parent) if path != path.parent else None
+        if parent_listing is not None and path.name in parent_listing[FILES]:
+            size, mtime_ns = parent_listing[FILES][path.name]
+            return FileStat(size, mtime_ns, (0, 0))
+        listing = self._listing(path)
+        if listing is not None:
+            # directory
+            return FileStat(0, listing[MTIME_NS], (0, 0))
+        # not published in a listing - e.g. the box index
+        return self._head(path)
+
+    def _head(self, path: Path) -> FileStat:
+        _status, headers, _body = self._request('HEAD', path)
+        last_modified = headers.get('Last-Modified')
+        mtime_ns = 0
+        if last_modified:
+            mtime_ns = int(email.utils.parsedate_to_datetime(last_modified).timestamp()) * 10**9
+        # the server has no file ids: a modified file is considered to be a new one
+        file_id = (0, hash((headers.get('ETag'), last_modified)))
+        return FileStat(int(headers.get('Content-Length', 0)), mtime_ns, file_id)
+
+    def is_directory(self, path):
+        return self._listing(path) is not None
+
+    def open(self, path):
+        path = self._key(path)
+        stat = self.stat(path)
+        with self._lock:
+            whole_file = self._whole_file
+        if whole_file is not None and whole_file[0] == (path, stat):
+            return io.BytesIO(whole_file[1])
+        if not self._range_requests:
+            # reading it in parts would download the whole file for every part
+            content = self.read_bytes(path)
+            self._keep_whole_file(path, stat, content)
+            return io.BytesIO(content)
+        return io.BufferedReader(_RangeReader(self, path, stat), READ_BUFFER_SIZE)
+
+    def _keep_whole_file(self, path: Path, stat: FileStat, content: bytes):
+        # archives are opened repeatedly (directory, members) - they are not downloaded again
+        with self._lock:
+            self._whole_file = ((path, stat), content)
+
+    def read_bytes(self, path):
+        _status, _headers, body = self._request('GET', path)
+        return body
+
+    def read_range(self, path, offset, size):
+        data, _content = self._read_range(path, offset, size)
+        return data
+
+    def _read_range(self, path: Path, offset: int, size: int) -> Tuple[bytes, Optional[bytes]]:
+        '''
+        -> (size bytes at offset, the whole file if the server sent it instead or None)
+        '''
+        if size <= 0:
+            return b'', None
+        status, _headers, body = self._request(
+            'GET', path, {'Range': f'bytes={offset}-{offset + size - 1}'})
+        if status == 416:
+            # offset is at (or after) the end of the file
+            return b'', None
+        if status == 200:
+            # Range is not supported by the server
+            if self._range_requests:
+                TRACELOG(f'{self.url} ignores Range requests, reading whole files')
+                self._range_requests = False
+            return body[offset:offset + size], body
+        return body, None
+
+    def _read_only(self, path):
+        raise PermissionError(f'Read-only HTTP box: {self.url}{self._key(path).as_posix()}')
+
+    def make_directory(self, path):
+        if not self.is_directory(path):
+            self._read_only(path)
+
+    def create(self, path):
+        self._read_only(path)
+
+    def append(self, path, content):
+        self._read_only(path)
+
+    def publish(self, temp_path, path):
+        self._read_only(path)
+
+    def replace(self, source, destination):
+        self._read_only(destination)
+
+    def remove(self, path):
+        self._read_only(path)
+
+    def close(self):
+        self._pool.close()
+
+    def __repr__(self):
+        return f'HTTPStorage({self.url!r})'
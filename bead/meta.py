@@ -25,6 +25,11 @@ with the following minimum structure:
 }
 '''
 
+from copy import deepcopy
+import sys
+from typing import Tuple
+from weakref import WeakValueDictionary
+
 from .tech.timestamp import time_from_timestamp
 import attr
 
@@ -42,6 +47,19 @@ INPUT_CONTENT_ID   = 'content_id'
 INPUT_FREEZE_TIME  = 'freeze_time'
 
 
+def intern(string):
+    '''
+    The shared instance of string - equal strings repeated in many beads take memory once.
+    '''
+    if type(string) is str:
+        return sys.intern(string)
+    return string
+
+
+# forgets the instances no longer used
+_interned: 'WeakValueDictionary[Tuple[type, str], ValidatingStr]' = WeakValueDictionary()
+
+
 class ValidatingStr(str):
     def __init__(self, string: str = ''):
         if not self.is_wellformed(string):
@@ -52,6 +70,17 @@ class ValidatingStr(str):
     def is_wellformed(cls, string: str) -> bool:
         raise NotImplementedError
 
+    @classmethod
+    def interned(cls, string: str):
+        '''
+        The shared instance of cls(string) - shared while it is in use.
+        '''
+        key = (cls, string)
+        try:
+            return _interned[key]
+        except KeyError:
+            return _interned.setdefault(key, cls(string))
+
 
 class BeadName(ValidatingStr):
     @classmethod
@@ -72,18 +101,56 @@ class InputName(BeadName):
 assert isinstance(InputName('asd'), BeadName)
 
 
-@attr.s(auto_attribs=True, frozen=True)
+@attr.s(auto_attribs=True, frozen=True, slots=True)
 class InputSpec:
-    name: InputName = attr.ib(converter=InputName)
-    kind: str
-    content_id: str
-    freeze_time_str: str
+    name: InputName = attr.ib(converter=lambda name: InputName.interned(name))
+    kind: str = attr.ib(converter=intern)
+    content_id: str = attr.ib(converter=intern)
+    freeze_time_str: str = attr.ib(converter=intern)
 
     @property
     def freeze_time(self):
         return time_from_timestamp(self.freeze_time_str)
 
 
+class ReadOnlyDict(dict):
+    '''
+    dict, that can not be modified - copies are modifiable dicts.
+    '''
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError(f'{self.__class__.__name__} can not be modified')
+
+    __setitem__ = __delitem__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+    __ior__ = _read_only
+
+    def copy(self):
+        return dict(self)
+
+    def __copy__(self):
+        return dict(self)
+
+    def __deepcopy__(self, memo):
+        return {key: deepcopy(value, memo) for key, value in self.items()}
+
+    def __reduce__(self):
+        return self.__class__, (dict(self),)
+
+
+def read_only(structure):
+    '''
+    Read-only copy of a parsed JSON structure (e.g. meta), with interned strings.
+
+    Lists become tuples. Meta can be shared instead of copied for every user.
+    '''
+    if isinstance(structure, dict):
+        return ReadOnlyDict((intern(key), read_only(value)) for key, value in structure.items())
+    if isinstance(structure, list):
+        return tuple(read_only(item) for item in structure)
+    return intern(structure)
+
+
 def parse_inputs(meta):
     '''
     Parse and yield input specification from meta as records.
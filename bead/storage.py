@@ -0,0 +1,451 @@
+'''
+Storage backends: where a box keeps its files.
+
+Boxes, their indexes and filters, and the archives in them reach their files
+only through a Storage, which provides a small, file system like interface
+(list, stat, read [range], write-then-publish, append) over paths.
+
+LOCAL stores files in the local file system - the paths are real paths.
+MemoryStorage keeps them in memory - for synthetic (performance) tests,
+or embedding bead in services without touching the disk.
+'''
+
+from abc import ABCMeta, abstractmethod
+import contextlib
+import io
+import itertools
+import os
+import shutil
+import sys
+import threading
+import time
+from typing import BinaryIO, Dict, List, Optional, Set, Tuple
+
+import attr
+
+from . import tech
+
+if sys.platform == 'win32':
+    import msvcrt
+else:
+    import fcntl
+
+Path = tech.fs.Path
+
+
+# bead's own files in box directories (index, filter, markers) - never archives
+BOOKKEEPING_PREFIX = '.bead-'
+
+
+@attr.s(frozen=True, slots=True, auto_attribs=True)
+class FileStat:
+    size: int
+    mtime_ns: int
+    # identifies the file (not the path): changes, when the file is replaced
+    file_id: Tuple[int, int]
+
+
+class Storage(metaclass=ABCMeta):
+    '''
+    Files and directories under paths.
+
+    Missing files are signalled with FileNotFoundError, as with local files.
+    '''
+
+    def path(self, location) -> Path:
+        '''
+        Path of a box location in the storage.
+        '''
+        return Path(location)
+
+    @abstractmethod
+    def list_files(self, directory: Path, stat: bool = True) -> Dict[str, Optional[FileStat]]:
+        '''
+        Files directly in directory -> {name: stat or None, when stat is False}
+        '''
+
+    @abstractmethod
+    def list_directories(self, directory: Path) -> List[str]:
+        pass
+
+    @abstractmethod
+    def stat(self, path: Path) -> FileStat:
+        pass
+
+    def exists(self, path: Path) -> bool:
+        try:
+            self.stat(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    @abstractmethod
+    def is_directory(self, path: Path) -> bool:
+        pass
+
+    @abstractmethod
+    def make_directory(self, path: Path):
+        '''
+        Create directory (and its parents) if it does not exist yet.
+        '''
+
+    @abstractmethod
+    def open(self, path: Path) -> BinaryIO:
+        '''
+        Seekable, readable binary file object.
+        '''
+
+    def read_bytes(self, path: Path) -> bytes:
+        with self.open(path) as f:
+            return f.read()
+
+    def read_range(self, path: Path, offset: int, size: int) -> bytes:
+        with self.open(path) as f:
+            f.seek(offset)
+            return f.read(size)
+
+    @abstractmethod
+    def create(self, path: Path) -> BinaryIO:
+        '''
+        Writable binary file object for a new (or truncated) file.
+        '''
+
+    def write_bytes(self, path: Path, content: bytes):
+        with self.create(path) as f:
+            f.write(content)
+
+    @abstractmethod
+    def append(self, path: Path, content: bytes):
+        '''
+        Append content to a file (creating it) - concurrent appends do not mix.
+        '''
+
+    @abstractmethod
+    def publish(self, temp_path: Path, path: Path):
+        '''
+        Move a completely written temp_path to path - never overwriting an existing file.
+
+        raises FileExistsError, when path already exists.
+        '''
+
+    @abstractmethod
+    def replace(self, source: Path, destination: Path):
+        '''
+        Move source to destination, overwriting destination.
+        '''
+
+    @abstractmethod
+    def remove(self, path: Path):
+        pass
+
+    @contextlib.contextmanager
+    def lock(self, path: Path, exclusive: bool = True):
+        '''
+        Hold an advisory lock on the lock file at path - shared by all processes using it.
+
+        The holder of an exclusive lock may remove the lock file.
+        Storages not supporting locks do not lock.
+        '''
+        yield
+
+
+class LocalStorage(Storage):
+
+    def list_files(self, directory, stat=True):
+        listing: Dict[str, Optional[FileStat]] = {}
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_file():
+                            listing[entry.name] = _file_stat(entry.stat()) if stat else None
+                    except FileNotFoundError:
+                        # removed since listing
+                        pass
+        except FileNotFoundError:
+            pass
+        return listing
+
+    def list_directories(self, directory):
+        try:
+            with os.scandir(directory) as entries:
+                return [entry.name for entry in entries if entry.is_dir()]
+        except FileNotFoundError:
+            return []
+
+    def stat(self, path):
+        return _file_stat(os.stat(path))
+
+    def is_directory(self, path):
+        return os.path.isdir(path)
+
+    def make_directory(self, path):
+        tech.fs.ensure_directory(path)
+
+    def open(self, path):
+        return open(path, 'rb')
+
+    def create(self, path):
+        return open(path, 'wb')
+
+    def append(self, path, content):
+        # a single write call with O_APPEND, so that concurrent writers do not mix
+        fd = os.open(
+            path, os.O_WRONLY | os.O_APPEND | os.O_CREAT | getattr(os, 'O_BINARY', 0), 0o666)
+        try:
+            os.write(fd, content)
+        finally:
+            os.close(fd)
+
+    def publish(self, temp_path, path):
+        try:
+            os.link(temp_path, path)
+            os.remove(temp_path)
+        except FileExistsError:
+            raise
+        except OSError:
+            # no hard links (e.g. on some network file systems)
+            if os.path.exists(path):
+                raise FileExistsError(path)
+            os.replace(temp_path, path)
+
+    def replace(self, source, destination):
+        os.replace(source, destination)
+
+    def remove(self, path):
+        os.remove(path)
+
+    @contextlib.contextmanager
+    def lock(self, path, exclusive=True):
+        fd = self._locked_fd(path, exclusive)
+        try:
+            yield
+        finally:
+            if sys.platform == 'win32':
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+            # closing releases the lock
+            os.close(fd)
+
+    def _locked_fd(self, path, exclusive) -> int:
+        while True:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT | getattr(os, 'O_BINARY', 0), 0o666)
+            if sys.platform == 'win32':
+                # open files can not be removed: the lock file is still at path
+                _lock_first_byte(fd)
+                return fd
+            fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                if os.path.samestat(os.fstat(fd), os.stat(path)):
+                    return fd
+            except FileNotFoundError:
+                pass
+            # the lock file was removed by its previous holder: lock the current one
+            os.close(fd)
+
+    def __repr__(self):
+        return 'LOCAL'
+
+    def __reduce__(self):
+        # unpickled (e.g. in another process) as the LOCAL singleton
+        return 'LOCAL'
+
+
+if sys.platform == 'win32':
+    def _lock_first_byte(fd: int):
+        '''
+        Lock the first byte of the file at fd, waiting as long as needed.
+
+        There are no shared locks on Windows: readers exclude each other too.
+        '''
+        while True:
+            os.lseek(fd, 0, os.SEEK_SET)
+            try:
+                # gives up after 10 attempts, a second apart
+                msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                pass
+
+
+def _file_stat(stat: os.stat_result) -> FileStat:
+    return FileStat(stat.st_size, stat.st_mtime_ns, (stat.st_dev, stat.st_ino))
+
+
+LOCAL = LocalStorage()
+
+
+@attr.s(auto_attribs=True)
+class _MemoryFile:
+    content: bytes
+    mtime_ns: int
+    file_id: Tuple[int, int]
+
+
+@attr.s(auto_attribs=True)
+class _MemoryDirectory:
+    mtime_ns: int
+    files: Dict[str, _MemoryFile] = attr.Factory(dict)
+    directories: Set[str] = attr.Factory(set)
+
+
+class _MemoryWriter(io.BytesIO):
+    def __init__(self, on_close):
+        super().__init__()
+        self._on_close = on_close
+
+    def close(self):
+        if not self.closed:
+            self._on_close(self.getvalue())
+        super().close()
+
+
+class MemoryStorage(Storage):
+    '''
+    Files kept in memory.
+
+    Directory modification times change, when files are added to or removed from them,
+    like in real file systems - boxes rely on that.
+    '''
+
+    def __init__(self):
+        self._directories: Dict[Path, _MemoryDirectory] = {}
+        self._lock = threading.RLock()
+        self._file_ids = itertools.count(1)
+        self._last_time_ns = 0
+
+    @staticmethod
+    def _key(path) -> Path:
+        return Path(os.path.normpath(path))
+
+    def _now(self) -> int:
+        # strictly increasing: every change is visible in modification times
+        self._last_time_ns = max(time.time_ns(), self._last_time_ns + 1)
+        return self._last_time_ns
+
+    def _directory(self, path: Path) -> _MemoryDirectory:
+        try:
+            return self._directories[path]
+        except KeyError:
+            raise FileNotFoundError(path)
+
+    def _get(self, path: Path) -> _MemoryFile:
+        try:
+            return self._directory(path.parent).files[path.name]
+        except KeyError:
+            raise FileNotFoundError(path)
+
+    def _put(self, path: Path, file: _MemoryFile):
+        directory = self._directory(path.parent)
+        if path.name not in directory.files:
+            directory.mtime_ns = self._now()
+        directory.files[path.name] = file
+
+    def _new_file(self, path: Path, content: bytes):
+        self._put(path, _MemoryFile(content, self._now(), (0, next(self._file_ids))))
+
+    def list_files(self, directory, stat=True):
+        with self._lock:
+            try:
+                files = self._directory(self._key(directory)).files
+            except FileNotFoundError:
+                return {}
+            return {name: self._stat(file) if stat else None for name, file in files.items()}
+
+    def list_directories(self, directory):
+        with self._lock:
+            try:
+                return sorted(self._directory(self._key(directory)).directories)
+            except FileNotFoundError:
+                return []
+
+    def _stat(self, file: _MemoryFile) -> FileStat:
+        return FileStat(len(file.content), file.mtime_ns, file.file_id)
+
+    def stat(self, path):
+        path = self._key(path)
+        with self._lock:
+            if path in self._directories:
+                return FileStat(0, self._directories[path].mtime_ns, (0, 0))
+            return self._stat(self._get(path))
+
+    def is_directory(self, path):
+        return self._key(path) in self._directories
+
+    def make_directory(self, path):
+        path = self._key(path)
+        with self._lock:
+            for directory in reversed([path] + list(path.parents)):
+                if directory not in self._directories:
+                    self._directories[directory] = _MemoryDirectory(self._now())
+                    parent = self._directories.get(directory.parent)
+                    if parent is not None and parent is not self._directories[directory]:
+                        parent.directories.add(directory.name)
+                        parent.mtime_ns = self._now()
+
+    def open(self, path):
+        with self._lock:
+            return io.BytesIO(self._get(self._key(path)).content)
+
+    def create(self, path):
+        path = self._key(path)
+
+        def on_close(content):
+            with self._lock:
+                self._new_file(path, content)
+        with self._lock:
+            # fail early, like open() does
+            self._new_file(path, b'')
+        return _MemoryWriter(on_close)
+
+    def append(self, path, content):
+        path = self._key(path)
+        with self._lock:
+            try:
+                file = self._get(path)
+                file.content += content
+                file.mtime_ns = self._now()
+            except FileNotFoundError:
+                self._new_file(path, bytes(content))
+
+    def publish(self, temp_path, path):
+        path = self._key(path)
+        with self._lock:
+            if self.exists(path):
+                raise FileExistsError(path)
+            self.replace(temp_path, path)
+
+    def replace(self, source, destination):
+        source, destination = self._key(source), self._key(destination)
+        with self._lock:
+            file = self._get(source)
+            self._directory(destination.parent)
+            self.remove(source)
+            self._put(destination, file)
+
+    @contextlib.contextmanager
+    def lock(self, path, exclusive=True):
+        # a single process: holding the storage lock excludes all changes
+        with self._lock:
+            yield
+
+    def remove(self, path):
+        path = self._key(path)
+        with self._lock:
+            self._get(path)
+            directory = self._directories[path.parent]
+            del directory.files[path.name]
+            directory.mtime_ns = self._now()
+
+
+def copy_between(
+    source_storage: Storage, source: Path, destination_storage: Storage, destination: Path
+) -> int:
+    '''
+    Copy a file between storages -> number of bytes copied.
+    '''
+    if source_storage is LOCAL and destination_storage is LOCAL:
+        return tech.fs.copy_file(source, destination)
+    with source_storage.open(source) as src, destination_storage.create(destination) as dst:
+        shutil.copyfileobj(src, dst, tech.fs.COPY_CHUNK_SIZE)
+        return dst.tell()
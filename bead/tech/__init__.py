@@ -4,6 +4,7 @@
 Technologies
 '''
 
+from . import bloomfilter
 from . import identifier
 from . import fs
 from . import persistence
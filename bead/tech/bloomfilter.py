@@ -0,0 +1,66 @@
+'''
+Compact, probabilistic set membership.
+
+A Bloom filter answers "definitely not in the set" or "maybe in the set",
+the latter being wrong with a (configurable) small probability.
+'''
+
+import base64
+import hashlib
+import math
+
+
+class BloomFilter:
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        capacity = max(capacity, 1)
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.count = 0
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str):
+        # double hashing: two independent 64 bit hashes generate all positions
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        for i in range(self.hash_count):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, item: str):
+        for position in self._positions(item):
+            self.bits[position // 8] |= 1 << (position % 8)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(
+            self.bits[position // 8] & (1 << (position % 8))
+            for position in self._positions(item))
+
+    @property
+    def is_full(self) -> bool:
+        '''
+        More items were added than planned for - the error rate is higher than requested.
+        '''
+        return self.count > self.capacity
+
+    def to_dict(self) -> dict:
+        return {
+            'capacity': self.capacity,
+            'size': self.size,
+            'hash_count': self.hash_count,
+            'count': self.count,
+            'bits': base64.b64encode(bytes(self.bits)).decode('ascii'),
+        }
+
+    @classmethod
+    def from_dict(cls, content: dict) -> 'BloomFilter':
+        bloom_filter = cls(content['capacity'])
+        bloom_filter.size = content['size']
+        bloom_filter.hash_count = content['hash_count']
+        bloom_filter.count = content['count']
+        bloom_filter.bits = bytearray(base64.b64decode(content['bits']))
+        if len(bloom_filter.bits) != (bloom_filter.size + 7) // 8:
+            raise ValueError('Bloom filter bits do not match its size')
+        return bloom_filter
@@ -5,6 +5,7 @@ import contextlib
 import shutil
 import tempfile
 from pathlib import Path
+from typing import BinaryIO
 
 
 def ensure_directory(path: Path):
@@ -73,3 +74,98 @@ def rmtree(root: Path, *args, **kwargs):
         if not os.path.islink(path):
             make_writable(path)
     shutil.rmtree(root, *args, **kwargs)
+
+
+COPY_CHUNK_SIZE = 8 * 1024 ** 2
+
+
+def _open_for_resume(path: Path):
+    # no O_APPEND (copy_file_range refuses it) and no truncation (written bytes are kept)
+    return open(os.open(path, os.O_WRONLY | os.O_CREAT | getattr(os, 'O_BINARY', 0), 0o666), 'wb')
+
+
+def copy_file(source: Path, destination: Path, offset: int = 0) -> int:
+    '''
+    Copy source to destination, resuming after the first offset bytes already copied.
+
+    The copy is done by the kernel (copy_file_range), when possible:
+    no data passes through user space, and on some (network) file systems
+    it does not even pass through this machine.
+    -> number of bytes copied
+    '''
+    with open(source, 'rb') as src, _open_for_resume(destination) as dst:
+        dst.truncate(offset)
+        size = os.fstat(src.fileno()).st_size
+        position = offset
+        copy_file_range = getattr(os, 'copy_file_range', None)
+        while copy_file_range is not None and position < size:
+            try:
+                copied = copy_file_range(
+                    src.fileno(), dst.fileno(), min(COPY_CHUNK_SIZE, size - position),
+                    position, position)
+            except OSError:
+                # not supported between these files, e.g. across file systems
+                break
+            if copied == 0:
+                break
+            position += copied
+        src.seek(position)
+        dst.seek(position)
+        shutil.copyfileobj(src, dst, COPY_CHUNK_SIZE)
+        return dst.tell() - offset
+
+
+def copy_range(source: BinaryIO, destination: BinaryIO, offset: int, size: int):
+    '''
+    Copy size bytes of source from offset to destination (at its position).
+
+    The copy is done by the kernel (copy_file_range or sendfile), when possible - see copy_file.
+    raises EOFError, if source ends before
+    '''
+    destination.flush()
+    destination_position = destination.tell()
+    try:
+        copied = _kernel_copy(
+            source.fileno(), destination.fileno(), offset, destination_position, size)
+    except io.UnsupportedOperation:
+        # not a real file, e.g. io.BytesIO
+        copied = 0
+    source.seek(offset + copied)
+    destination.seek(destination_position + copied)
+    left = size - copied
+    while left:
+        block = source.read(min(COPY_CHUNK_SIZE, left))
+        if not block:
+            raise EOFError(f'{left} bytes missing from the end of the copied range')
+        destination.write(block)
+        left -= len(block)
+
+
+def _kernel_copy(source: int, destination: int, offset: int, destination_offset: int, size: int):
+    '''
+    -> number of bytes copied, can be less than size (even 0), when the kernel can not copy
+    '''
+    copy_file_range = getattr(os, 'copy_file_range', None)
+    sendfile = getattr(os, 'sendfile', None)
+    copied = 0
+    while copied < size:
+        count = min(COPY_CHUNK_SIZE, size - copied)
+        try:
+            if copy_file_range is not None:
+                chunk = copy_file_range(
+                    source, destination, count, offset + copied, destination_offset + copied)
+            elif sendfile is not None:
+                os.lseek(destination, destination_offset + copied, os.SEEK_SET)
+                chunk = sendfile(destination, source, offset + copied, count)
+            else:
+                break
+        except OSError:
+            # not supported between these files: try the next method
+            if copy_file_range is not None:
+                copy_file_range = None
+                continue
+            break
+        if chunk == 0:
+            break
+        copied += chunk
+    return copied
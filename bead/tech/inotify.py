@@ -0,0 +1,113 @@
+'''
+Wait for changes in directories - with inotify on Linux, by sleeping elsewhere.
+
+Only wakes up the waiter, the changes themselves must be found by other means.
+'''
+
+import ctypes
+import ctypes.util
+import os
+import select
+import sys
+import time
+from typing import Dict, Iterable
+
+from .fs import Path
+
+
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+
+# entries appearing or disappearing
+DIRECTORY_CHANGES = (
+    IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE |
+    IN_DELETE_SELF)
+
+
+def _load_libc():
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or None, use_errno=True)
+        libc.inotify_init1, libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+_libc = _load_libc()
+
+
+def is_available() -> bool:
+    return _libc is not None
+
+
+class DirectoryWatch:
+    '''
+    I wait until one of the watched directories changes, or a timeout.
+
+    Without inotify, waiting is just sleeping for the timeout.
+    '''
+
+    def __init__(self):
+        self._fd = None
+        self._watches: Dict[Path, int] = {}
+        if _libc is not None:
+            fd = _libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if fd >= 0:
+                self._fd = fd
+
+    @property
+    def is_native(self) -> bool:
+        return self._fd is not None
+
+    def watch(self, directories: Iterable[Path]):
+        '''
+        Add directories to the watched ones - already watched and missing ones are ignored.
+        '''
+        if self._fd is None:
+            return
+        for directory in directories:
+            if directory in self._watches:
+                continue
+            wd = _libc.inotify_add_watch(self._fd, os.fsencode(directory), DIRECTORY_CHANGES)
+            if wd >= 0:
+                self._watches[directory] = wd
+
+    def wait(self, timeout: float) -> bool:
+        '''
+        -> True, if a watched directory changed within timeout seconds
+        '''
+        if self._fd is None:
+            time.sleep(timeout)
+            return False
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return False
+        # drain events, they are not interesting in themselves
+        try:
+            while os.read(self._fd, 64 * 1024):
+                pass
+        except BlockingIOError:
+            pass
+        # removed directories lose their watches
+        self._watches = {
+            directory: wd for directory, wd in self._watches.items() if directory.exists()}
+        return True
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+            self._watches = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
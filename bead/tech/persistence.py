@@ -23,6 +23,14 @@ JSON_SAVE_OPTIONS = dict(
 )
 
 
+# single line, e.g. for append-only files with one record per line
+JSON_LINE_OPTIONS = dict(
+    separators=(',', ':'),
+    sort_keys=True,
+    ensure_ascii=True,
+)
+
+
 def load(istream):
     return json.load(istream)
 
@@ -35,6 +43,10 @@ def dumps(content):
     return json.dumps(content, **JSON_SAVE_OPTIONS)
 
 
+def dumps_line(content):
+    return json.dumps(content, **JSON_LINE_OPTIONS)
+
+
 def dump(content, ostream):
     json.dump(content, ostream, **JSON_SAVE_OPTIONS)
 
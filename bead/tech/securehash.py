@@ -5,6 +5,8 @@ I am providing the content hash functions.
 import hashlib
 
 READ_BLOCK_SIZE = 1024 ** 2
+# length of the (hex) hashes returned - e.g. a complete content_id
+HEXDIGEST_LENGTH = 2 * hashlib.sha512().digest_size
 
 # hashes are created from {length of content}:content;
 # similarity to http://cr.yp.to/proto/netstrings.txt are not accidental:
@@ -46,6 +48,33 @@ def file(file, file_size):
     return str(hash.hexdigest())
 
 
+def copy(source, target, file_size):
+    '''
+    Copy source to target and return sha512 hash for the content - reading it once.
+
+    Closes source.
+    '''
+
+    hash = hashlib.sha512()
+    _add_prefix(hash, file_size)
+
+    bytes_read = 0
+
+    with source:
+        while True:
+            block = source.read(READ_BLOCK_SIZE)
+            if not block:
+                break
+            bytes_read += len(block)
+            hash.update(block)
+            target.write(block)
+
+    assert bytes_read == file_size
+
+    _add_suffix(hash, file_size)
+    return str(hash.hexdigest())
+
+
 def bytes(bytes):
     '''
     Return sha512 hash for bytes.
@@ -0,0 +1,54 @@
+import pytest
+
+from .bloomfilter import BloomFilter
+
+
+def test_added_items_are_contained():
+    """Test that there are no false negatives."""
+    bloom = BloomFilter(100)
+    items = [f'item{i}' for i in range(100)]
+    for item in items:
+        bloom.add(item)
+
+    assert all(item in bloom for item in items)
+    assert not bloom.is_full
+
+
+def test_false_positive_rate():
+    """Test that the false positive rate is near the requested error rate."""
+    bloom = BloomFilter(1000, error_rate=0.01)
+    for i in range(1000):
+        bloom.add(f'item{i}')
+
+    false_positives = sum(f'other{i}' in bloom for i in range(10000))
+    assert false_positives < 300
+
+
+def test_is_full():
+    """Test that adding more items than the capacity is detected."""
+    bloom = BloomFilter(2)
+    for item in 'abc':
+        bloom.add(item)
+
+    assert bloom.is_full
+
+
+def test_dict_roundtrip():
+    """Test that a filter survives persistence."""
+    bloom = BloomFilter(10)
+    bloom.add('item')
+
+    restored = BloomFilter.from_dict(bloom.to_dict())
+
+    assert 'item' in restored
+    assert 'other' not in restored
+    assert restored.count == 1
+
+
+def test_truncated_bits_are_rejected():
+    """Test that a damaged filter is not used."""
+    content = BloomFilter(100).to_dict()
+    content['bits'] = content['bits'][:8]
+
+    with pytest.raises(ValueError):
+        BloomFilter.from_dict(content)
@@ -1,4 +1,5 @@
 # coding: utf-8
+import io
 import os
 import pytest
 from . import fs as m
@@ -96,3 +97,61 @@ def test_read_write_file(tmp_path):
     m.write_file(testfile, content)
     read_content = m.read_file(testfile)
     assert content == read_content
+
+
+def test_copy_file(tmp_path):
+    """Test copying a file."""
+    source = tmp_path / 'source'
+    source.write_bytes(b'1234567890' * 1000)
+
+    copied = m.copy_file(source, tmp_path / 'destination')
+
+    assert 10000 == copied
+    assert source.read_bytes() == (tmp_path / 'destination').read_bytes()
+
+
+def test_copy_file_resumes(tmp_path):
+    """Test continuing an interrupted copy."""
+    source = tmp_path / 'source'
+    source.write_bytes(b'1234567890' * 1000)
+    destination = tmp_path / 'destination'
+    destination.write_bytes(b'1234567890' * 300 + b'garbage')
+
+    copied = m.copy_file(source, destination, offset=3000)
+
+    assert 7000 == copied
+    assert source.read_bytes() == destination.read_bytes()
+
+
+@pytest.mark.parametrize('kernel_copy', ['copy_file_range', 'sendfile', None])
+def test_copy_range(tmp_path, monkeypatch, kernel_copy):
+    """Test copying a part of a file."""
+    for name in ('copy_file_range', 'sendfile'):
+        if name != kernel_copy:
+            monkeypatch.delattr(os, name, raising=False)
+    source = tmp_path / 'source'
+    source.write_bytes(b'1234567890' * 1000)
+
+    with source.open('rb') as src, (tmp_path / 'destination').open('wb') as dst:
+        dst.write(b'header')
+        m.copy_range(src, dst, 5, 100)
+        dst.write(b'trailer')
+
+    assert b'header' + (b'6789012345' * 10) + b'trailer' == (
+        tmp_path / 'destination').read_bytes()
+
+
+def test_copy_range_of_memory_files():
+    """Test copying a part of a file without a file descriptor."""
+    destination = io.BytesIO()
+    m.copy_range(io.BytesIO(b'1234567890'), destination, 5, 3)
+    assert b'678' == destination.getvalue()
+
+
+def test_copy_range_beyond_end(tmp_path):
+    """Test copying more than available."""
+    source = tmp_path / 'source'
+    source.write_bytes(b'1234567890')
+    with source.open('rb') as src, (tmp_path / 'destination').open('wb') as dst:
+        with pytest.raises(EOFError):
+            m.copy_range(src, dst, 5, 10)
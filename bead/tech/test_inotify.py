@@ -0,0 +1,21 @@
+import pytest
+
+from .inotify import DirectoryWatch, is_available
+
+
+def test_wait_times_out_without_changes(tmp_path):
+    """Test that waiting ends after the timeout."""
+    with DirectoryWatch() as watch:
+        watch.watch([tmp_path])
+        assert not watch.wait(0.01)
+
+
+@pytest.mark.skipif(not is_available(), reason='inotify is not available')
+def test_wait_returns_on_change(tmp_path):
+    """Test that a new file in a watched directory ends waiting."""
+    with DirectoryWatch() as watch:
+        assert watch.is_native
+        watch.watch([tmp_path])
+        (tmp_path / 'file').write_text('')
+        assert watch.wait(10)
+        assert not watch.wait(0.01)
@@ -54,3 +54,16 @@ def test_bytes_and_file_compatibility(tmp_path):
 
     # then the hashes are the same
     assert bytes_hash == file_hash
+
+
+def test_copy_hash(tmp_path):
+    """Test that copying hashes like hashing the file."""
+    source = tmp_path / 'source'
+    source.write_bytes(b'with some content')
+    target = tmp_path / 'target'
+
+    with target.open('wb') as f:
+        hashresult = securehash.copy(source.open('rb'), f, 17)
+
+    assert b'with some content' == target.read_bytes()
+    assert securehash.bytes(b'with some content') == hashresult
@@ -5,6 +5,7 @@ import pytest
 
 from .timestamp import FixedOffset, Local, timestamp
 from .timestamp import parse_timedelta, parse_iso8601, time_from_timestamp, time_from_user
+from .timestamp import microseconds_from_time, microseconds_from_timestamp
 
 
 @pytest.mark.parametrize(
@@ -88,3 +89,11 @@ def test_timestamp():
         assert (
             time_from_timestamp(timestamp())
             == time_from_timestamp('20191101T010203000004+0500'))
+
+
+def test_microseconds_from_timestamp():
+    assert 0 == microseconds_from_timestamp('19700101T000000000000+0000')
+    assert 1 == microseconds_from_timestamp('19700101T010000000001+0100')
+    assert (
+        microseconds_from_timestamp('20160704T162800000000+0200')
+        == microseconds_from_time(datetime(2016, 7, 4, 14, 28, tzinfo=UTC)))
@@ -1,3 +1,4 @@
+import functools
 import re
 from datetime import tzinfo, timedelta, datetime
 
@@ -198,6 +199,8 @@ def timestamp():
 
 
 # a not so forgiving parser
+# beads' freeze times are parsed again and again, and datetimes are immutable
+@functools.lru_cache(maxsize=4096)
 def time_from_timestamp(timestamp_str):
     '''
         Parse a datetime from a timestamp string - strict!
@@ -215,6 +218,21 @@ EPOCH_STR = '20000101T000000000000+0000'
 assert time_from_timestamp(EPOCH_STR) == datetime(2000, 1, 1, 0, 0, 0, 0, FixedOffset(0, 'epoch'))
 
 
+_UNIX_EPOCH = datetime(1970, 1, 1, tzinfo=FixedOffset(0, 'UTC'))
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def microseconds_from_time(time: datetime) -> int:
+    '''
+        Microseconds since 1970-01-01 UTC - cheap to compare, sort and bisect.
+    '''
+    return (time - _UNIX_EPOCH) // _MICROSECOND
+
+
+def microseconds_from_timestamp(timestamp_str) -> int:
+    return microseconds_from_time(time_from_timestamp(timestamp_str))
+
+
 def time_from_user(timeish):
     '''
         Parse a datetime from user entered string - multiple formats
@@ -0,0 +1,136 @@
+import asyncio
+import threading
+
+import pytest
+
+from .aio import AsyncBox
+from .archivemap import get_archive
+from .box import Box
+from .tech.timestamp import time_from_user
+from .workspace import Workspace
+from . import ziparchive
+from . import spec as bead_spec
+
+
+@pytest.fixture
+def box(tmp_path):
+    """Create a box with versions of a bead having a data file."""
+    (tmp_path / 'box').mkdir()
+    box = Box('test', tmp_path / 'box')
+    for freeze_time in ('20160704T000000000000+0200', '20160705T000000000000+0200'):
+        ws = Workspace(tmp_path / freeze_time / 'bead1')
+        ws.create('kind')
+        (ws.directory / 'output' / 'data').write_text(freeze_time)
+        box.store(ws, freeze_time)
+    return box
+
+
+def run(coroutine_function, *args):
+    return asyncio.run(coroutine_function(*args))
+
+
+def test_lookups(box):
+    """Test that async lookups answer like the sync ones."""
+    async def lookups():
+        async with AsyncBox(box) as abox:
+            latest = await abox.latest('bead1')
+            context = await abox.get_context(
+                bead_spec.BEAD_NAME, 'bead1', time_from_user('20160704T120000000000+0200'))
+            found = await abox.find_bead('bead1', latest.content_id)
+            with pytest.raises(LookupError):
+                await abox.latest('bead2')
+            return latest, context, found, await abox.all_beads()
+
+    latest, context, found, all_beads = run(lookups)
+    assert '20160705T000000000000+0200' == latest.freeze_time_str
+    assert '20160704T000000000000+0200' == context.prev.freeze_time_str
+    assert latest.content_id == found.content_id
+    assert 2 == len(all_beads)
+
+
+def test_concurrent_lookups_are_bounded(box, monkeypatch):
+    """Test that at most `concurrency` lookups run at the same time."""
+    running = []
+    peak = []
+    timeline = box.timeline
+
+    def counting_timeline(name):
+        running.append(name)
+        peak.append(len(running))
+        try:
+            return timeline(name)
+        finally:
+            running.pop()
+    monkeypatch.setattr(box, 'timeline', counting_timeline)
+
+    async def lookups():
+        async with AsyncBox(box, concurrency=3) as abox:
+            return await asyncio.gather(*(abox.latest('bead1') for _ in range(100)))
+
+    beads = run(lookups)
+    assert 1 == len(set(bead.content_id for bead in beads))
+    assert max(peak) <= 3
+
+
+def test_archive_access(box, tmp_path):
+    """Test loading, validating and extracting an archive."""
+    async def access():
+        async with AsyncBox(box) as abox:
+            latest = await abox.latest('bead1')
+            archive = await abox.load_archive(latest.archive_path, box.name)
+            await abox.validate(archive)
+            await abox.unpack_data_to(archive, tmp_path / 'data')
+            return archive
+
+    archive = run(access)
+    assert '20160705T000000000000+0200' == archive.freeze_time_str
+    # shared with the sync API
+    assert archive is get_archive(archive.archive_path, box.name)
+    assert '20160705T000000000000+0200' == (tmp_path / 'data' / 'data').read_text()
+
+
+def test_cancelled_waiting_lookup_is_not_run(box, monkeypatch):
+    """Test that cancelling a lookup waiting for its turn drops it."""
+    release = threading.Event()
+    calls = []
+
+    def blocking_find_bead(name, content_id):
+        calls.append(name)
+        release.wait(10)
+
+    monkeypatch.setattr(box, 'find_bead', blocking_find_bead)
+
+    async def cancel():
+        async with AsyncBox(box, concurrency=1) as abox:
+            first = asyncio.ensure_future(abox.find_bead('first', None))
+            second = asyncio.ensure_future(abox.find_bead('second', None))
+            await asyncio.sleep(0.05)
+            second.cancel()
+            release.set()
+            await first
+            with pytest.raises(asyncio.CancelledError):
+                await second
+
+    run(cancel)
+    assert ['first'] == calls
+
+
+def test_stopped_extraction(box, tmp_path):
+    """Test that extraction stops before the next file, when stopped."""
+    bead = next(iter(box.all_beads()))
+    stop = threading.Event()
+    stop.set()
+    bead.extract_dir('data', tmp_path / 'data', stop=stop)
+    assert [] == list((tmp_path / 'data').iterdir())
+
+
+def test_stopped_validation(box, monkeypatch):
+    """Test that validation stops before hashing the next file, when stopped."""
+    bead = next(iter(box.all_beads()))
+    hashed = []
+    monkeypatch.setattr(
+        ziparchive.securehash, 'file', lambda *args: hashed.append(args) or 'bad hash')
+    stop = threading.Event()
+    stop.set()
+    bead.validate(stop=stop)
+    assert [] == hashed
@@ -4,6 +4,7 @@ import pytest
 
 from . import archive as m
 from . import layouts
+from .workspace import Workspace
 
 
 @pytest.fixture
@@ -80,3 +81,148 @@ def test_content_id(bead_archive):
 
     # then content_id is a string
     assert isinstance(content_id, str)
+
+
+def make_zip_directory_unreadable(monkeypatch):
+    def fail(self):
+        raise AssertionError('the zip directory is read')
+    monkeypatch.setattr(m.ZipArchive, 'zipfile', property(fail))
+
+
+def test_meta_and_single_files_are_read_without_parsing_the_zip_directory(
+    bead_archive, tmp_path, monkeypatch
+):
+    """Test that a few members are looked up in the raw zip directory."""
+    make_zip_directory_unreadable(monkeypatch)
+
+    ziparchive = m.ZipArchive(bead_archive)
+    ziparchive.extract_file('somefile1', tmp_path / 'file')
+
+    assert ziparchive.kind
+    assert ziparchive.content_id
+    assert b"somefile1's known content" == (tmp_path / 'file').read_bytes()
+
+
+def test_xmeta_has_fingerprint_and_refers_to_member_table(bead_archive):
+    """Test that a saved xmeta records the zip file, and its members are kept apart."""
+    bead = m.Archive(bead_archive)
+    bead.save_member_table()
+    bead.save_cache()
+    cache = m.persistence.loads(bead_archive.with_suffix('.xmeta').read_text())
+    members = m.persistence.loads(
+        (bead_archive.parent / cache[m.CACHE_MEMBERS_FILE]).read_text())
+    stat = os.stat(bead_archive)
+    with zipfile.ZipFile(bead_archive) as z:
+        assert [stat.st_size, stat.st_mtime_ns, z.start_dir] == cache[m.CACHE_FINGERPRINT]
+        assert cache[m.CACHE_FINGERPRINT] == members[m.MEMBERS_FINGERPRINT]
+        assert z.namelist() == [fields[0] for fields in members[m.MEMBERS]]
+    assert m.XMETA_VERSION == cache[m.CACHE_XMETA_VERSION]
+    assert m.MEMBERS not in cache
+
+
+def test_save_cache_does_not_open_the_zip(bead_archive, monkeypatch):
+    """Test that saving known meta (e.g. a new input map) does not read the archive."""
+    meta = m.Archive(bead_archive).complete_cache()
+    bead = m.Archive(bead_archive, cache=meta)
+    monkeypatch.setattr(m.Archive, 'ziparchive', property(lambda self: pytest.fail('opened')))
+
+    bead.input_map = {'input': 'renamed'}
+
+    monkeypatch.undo()
+    assert {'input': 'renamed'} == m.Archive(bead_archive).input_map
+
+
+def test_extract_with_member_table(bead_archive, tmp_path, monkeypatch):
+    """Test that members are extracted without reading the zip directory."""
+    bead = m.Archive(bead_archive)
+    bead.save_member_table()
+    bead.save_cache()
+    make_zip_directory_unreadable(monkeypatch)
+
+    bead = m.Archive(bead_archive)
+    bead.extract_dir('path/to', tmp_path / 'dir')
+    bead.extract_file('somefile1', tmp_path / 'file')
+
+    assert b"file1's known content" == (tmp_path / 'dir' / 'file1').read_bytes()
+    assert b"somefile1's known content" == (tmp_path / 'file').read_bytes()
+
+
+def test_member_table_of_indexed_archive_is_read_from_xmeta(bead_archive, tmp_path, monkeypatch):
+    """Test that archives with meta from elsewhere (e.g. a box index) use the xmeta table."""
+    bead = m.Archive(bead_archive)
+    bead.save_member_table()
+    bead.save_cache()
+    meta = bead.complete_cache()
+    assert m.CACHE_MEMBERS_FILE not in meta
+    make_zip_directory_unreadable(monkeypatch)
+
+    m.Archive(bead_archive, cache=meta).extract_file('somefile1', tmp_path / 'file')
+    assert b"somefile1's known content" == (tmp_path / 'file').read_bytes()
+
+
+def test_stale_xmeta_is_not_used(bead_archive):
+    """Test that an xmeta is ignored, when the archive changed."""
+    bead = m.Archive(bead_archive)
+    bead.cache[m.meta.KIND] = 'STALE'
+    bead.save_cache()
+    assert 'STALE' == m.Archive(bead_archive).kind
+
+    stat = os.stat(bead_archive)
+    os.utime(bead_archive, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    assert 'TEST-FAKE' == m.Archive(bead_archive).kind
+
+
+def test_xmeta_of_unknown_version_is_not_used(bead_archive):
+    bead = m.Archive(bead_archive)
+    bead.cache[m.meta.KIND] = 'FUTURE'
+    bead.cache[m.CACHE_XMETA_VERSION] = m.XMETA_VERSION + 1
+    bead.save_cache()
+    assert 'TEST-FAKE' == m.Archive(bead_archive).kind
+
+
+def test_validate_with_member_table(tmp_path, monkeypatch):
+    """Test that validation reads members by the table, and notices damaged ones."""
+    monkeypatch.setenv('BEAD_ZIP_COMPRESSION', 'stored')
+    ws = Workspace(tmp_path / 'ws')
+    ws.create('kind')
+    (ws.directory / 'output' / 'data').write_bytes(b'0123456789' * 1000)
+    archive_path = tmp_path / 'ws_20160704T000000000000+0200.zip'
+    ws.pack(archive_path, freeze_time='20160704T000000000000+0200', comment='')
+    bead = m.Archive(archive_path)
+    bead.save_member_table()
+    bead.save_cache()
+    make_zip_directory_unreadable(monkeypatch)
+
+    m.Archive(archive_path).validate()
+
+    # damage the data, keeping the fingerprint
+    stat = os.stat(archive_path)
+    content = archive_path.read_bytes()
+    archive_path.write_bytes(content.replace(b'0123456789' * 1000, b'9876543210' * 1000))
+    os.utime(archive_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    with pytest.raises(m.InvalidArchive) as e:
+        m.Archive(archive_path).validate()
+    assert (archive_path, 'data/data') == e.value.args
+
+
+def test_cache_disagreeing_with_zip_meta(bead_archive):
+    """Test that the error names the archive and its meta file, like other validation errors."""
+    archive = m.Archive(bead_archive, cache={
+        'meta_version': 'aaa947a6-1f7a-11e6-ba3a-0021cc73492e',
+        'kind': 'ANOTHER-KIND',
+        'freeze_time': '20200913T173910000000+0000'})
+    with pytest.raises(m.InvalidArchive) as e:
+        archive.ziparchive
+    assert (bead_archive, layouts.Archive.BEAD_META) == e.value.args
+    assert layouts.Archive.BEAD_META == e.value.bad_file
+
+
+def test_archive_without_xmeta_does_not_parse_the_zip_directory(bead_archive, monkeypatch):
+    """Test that meta, fingerprint and member table come from the raw zip directory."""
+    make_zip_directory_unreadable(monkeypatch)
+
+    bead = m.Archive(bead_archive)
+    bead.save_member_table()
+
+    assert m.CACHE_FINGERPRINT in bead.cache
+    assert 'somefile1' in bead.ziparchive.members
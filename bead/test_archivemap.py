@@ -0,0 +1,80 @@
+import os
+
+import pytest
+
+from .archive import Archive
+from .box import Box
+from .exceptions import InvalidArchive
+from .workspace import Workspace
+from . import archivemap as m
+
+
+@pytest.fixture
+def archive_path(tmp_path):
+    ws = Workspace(tmp_path / 'bead')
+    ws.create('kind')
+    path = tmp_path / 'bead_20160704T000000000000+0200.zip'
+    ws.pack(path, freeze_time='20160704T000000000000+0200', comment='')
+    return path
+
+
+def test_repeated_lookup_is_not_loaded_again(archive_path, monkeypatch):
+    """Test that a remembered archive costs no .xmeta read."""
+    archive = m.get_archive(archive_path)
+    monkeypatch.setattr(Archive, 'load_cache', lambda self: pytest.fail('loaded again'))
+    assert archive is m.get_archive(archive_path)
+    assert archive is m.get_archive(str(archive_path))
+
+
+def test_changed_file_is_loaded_again(archive_path):
+    archive = m.get_archive(archive_path)
+    stat = os.stat(archive_path)
+    os.utime(archive_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    assert archive is not m.get_archive(archive_path)
+
+
+def test_box_lookups_share_archives(archive_path, tmp_path):
+    """Test that box lookups and direct lookups return the same archive."""
+    box = Box('box', tmp_path)
+    bead = box.find_bead('bead', m.get_archive(archive_path, 'box').content_id)
+    assert bead is m.get_archive(archive_path, 'box')
+    assert bead is next(iter(box.all_beads()))
+
+
+def test_invalid_archive_is_not_remembered(tmp_path):
+    path = tmp_path / 'bad.zip'
+    path.write_bytes(b'bad')
+    loads = []
+
+    def load():
+        loads.append(path)
+        return Archive(path)
+    for _ in range(2):
+        with pytest.raises(InvalidArchive):
+            m.get_archive(path, load=load)
+    assert 2 == len(loads)
+
+
+def test_least_recently_used_are_forgotten():
+    archive_map = m.ArchiveMap(max_size=2)
+    a, b, c = object(), object(), object()
+    archive_map.get('a', lambda: a)
+    archive_map.get('b', lambda: b)
+    archive_map.get('a', lambda: pytest.fail('a is remembered'))
+    archive_map.get('c', lambda: c)
+    assert 2 == len(archive_map)
+    assert b is not archive_map.get('b', lambda: object())
+
+
+def test_rewritten_xmeta_is_loaded_again(archive_path, tmp_path):
+    """Test that an .xmeta written by another Archive instance is not hidden by the map."""
+    box = Box('box', tmp_path)
+    (bead,) = box.all_beads()
+    assert {} == bead.input_map
+
+    Archive(archive_path).input_map = {'input': 'renamed'}
+
+    (bead,) = Box('box', tmp_path).all_beads()
+    assert {'input': 'renamed'} == bead.input_map
+    (bead,) = Box('box', tmp_path).all_beads()
+    assert {'input': 'renamed'} == bead.input_map
@@ -1,5 +1,9 @@
+import os
+import threading
+import time
 import pytest
-from .box import Box
+from .box import Box, UnionBox, STREAM_BUFFER_SIZE, STREAM_CANCEL_POLL_INTERVAL
+from .exceptions import BoxError
 from .tech.fs import write_file, rmtree
 from .tech.timestamp import time_from_user
 from .workspace import Workspace
@@ -86,3 +90,273 @@ def test_box_methods_tolerate_junk_in_box(tmp_path_factory):
 
     bead_names = set(b.name for b in box.all_beads())
     assert set(['bead1', 'bead2', 'BEAD3']) == bead_names
+
+
+def test_get_context_opens_only_the_nearest_archives(box, timestamp, monkeypatch):
+    """Test that get_context by name confirms only the winning candidates."""
+    for freeze_time in ('20160705T000000000000+0200', '20160706T000000000000+0200'):
+        ws = Workspace(box.directory / 'bead2-next' / 'bead2')
+        ws.create('test-bead2')
+        box.store(ws, freeze_time)
+        rmtree(ws.directory)
+
+    opened = []
+    get_archive = box.index.get_archive
+
+    def spy(file_name, box_name=''):
+        opened.append(file_name)
+        return get_archive(file_name, box_name)
+    monkeypatch.setattr(box.index, 'get_archive', spy)
+
+    time = time_from_user('20160705T120000000000+0200')
+    context = box.get_context(bead_spec.BEAD_NAME, 'bead2', time)
+    assert context.prev.freeze_time_str == '20160705T000000000000+0200'
+    assert context.next.freeze_time_str == '20160706T000000000000+0200'
+    assert 2 == len(opened)
+
+
+def test_get_context_with_misleading_file_name(box, timestamp):
+    """Test that get_context falls back to archive meta, when file names lie."""
+    (bead,) = [bead for bead in box.all_beads() if bead.name == 'bead1']
+    os.rename(bead.archive_path, box.directory / 'bead1_20160801T000000000000+0200.zip')
+
+    context = box.get_context(bead_spec.BEAD_NAME, 'bead1', timestamp)
+    assert context.prev.freeze_time_str == '20160704T000000000000+0200'
+    assert context.next is None
+
+
+def test_timeline_is_reused_until_the_box_changes(box):
+    """Test that the timeline of a name is rebuilt only after storing a new version."""
+    timeline = box.timeline('bead2')
+    assert timeline is box.timeline('bead2')
+
+    ws = Workspace(box.directory / 'bead2-next' / 'bead2')
+    ws.create('test-bead2')
+    box.store(ws, '20160705T000000000000+0200')
+
+    new_timeline = box.timeline('bead2')
+    assert new_timeline is not timeline
+    assert 2 == len(new_timeline)
+
+
+def test_sharded_box_stores_into_sub_directory(tmp_path_factory, timestamp):
+    """Test that a sharded box stores and finds beads in per name directories."""
+    box = Box('test', tmp_path_factory.mktemp('box'))
+    box.shard()
+    ws = Workspace(tmp_path_factory.mktemp('workspace') / 'bead1')
+    ws.create('test-bead1')
+
+    zipfilename = box.store(ws, '20160704T000000000000+0200')
+
+    assert zipfilename.parent == box.directory / 'bead1'
+    context = box.get_context(bead_spec.BEAD_NAME, 'bead1', timestamp)
+    assert context.prev.archive_path == zipfilename
+    assert ['bead1'] == [b.name for b in box.all_beads()]
+
+
+def test_shard_moves_flat_archives(box, timestamp):
+    """Test migration of a flat box: beads remain available in both layouts."""
+    (bead1,) = [bead for bead in box.all_beads() if bead.name == 'bead1']
+    bead1.save_cache()
+
+    assert 3 == box.shard()
+
+    assert not bead1.archive_path.exists()
+    assert (box.directory / 'bead1' / bead1.archive_path.name).exists()
+    assert (box.directory / 'bead1' / bead1.cache_path.name).exists()
+    bead_names = set(b.name for b in box.all_beads())
+    assert set(['bead1', 'bead2', 'BEAD3']) == bead_names
+    context = box.get_context(bead_spec.BEAD_NAME, 'BEAD3', timestamp)
+    assert context.next.name == 'BEAD3'
+    assert box.find_bead('bead1', bead1.content_id) is not None
+
+
+def test_store_publishes_complete_archives_only(box, tmp_path_factory, monkeypatch):
+    """Test that a concurrent reader does not see an archive being written."""
+    ws = Workspace(tmp_path_factory.mktemp('workspace') / 'bead4')
+    ws.create('test-bead4')
+    pack = Workspace.pack
+
+    def pack_and_scan(self, zipfilename, *args, **kwargs):
+        pack(self, zipfilename, *args, **kwargs)
+        assert 'bead4' not in set(bead.name for bead in Box('test', box.directory).all_beads())
+    monkeypatch.setattr(Workspace, 'pack', pack_and_scan)
+
+    zipfilename = box.store(ws, '20160704T000000000000+0200')
+
+    assert [zipfilename.name] == [p.name for p in box.directory.glob('*bead4*')]
+    assert 'bead4' in set(bead.name for bead in Box('test', box.directory).all_beads())
+
+
+def test_store_does_not_overwrite(box):
+    """Test that an existing archive is not replaced."""
+    ws = Workspace(box.directory / 'bead1')
+    with pytest.raises(BoxError):
+        box.store(ws, '20160704T000000000000+0200')
+
+
+def test_union_box_timeline(box, tmp_path_factory):
+    """Test that versions of a name are merged from all boxes."""
+    other_box = Box('other', tmp_path_factory.mktemp('other'))
+    ws = Workspace(tmp_path_factory.mktemp('workspace') / 'bead2')
+    ws.create('test-bead2')
+    other_box.store(ws, '20160705T000000000000+0200')
+
+    timeline = UnionBox([box, other_box]).timeline('bead2')
+
+    assert ['20160704T162800000000+0200', '20160705T000000000000+0200'] == [
+        bead.freeze_time_str for bead in timeline]
+
+
+class HungBox(Box):
+    def __init__(self, name, location, release):
+        super().__init__(name, location)
+        self.release = release
+
+    def may_contain(self, name, content_id=None):
+        return True
+
+    def find_bead(self, name, content_id):
+        self.release.wait()
+        return None
+
+    def get_context(self, check_type, check_param, time):
+        self.release.wait()
+        raise LookupError
+
+
+@pytest.fixture
+def hung_box(tmp_path_factory):
+    release = threading.Event()
+    yield HungBox('hung', tmp_path_factory.mktemp('hung'), release)
+    release.set()
+
+
+def test_union_box_find_bead_does_not_wait_for_slow_boxes(box, hung_box):
+    """Test that the first hit is returned, while another box is still searching."""
+    (bead1,) = [bead for bead in box.all_beads() if bead.name == 'bead1']
+    unionbox = UnionBox([hung_box, box])
+
+    assert unionbox.find_bead('bead1', bead1.content_id).name == 'bead1'
+
+
+def test_union_box_reports_slow_boxes(box, hung_box, timestamp):
+    """Test that boxes not answering in time are left out and reported."""
+    slow_boxes = []
+    unionbox = UnionBox([hung_box, box], timeout=0.1, on_slow_box=slow_boxes.append)
+
+    context = unionbox.get_context(bead_spec.BEAD_NAME, 'bead2', timestamp)
+
+    assert context.bead.name == 'bead2'
+    assert [hung_box] == slow_boxes
+
+
+class HalfHungBox(Box):
+    def __init__(self, name, location, release):
+        super().__init__(name, location)
+        self.release = release
+
+    def all_beads(self, workers=1):
+        beads = super().all_beads(workers)
+        yield next(beads)
+        self.release.wait()
+        yield from beads
+
+
+def test_union_box_all_beads_yields_beads_as_they_are_found(box):
+    """Test that beads of a box are returned before the box has listed all of them."""
+    release = threading.Event()
+    half_hung_box = HalfHungBox('half-hung', box.directory, release)
+    unionbox = UnionBox([half_hung_box, box], timeout=5)
+
+    try:
+        beads = unionbox.all_beads()
+        found = [next(beads) for _ in range(4)]
+    finally:
+        release.set()
+
+    assert 6 == len(found) + len(list(beads))
+
+
+class SlowBox(Box):
+    def __init__(self, name, location, delay):
+        super().__init__(name, location)
+        self.delay = delay
+
+    def all_beads(self, workers=1):
+        for bead in super().all_beads(workers):
+            time.sleep(self.delay)
+            yield bead
+
+
+def test_union_box_timeout_does_not_count_consumer_time(box, tmp_path_factory):
+    """Test that a slow consumer does not make the boxes look slow."""
+    slow_box = SlowBox('slow', box.directory, delay=0.6)
+    other_box = Box('other', tmp_path_factory.mktemp('other'))
+    ws = Workspace(tmp_path_factory.mktemp('workspace') / 'bead3')
+    ws.create('test-bead3')
+    other_box.store(ws, '20160704T000000000000+0200')
+    slow_boxes = []
+    unionbox = UnionBox([slow_box, other_box], timeout=0.4, on_slow_box=slow_boxes.append)
+
+    beads = unionbox.all_beads()
+    assert 'bead3' == next(beads).name
+    time.sleep(0.4)
+
+    assert 'bead3' != next(beads).name
+    assert [] == slow_boxes
+
+
+def test_union_box_timeout_is_between_items(box):
+    """Test that a box producing each of its items in time is not left out."""
+    slow_box = SlowBox('slow', box.directory, delay=0.15)
+    slow_boxes = []
+    unionbox = UnionBox([slow_box], timeout=0.3, on_slow_box=slow_boxes.append)
+
+    assert 3 == len(list(unionbox.all_beads()))
+    assert [] == slow_boxes
+
+
+def test_union_box_timeout_is_per_box(box):
+    """Test that only the box not producing its next item in time is left out."""
+    release = threading.Event()
+    half_hung_box = HalfHungBox('half-hung', box.directory, release)
+    slow_boxes = []
+    unionbox = UnionBox([half_hung_box, box], timeout=0.2, on_slow_box=slow_boxes.append)
+
+    try:
+        found = list(unionbox.all_beads())
+    finally:
+        release.set()
+
+    assert 4 == len(found)
+    assert [half_hung_box] == slow_boxes
+
+
+class EndlessBox(Box):
+    def __init__(self, name, location):
+        super().__init__(name, location)
+        self.produced = 0
+
+    def all_beads(self, workers=1):
+        beads = list(super().all_beads(workers))
+        while True:
+            for bead in beads:
+                self.produced += 1
+                yield bead
+
+
+def test_union_box_stops_the_boxes_when_done(box):
+    """Test that boxes stop streaming, when their items are not needed anymore."""
+    endless_box = EndlessBox('endless', box.directory)
+    unionbox = UnionBox([endless_box, box], timeout=5)
+
+    beads = unionbox.all_beads()
+    next(beads)
+    beads.close()
+    time.sleep(3 * STREAM_CANCEL_POLL_INTERVAL)
+    produced = endless_box.produced
+    time.sleep(3 * STREAM_CANCEL_POLL_INTERVAL)
+
+    assert produced == endless_box.produced
+    assert produced <= 2 * (STREAM_BUFFER_SIZE + 1) * len(unionbox.boxes)
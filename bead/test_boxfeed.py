@@ -0,0 +1,82 @@
+import os
+import shutil
+
+import pytest
+
+from .box import Box
+from .workspace import Workspace
+from . import boxfeed
+
+
+@pytest.fixture
+def box(tmp_path):
+    """Create an empty box."""
+    (tmp_path / 'box').mkdir()
+    return Box('test', tmp_path / 'box')
+
+
+@pytest.fixture
+def store(box, tmp_path):
+    """Provide a function storing a new bead in box."""
+    def store(name, freeze_time):
+        ws = Workspace(tmp_path / freeze_time / name)
+        ws.create('kind-' + name)
+        return box.store(ws, freeze_time)
+    return store
+
+
+def names(beads):
+    return sorted(bead.archive_path.name for bead in beads)
+
+
+def test_changes_since_token(box, store):
+    """Test that only archives added or removed since the token are reported."""
+    archive1 = store('bead1', '20160704T000000000000+0200')
+    changes = box.changes()
+    assert [archive1.name] == names(changes.added)
+    assert not box.changes(changes.token)
+
+    archive2 = store('bead2', '20160704T000000000000+0200')
+    os.remove(archive1)
+    changes = box.changes(changes.token)
+    assert [archive2.name] == names(changes.added)
+    assert [archive1] == changes.removed
+
+
+def test_unchanged_directories_are_not_listed(box, store, monkeypatch):
+    """Test that a directory is listed only, when its modification time changed."""
+    monkeypatch.setattr(boxfeed, 'MTIME_GRANULARITY_NS', 0)
+    store('bead1', '20160704T000000000000+0200')
+    token = box.changes().token
+
+    listed = []
+    file_names = box.index.file_names
+    monkeypatch.setattr(
+        box.index, 'file_names', lambda pattern: listed.append(pattern) or file_names(pattern))
+    assert not box.changes(token)
+    assert [] == listed
+
+
+def test_archive_is_reported_when_it_becomes_valid(box, tmp_path):
+    """Test that archives being copied into the box are reported once complete."""
+    (tmp_path / 'other').mkdir()
+    ws = Workspace(tmp_path / 'bead1')
+    ws.create('kind')
+    archive = Box('other', tmp_path / 'other').store(ws, '20160704T000000000000+0200')
+    token = box.changes().token
+
+    copy = box.directory / archive.name
+    copy.write_bytes(b'partial')
+    changes = box.changes(token)
+    assert not changes
+
+    shutil.copyfile(archive, copy)
+    assert [archive.name] == names(box.changes(changes.token).added)
+
+
+def test_changes_in_shards(box, store):
+    """Test that archives in new shards are reported."""
+    box.shard()
+    token = box.changes().token
+    archive = store('bead1', '20160704T000000000000+0200')
+    assert [archive.name] == names(box.changes(token).added)
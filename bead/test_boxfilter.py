@@ -0,0 +1,157 @@
+import os
+import shutil
+import pytest
+
+from . import boxfilter as m
+from .box import Box, UnionBox
+from .tech.timestamp import time_from_user
+from .workspace import Workspace
+from . import spec as bead_spec
+
+
+@pytest.fixture
+def add_bead(tmp_path_factory):
+    def add_bead(box, name, freeze_time='20160704T000000000000+0200'):
+        ws = Workspace(tmp_path_factory.mktemp('workspace') / name)
+        ws.create('test-' + name)
+        return box.store(ws, freeze_time)
+    return add_bead
+
+
+@pytest.fixture
+def box(tmp_path_factory, add_bead):
+    """Create a test box with sample beads."""
+    box = Box('test', tmp_path_factory.mktemp('box'))
+    add_bead(box, 'bead1')
+    add_bead(box, 'bead2')
+    return box
+
+
+def content_id(box, name):
+    (bead,) = [bead for bead in box.all_beads() if bead.name == name]
+    return bead.content_id
+
+
+def fresh(box):
+    '''
+    The same box, without in memory state.
+    '''
+    return Box(box.name, box.location)
+
+
+def test_filter_knows_stored_beads(box):
+    """Test that the filter answers by name and content_id."""
+    box = fresh(box)
+    assert box.may_contain('bead1')
+    assert box.may_contain('bead1', content_id(box, 'bead1'))
+    assert not box.may_contain('bead3')
+    assert not box.may_contain('bead1', 'unknown-content-id')
+
+
+def test_store_updates_filter_incrementally(box, add_bead, monkeypatch):
+    """Test that storing into an unchanged box does not rescan the box."""
+    box.rebuild_filter()
+
+    def fail():
+        raise AssertionError('filter rebuilt')
+    monkeypatch.setattr(box, 'rebuild_filter', fail)
+
+    add_bead(box, 'bead3')
+
+    box = fresh(box)
+    monkeypatch.setattr(box, 'rebuild_filter', fail)
+    assert box.may_contain('bead3')
+    assert not box.may_contain('bead4')
+
+
+def test_store_leaves_outdated_filter_to_queries(box, tmp_path_factory, add_bead, monkeypatch):
+    """Test that a store does not rescan the box, when the filter can not be updated."""
+    other_box = Box('other', tmp_path_factory.mktemp('other'))
+    shutil.copy(add_bead(other_box, 'bead3'), box.directory)
+
+    def fail():
+        raise AssertionError('filter rebuilt')
+    with monkeypatch.context() as patch:
+        patch.setattr(box, 'rebuild_filter', fail)
+        add_bead(box, 'bead4')
+
+    box = fresh(box)
+    assert box.may_contain('bead3')
+    assert box.may_contain('bead4')
+    assert not box.may_contain('bead5')
+
+
+def test_store_into_sharded_box_updates_filter(tmp_path_factory, add_bead):
+    """Test that the filter works with new shards."""
+    box = Box('test', tmp_path_factory.mktemp('box'))
+    box.shard()
+    add_bead(box, 'bead1')
+    add_bead(box, 'bead2')
+    add_bead(box, 'bead2', '20160704T162800000000+0200')
+
+    box = fresh(box)
+    assert box.may_contain('bead1')
+    assert box.may_contain('bead2')
+    assert not box.may_contain('bead3')
+
+
+def test_filter_is_not_trusted_after_outside_change(box, tmp_path_factory, add_bead):
+    """Test that archives copied into the box are not missed."""
+    other_box = Box('other', tmp_path_factory.mktemp('other'))
+    archive = add_bead(other_box, 'bead3')
+    shutil.copy(archive, box.directory)
+
+    box = fresh(box)
+    assert box.may_contain('bead3')
+    assert box.find_bead('bead3', content_id(other_box, 'bead3')) is not None
+
+
+def test_malformed_filter_is_ignored(box):
+    """Test that a damaged filter means "maybe"."""
+    box.rebuild_filter()
+    filter_path = box.directory / m.FILTER_FILE_NAME
+    filter_path.write_text(filter_path.read_text()[:100])
+
+    assert m.BoxFilter(box.directory).may_contain('bead3')
+
+
+def test_union_box_skips_boxes_without_the_bead(
+    box, tmp_path_factory, add_bead, monkeypatch
+):
+    """Test that UnionBox searches only boxes possibly having the bead."""
+    other_box = Box('other', tmp_path_factory.mktemp('other'))
+    add_bead(other_box, 'bead3')
+    bead3_content_id = content_id(other_box, 'bead3')
+    box, other_box = fresh(box), fresh(other_box)
+
+    def fail(*args, **kwargs):
+        raise AssertionError('box searched')
+    monkeypatch.setattr(box, 'find_bead', fail)
+    monkeypatch.setattr(box, 'get_context', fail)
+    unionbox = UnionBox([box, other_box])
+
+    assert unionbox.find_bead('bead3', bead3_content_id).name == 'bead3'
+    time = time_from_user('20160704T000000000000+0200')
+    context = unionbox.get_context(bead_spec.BEAD_NAME, 'bead3', time)
+    assert context.bead.name == 'bead3'
+
+
+def test_union_box_finds_bead_by_content_id_prefix(box):
+    """Test that a content_id prefix is not looked up in the filter as a complete id."""
+    bead1_content_id = content_id(box, 'bead1')
+    unionbox = UnionBox([fresh(box)])
+
+    assert unionbox.find_bead('bead1', bead1_content_id[:10]).content_id == bead1_content_id
+
+
+def test_recent_directory_mtime_is_not_trusted(box, tmp_path_factory, add_bead):
+    """Test that an archive added within the timestamp granularity is not hidden."""
+    box.rebuild_filter()
+    mtime_ns = box.directory.stat().st_mtime_ns
+    other_box = Box('other', tmp_path_factory.mktemp('other'))
+    archive = add_bead(other_box, 'bead3')
+    shutil.copy(archive, box.directory)
+    # a coarse timestamp: the directory looks unchanged
+    os.utime(box.directory, ns=(mtime_ns, mtime_ns))
+
+    assert fresh(box).may_contain('bead3')
@@ -0,0 +1,246 @@
+import os
+import pytest
+
+from . import boxindex as m
+from .box import Box
+from .exceptions import InvalidArchive
+from .tech.fs import write_file
+from .tech.timestamp import time_from_timestamp
+from .workspace import Workspace
+from . import spec as bead_spec
+from . import storage
+from . import zipopener
+
+
+@pytest.fixture
+def box(tmp_path_factory):
+    """Create a test box with sample beads."""
+    tmp_path = tmp_path_factory.mktemp('box')
+    box = Box('test', tmp_path)
+
+    def add_bead(name, kind, freeze_time):
+        ws = Workspace(tmp_path_factory.mktemp('workspace') / name)
+        ws.create(kind)
+        box.store(ws, freeze_time)
+
+    add_bead('bead1', 'test-bead1', '20160704T000000000000+0200')
+    add_bead('bead2', 'test-bead2', '20160704T162800000000+0200')
+    add_bead('bead2', 'test-bead2', '20160704T162800000001+0200')
+    return box
+
+
+@pytest.fixture
+def archives_can_not_be_opened(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError('archive opened')
+    monkeypatch.setattr(m.Archive, 'load_cache', fail)
+    monkeypatch.setattr(m.Archive, 'complete_cache', fail)
+
+
+def test_store_updates_index(box):
+    """Test that stored beads are recorded in the index file."""
+    index = m.BoxIndex(box.directory)
+    index.load()
+    assert 3 == len(index._records)
+
+
+def test_queries_are_answered_from_index(box, archives_can_not_be_opened):
+    """Test that an up to date index is used instead of opening archives."""
+    fresh_box = Box('test', box.directory)
+
+    names = sorted(bead.name for bead in fresh_box.all_beads())
+    assert ['bead1', 'bead2', 'bead2'] == names
+
+    time = time_from_timestamp('20160704T162800000001+0200')
+    context = fresh_box.get_context(bead_spec.BEAD_NAME, 'bead2', time)
+    assert context.bead.freeze_time == time
+
+
+def test_find_bead_by_content_id(box, archives_can_not_be_opened):
+    """Test that find_bead works from the index."""
+    bead = next(b for b in box.all_beads() if b.name == 'bead1')
+    found = Box('test', box.directory).find_bead('bead1', bead.content_id)
+    assert found.content_id == bead.content_id
+
+
+def test_changed_archive_is_reindexed(box):
+    """Test that a replaced archive is not answered from the stale record."""
+    bead = next(b for b in box.all_beads() if b.name == 'bead1')
+    write_file(bead.archive_path, b'')
+    zipopener.close_all()
+
+    fresh_box = Box('test', box.directory)
+    names = sorted(bead.name for bead in fresh_box.all_beads())
+    assert ['bead2', 'bead2'] == names
+
+
+def test_removed_archive_is_not_returned(box):
+    """Test that index records for deleted archives are ignored."""
+    bead = next(b for b in box.all_beads() if b.name == 'bead1')
+    os.remove(bead.archive_path)
+
+    names = sorted(bead.name for bead in Box('test', box.directory).all_beads())
+    assert ['bead2', 'bead2'] == names
+
+
+def test_junk_is_remembered_as_invalid(box, monkeypatch):
+    """Test that invalid files are not reopened on every query."""
+    write_file(box.directory / 'junk', 'random bits')
+    assert 3 == len(list(box.all_beads()))
+
+    def fail(*args, **kwargs):
+        raise InvalidArchive('opened again')
+    monkeypatch.setattr(m.Archive, 'load_cache', fail)
+    assert 3 == len(list(Box('test', box.directory).all_beads()))
+
+
+def test_malformed_index_is_ignored(box):
+    """Test that a damaged index file only costs time."""
+    with open(box.directory / m.INDEX_FILE_NAME, 'a') as f:
+        f.write('{"torn": ')
+
+    names = sorted(bead.name for bead in Box('test', box.directory).all_beads())
+    assert ['bead1', 'bead2', 'bead2'] == names
+
+
+def test_compaction_drops_obsolete_records(box, monkeypatch):
+    """Test that the index file is rewritten when it has too many obsolete lines."""
+    monkeypatch.setattr(m, 'COMPACTION_MIN_LINES', 0)
+    for bead in list(box.all_beads()):
+        if bead.name == 'bead2':
+            os.remove(bead.archive_path)
+
+    list(Box('test', box.directory).all_beads())
+
+    lines = (box.directory / m.INDEX_FILE_NAME).read_text().splitlines()
+    assert 1 == len(lines)
+
+
+def test_compaction_keeps_records_appended_by_others(box, monkeypatch):
+    """Test that records appended since the compacting reader's last read are not lost."""
+    monkeypatch.setattr(m, 'COMPACTION_MIN_LINES', 0)
+    monkeypatch.setattr(m, 'COMPACTION_RATIO', 0)
+    reader = m.BoxIndex(box.directory)
+    reader.load()
+    live_files = set(reader._records)
+
+    writer = m.BoxIndex(box.directory)
+    writer.load()
+    writer._append(dict(next(iter(writer._records.values())), file='copy.zip'))
+    reader._maybe_compact(live_files)
+
+    index = m.BoxIndex(box.directory)
+    index.load()
+    assert live_files | {'copy.zip'} == set(index._records)
+    assert not [name for name in os.listdir(box.directory) if name.endswith('.tmp')]
+
+
+def test_concurrent_indexing(box):
+    """Test that archives are indexed with multiple workers as well."""
+    write_file(box.directory / 'junk', 'random bits')
+    os.remove(box.directory / m.INDEX_FILE_NAME)
+
+    fresh_box = Box('test', box.directory)
+    names = sorted(bead.name for bead in fresh_box.all_beads(workers=4))
+    assert ['bead1', 'bead2', 'bead2'] == names
+
+    index = m.BoxIndex(box.directory)
+    index.load()
+    assert 4 == len(index._records)
+
+
+def test_records_appended_after_a_torn_line_are_read(box, archives_can_not_be_opened):
+    """Test that a torn line does not hide the records written after it."""
+    index_path = box.directory / m.INDEX_FILE_NAME
+    lines = index_path.read_text().splitlines(keepends=True)
+    index_path.write_text('{"torn": ' + ''.join(lines))
+
+    names = sorted(bead.name for bead in Box('test', box.directory).all_beads())
+    assert ['bead1', 'bead2', 'bead2'] == names
+
+
+def test_refresh_reads_only_new_records(box, tmp_path_factory, archives_can_not_be_opened):
+    """Test that a reader learns about beads stored by others from the journal."""
+    reader = m.BoxIndex(box.directory)
+    reader.load()
+    assert [] == reader.refresh()
+
+    writer = m.BoxIndex(box.directory)
+    (bead1,) = [bead for bead in box.all_beads() if bead.name == 'bead1']
+    writer._append(dict(reader._records[bead1.archive_path.name], file='copy.zip'))
+
+    assert ['copy.zip'] == [record[m.FILE] for record in reader.refresh()]
+    assert [] == reader.refresh()
+
+
+def test_refresh_follows_compaction(box, monkeypatch):
+    """Test that a replaced (compacted) index file is reread."""
+    reader = m.BoxIndex(box.directory)
+    reader.load()
+    monkeypatch.setattr(m, 'COMPACTION_MIN_LINES', 0)
+    monkeypatch.setattr(m, 'COMPACTION_RATIO', 1)
+    (bead1,) = [bead for bead in box.all_beads() if bead.name == 'bead1']
+    os.remove(bead1.archive_path)
+    list(Box('test', box.directory).all_beads())
+
+    assert 2 == len(reader.refresh())
+
+
+@pytest.fixture
+def consumer_box(tmp_path_factory):
+    """Box with bead2 having bead1 as input (under nick 'data')."""
+    box = Box('test', tmp_path_factory.mktemp('box'))
+    ws = Workspace(tmp_path_factory.mktemp('workspace') / 'bead1')
+    ws.create('test-bead1')
+    box.store(ws, '20160704T000000000000+0200')
+    (bead1,) = box.all_beads()
+
+    ws = Workspace(tmp_path_factory.mktemp('workspace') / 'bead2')
+    ws.create('test-bead2')
+    ws.add_input('data', bead1.kind, bead1.content_id, bead1.freeze_time_str)
+    ws.set_input_bead_name('data', 'bead1')
+    box.store(ws, '20160704T162800000000+0200')
+    return box, bead1
+
+
+def test_consumers(consumer_box, archives_can_not_be_opened):
+    """Test that reverse dependencies are answered from the index."""
+    box, bead1 = consumer_box
+    box = Box('test', box.directory)
+
+    assert ['bead2'] == [b.name for b in box.consumers(content_id=bead1.content_id)]
+    assert ['bead2'] == [b.name for b in box.consumers(bead_name='bead1')]
+    assert [] == box.consumers(content_id=bead1.content_id, bead_name='other')
+    assert [] == box.consumers(bead_name='bead2')
+
+
+def test_consumers_sees_new_and_removed_archives(consumer_box, tmp_path_factory):
+    """Test that archives added or removed behind the index's back are noticed."""
+    box, bead1 = consumer_box
+    (bead2,) = box.consumers(content_id=bead1.content_id)
+    copy = box.directory / 'bead3_20160704T162800000000+0200.zip'
+    copy.write_bytes(bead2.archive_path.read_bytes())
+    os.remove(bead2.archive_path)
+
+    assert [copy] == [b.archive_path for b in box.consumers(content_id=bead1.content_id)]
+
+
+def test_pattern_scoped_archives_stat_only_the_matches(box, monkeypatch):
+    """Test that a narrow pattern does not stat every file in the directory."""
+    bead = next(b for b in box.all_beads() if b.name == 'bead1')
+    index = m.BoxIndex(box.directory)
+    index.load()
+    stat_count = 0
+    file_stat = storage._file_stat
+
+    def counting_file_stat(os_stat):
+        nonlocal stat_count
+        stat_count += 1
+        return file_stat(os_stat)
+    monkeypatch.setattr(storage, '_file_stat', counting_file_stat)
+
+    archives = list(index.archives('test', 'bead1_*'))
+
+    assert [bead.content_id] == [archive.content_id for archive in archives]
+    # the archive, its .xmeta and the index file
+    assert stat_count <= 3
@@ -0,0 +1,26 @@
+from .box import Box
+from .workspace import Workspace
+from . import boxstats as m
+
+
+def test_archive_vanishing_after_listing_is_counted_invalid(tmp_path, monkeypatch):
+    """Test that an archive deleted between listing and opening does not stop the stats."""
+    (tmp_path / 'box').mkdir()
+    box = Box('test', tmp_path / 'box')
+    for freeze_time in ('20160704T000000000000+0200', '20160705T000000000000+0200'):
+        ws = Workspace(tmp_path / freeze_time / 'bead1')
+        ws.create('kind')
+        box.store(ws, freeze_time)
+    archive = m.Archive
+
+    def vanishing_archive(path, *args, **kwargs):
+        if '20160704' in path.name:
+            raise FileNotFoundError(path)
+        return archive(path, *args, **kwargs)
+    monkeypatch.setattr(m, 'Archive', vanishing_archive)
+
+    stats = m.box_stats(box, cold=True)
+
+    assert 2 == stats.archives
+    assert 1 == stats.invalid
+    assert {1: 1} == stats.versions_per_name
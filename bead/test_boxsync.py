@@ -0,0 +1,159 @@
+import os
+import threading
+
+import pytest
+
+from . import boxsync as m
+from .box import Box
+from .boxxmeta import stale_archives
+from .tech.fs import write_file
+from .workspace import Workspace
+
+
+@pytest.fixture
+def add_bead(tmp_path_factory):
+    def add_bead(box, name, freeze_time='20160704T000000000000+0200'):
+        ws = Workspace(tmp_path_factory.mktemp('workspace') / name)
+        ws.create('test-' + name)
+        write_file(ws.directory / 'output' / 'data', name * 1000)
+        return box.store(ws, freeze_time)
+    return add_bead
+
+
+@pytest.fixture
+def source(tmp_path_factory, add_bead):
+    box = Box('source', tmp_path_factory.mktemp('source'))
+    add_bead(box, 'bead1')
+    add_bead(box, 'bead2')
+    add_bead(box, 'bead2', '20160704T162800000000+0200')
+    return box
+
+
+@pytest.fixture
+def destination(tmp_path_factory):
+    return Box('destination', tmp_path_factory.mktemp('destination'))
+
+
+def beads(box):
+    return sorted((bead.name, bead.content_id) for bead in Box(box.name, box.location).all_beads())
+
+
+def test_sync_copies_missing_beads(source, destination, add_bead):
+    """Test that only beads missing from destination are copied."""
+    zipfilename = add_bead(destination, 'bead1')
+    os.rename(zipfilename, zipfilename.with_name('renamed_20160704T000000000000+0200.zip'))
+    add_bead(destination, 'bead1')
+
+    result = m.sync(source, destination, workers=2)
+
+    assert 2 == len(result.copied)
+    assert 1 == result.present
+    assert [] == result.failed
+    assert result.bytes_copied > 0
+    assert set(beads(source)) <= set(beads(destination))
+
+
+def test_sync_copies_xmeta(source, destination):
+    """Test that .xmeta files are copied with the archives."""
+    for bead in source.all_beads():
+        bead.save_cache()
+
+    m.sync(source, destination)
+
+    assert 3 == len(list(destination.directory.glob('*.xmeta')))
+    assert ([], 3) == stale_archives(destination)
+    for bead in Box(destination.name, destination.location).all_beads():
+        assert bead.has_fresh_xmeta()
+
+
+def test_sync_into_sharded_box(source, destination):
+    """Test that the layout of the destination is followed."""
+    destination.shard()
+
+    m.sync(source, destination)
+
+    assert 2 == len(list((destination.directory / 'bead2').glob('*.zip')))
+    assert beads(source) == beads(destination)
+
+
+def test_interrupted_copy_is_resumed(source, destination):
+    """Test that a partial copy is continued, not restarted."""
+    (bead1,) = [bead for bead in source.all_beads() if bead.name == 'bead1']
+    partial = destination.directory / (m.SYNC_PREFIX + bead1.archive_path.name)
+    partial.write_bytes(bead1.archive_path.read_bytes()[:100])
+
+    result = m.sync(source, destination)
+
+    assert os.path.getsize(bead1.archive_path) - 100 == (
+        result.bytes_copied - sum(
+            os.path.getsize(bead.archive_path)
+            for bead in result.copied if bead.name == 'bead2'))
+    assert beads(source) == beads(destination)
+    assert not partial.exists()
+
+
+def test_copy_waits_for_the_sync_writing_the_same_file(source, destination):
+    """Test that concurrent syncs do not write into the same temp file."""
+    (bead1,) = [bead for bead in source.all_beads() if bead.name == 'bead1']
+    lock_path = destination.directory / (m.SYNC_PREFIX + bead1.archive_path.name + m.LOCK_SUFFIX)
+    with destination.storage.lock(lock_path):
+        copy = threading.Thread(target=m.copy_bead, args=(bead1, destination))
+        copy.start()
+        copy.join(0.3)
+        assert copy.is_alive()
+        assert [] == list(destination.directory.glob('*.zip'))
+    copy.join()
+    assert [bead1.archive_path.name] == [
+        path.name for path in destination.directory.glob('*.zip')]
+    assert [] == [
+        name for name in os.listdir(destination.directory) if name.startswith(m.SYNC_PREFIX)]
+
+
+def test_corrupt_copy_is_not_published(source, destination):
+    """Test that copies are verified."""
+    (bead1,) = [bead for bead in source.all_beads() if bead.name == 'bead1']
+    partial = destination.directory / (m.SYNC_PREFIX + bead1.archive_path.name)
+    partial.write_bytes(b'garbage' * 100)
+
+    result = m.sync(source, destination)
+
+    assert [bead1.archive_path] == [bead.archive_path for bead, _ in result.failed]
+    assert 'bead1' not in set(name for name, _ in beads(destination))
+    assert not partial.exists()
+
+    # the next sync starts from scratch
+    assert 1 == len(m.sync(source, destination).copied)
+
+
+def test_copy_with_damaged_data_is_not_published(source, destination, monkeypatch):
+    """Test that all files of a copy are checked, not just its manifest."""
+    monkeypatch.setenv('BEAD_ZIP_COMPRESSION', 'stored')
+    ws = Workspace(destination.directory.parent / 'stored')
+    ws.create('test-stored')
+    write_file(ws.directory / 'output' / 'data', '0123456789')
+    zipfilename = source.store(ws, '20160704T000000000000+0200')
+    # a partial copy with the same size, but damaged data
+    partial = destination.directory / (m.SYNC_PREFIX + zipfilename.name)
+    partial.write_bytes(zipfilename.read_bytes().replace(b'0123456789', b'9876543210'))
+
+    result = m.sync(source, destination)
+
+    assert ['stored'] == [bead.name for bead, _ in result.failed]
+    assert 'stored' not in set(name for name, _ in beads(destination))
+
+
+def test_xmeta_of_existing_archive_is_kept(source, destination):
+    """Test that a failed publish does not replace the .xmeta of the archive already there."""
+    (bead1,) = [bead for bead in source.all_beads() if bead.name == 'bead1']
+    bead1.save_cache()
+    existing = destination.directory / bead1.archive_path.name
+    existing.write_bytes(b'another archive')
+    existing.with_suffix('.xmeta').write_bytes(b'its xmeta')
+
+    with pytest.raises(m.BoxError):
+        m.copy_bead(bead1, destination)
+
+    assert b'its xmeta' == existing.with_suffix('.xmeta').read_bytes()
+    # the rejected copy is not left behind
+    assert [] == [
+        name for name in os.listdir(destination.directory) if name.startswith(m.SYNC_PREFIX)]
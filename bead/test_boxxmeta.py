@@ -0,0 +1,114 @@
+import os
+
+import pytest
+
+from .box import Box
+from .boxxmeta import stale_archives, write_xmetas
+from .storage import MemoryStorage
+from .workspace import Workspace
+from . import tech
+
+persistence = tech.persistence
+
+
+@pytest.fixture
+def box(tmp_path):
+    """Create a box with 3 archives, without .xmeta files."""
+    (tmp_path / 'box').mkdir()
+    box = Box('test', tmp_path / 'box')
+    for i, freeze_time in enumerate(
+            ('20160704T000000000000+0200', '20160705T000000000000+0200')):
+        for name in ('bead1', 'bead2')[:i + 1]:
+            ws = Workspace(tmp_path / freeze_time / name)
+            ws.create('kind')
+            box.store(ws, freeze_time)
+    return box
+
+
+def xmetas(box):
+    return sorted(path.name for path in box.directory.glob('*.xmeta'))
+
+
+def test_writes_missing_xmetas_in_processes(box):
+    """Test that all missing .xmeta files are written and reported."""
+    progress = []
+    result = write_xmetas(box, workers=2, on_progress=lambda *args: progress.append(args))
+    assert 3 == result.written
+    assert 0 == result.up_to_date
+    assert [] == result.failed
+    assert 3 == len(xmetas(box))
+    assert [1, 2, 3] == [done for done, total, path, error in progress]
+    assert {3} == {total for done, total, path, error in progress}
+    assert [] == list(box.directory.glob('.bead-xmeta*'))
+
+
+def test_rerun_is_resumed(box):
+    """Test that up-to-date .xmeta files are not written again."""
+    write_xmetas(box, workers=1)
+    stale, up_to_date = stale_archives(box)
+    assert ([], 3) == (stale, up_to_date)
+    assert 0 == write_xmetas(box).written
+
+
+def test_stale_xmeta_is_rewritten_keeping_input_map(box):
+    """Test that an .xmeta not made from its archive is recreated, keeping its input map."""
+    write_xmetas(box, workers=1)
+    archive = sorted(box.directory.glob('*.zip'))[0]
+    xmeta = archive.with_suffix('.xmeta')
+    cache = persistence.loads(xmeta.read_text())
+    cache['input_map'] = {'input': 'mapped'}
+    cache['kind'] = 'broken'
+    xmeta.write_text(persistence.dumps(cache))
+    os.utime(archive, ns=(0, 0))
+
+    assert [archive] == stale_archives(box)[0]
+    assert 1 == write_xmetas(box, workers=1).written
+    cache = persistence.loads(xmeta.read_text())
+    assert {'input': 'mapped'} == cache['input_map']
+    assert 'kind' == cache['kind']
+
+
+def test_newer_xmeta_of_another_archive_file_is_stale(box):
+    """Test that freshness is decided by the fingerprint, not by the modification times."""
+    write_xmetas(box, workers=1)
+    archive = sorted(box.directory.glob('*.zip'))[0]
+    os.utime(archive, ns=(0, 0))
+    assert archive.with_suffix('.xmeta').stat().st_mtime_ns > archive.stat().st_mtime_ns
+
+    assert [archive] == stale_archives(box)[0]
+
+
+def test_version_1_xmeta_is_upgraded(box):
+    """Test that an .xmeta without fingerprint is rewritten with one."""
+    write_xmetas(box, workers=1)
+    archive = sorted(box.directory.glob('*.zip'))[0]
+    xmeta = archive.with_suffix('.xmeta')
+    cache = persistence.loads(xmeta.read_text())
+    del cache['xmeta_version']
+    del cache['fingerprint']
+    xmeta.write_text(persistence.dumps(cache))
+
+    assert [archive] == stale_archives(box)[0]
+    assert 1 == write_xmetas(box, workers=1).written
+    assert 'fingerprint' in persistence.loads(xmeta.read_text())
+
+
+def test_invalid_archive_is_reported(box):
+    """Test that an archive which can not be read is reported as failed."""
+    (box.directory / 'bad_20160706T000000000000+0200.zip').write_bytes(b'not a zip')
+    result = write_xmetas(box, workers=2)
+    assert 3 == result.written
+    assert ['bad_20160706T000000000000+0200.zip'] == [path.name for path, _ in result.failed]
+
+
+def test_memory_storage(tmp_path):
+    """Test writing .xmeta files for a box outside the local file system."""
+    storage = MemoryStorage()
+    box = Box('test', tmp_path / 'box', storage)
+    storage.make_directory(box.directory)
+    ws = Workspace(tmp_path / 'ws')
+    ws.create('kind')
+    archive_path = box.store(ws, '20160704T000000000000+0200')
+
+    assert 1 == write_xmetas(box).written
+    assert storage.exists(archive_path.with_suffix('.xmeta'))
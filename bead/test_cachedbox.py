@@ -0,0 +1,118 @@
+import os
+import shutil
+import threading
+import pytest
+
+from . import cachedbox as m
+from .exceptions import InvalidArchive
+from .tech.timestamp import time_from_user
+from .workspace import Workspace
+from . import spec as bead_spec
+
+
+@pytest.fixture
+def box_dir(tmp_path_factory):
+    """Create a box directory with two beads."""
+    box_dir = tmp_path_factory.mktemp('box')
+    box = m.Box('remote', box_dir)
+
+    def add_bead(name, freeze_time):
+        ws = Workspace(tmp_path_factory.mktemp('workspace') / name)
+        ws.create('test-kind')
+        (ws.directory / 'output' / 'data').write_text(name * 1000)
+        box.store(ws, freeze_time)
+
+    add_bead('bead1', '20160704T000000000000+0200')
+    add_bead('bead2', '20160704T162800000000+0200')
+    return box_dir
+
+
+@pytest.fixture
+def archive_cache(tmp_path_factory):
+    return m.ArchiveCache(tmp_path_factory.mktemp('cache') / 'archives')
+
+
+def cached_bead(box_dir, archive_cache, name):
+    box = m.CachedBox('remote', box_dir, archive_cache)
+    return box.get_context(bead_spec.BEAD_NAME, name, time_from_user('2017')).best
+
+
+def test_archive_content_is_read_from_local_copy(box_dir, archive_cache, tmp_path, monkeypatch):
+    """Test that the archive is copied once and then read locally."""
+    bead = cached_bead(box_dir, archive_cache, 'bead1')
+    bead.validate()
+    # the meta comes from the original, only the zip is cached
+    assert [f'{bead.content_id}.zip'] == os.listdir(archive_cache.directory)
+
+    def no_copy(*args):
+        raise AssertionError('archive copied again')
+    monkeypatch.setattr(m, 'copy_between', no_copy)
+    bead = cached_bead(box_dir, archive_cache, 'bead1')
+    bead.unpack_data_to(tmp_path / 'data')
+    assert 'bead1' * 1000 == (tmp_path / 'data' / 'data').read_text()
+
+
+def test_copy_is_verified(box_dir, archive_cache, monkeypatch):
+    """Test that a copy with a different content_id is not cached."""
+    bead2 = cached_bead(box_dir, archive_cache, 'bead2')
+
+    def copy_another_archive(_source_storage, _source, _destination_storage, destination):
+        with open(bead2.archive_filename, 'rb') as src, open(destination, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+    monkeypatch.setattr(m, 'copy_between', copy_another_archive)
+
+    bead1 = cached_bead(box_dir, archive_cache, 'bead1')
+    with pytest.raises(InvalidArchive):
+        bead1.validate()
+    assert [] == os.listdir(archive_cache.directory)
+
+
+def test_temporary_copies_are_per_thread(box_dir, archive_cache, monkeypatch):
+    """Test that threads filling the cache with the same archive do not share a temp file."""
+    destinations = []
+    copy_between = m.copy_between
+
+    def recording_copy(source_storage, source, destination_storage, destination):
+        destinations.append(destination.name)
+        copy_between(source_storage, source, destination_storage, destination)
+    monkeypatch.setattr(m, 'copy_between', recording_copy)
+
+    cached_bead(box_dir, archive_cache, 'bead1').validate()
+    (destination,) = destinations
+    assert f'.{threading.get_ident()}.' in destination
+
+
+def test_least_recently_used_archive_is_evicted(box_dir, archive_cache):
+    """Test that the cache is kept under its maximum size."""
+    bead1 = cached_bead(box_dir, archive_cache, 'bead1')
+    bead1.validate()
+    archive_cache.max_size = os.path.getsize(bead1.archive_filename) + 1
+    bead1_copy = archive_cache.directory / f'{bead1.content_id}.zip'
+    del bead1
+
+    bead2 = cached_bead(box_dir, archive_cache, 'bead2')
+    bead2.validate()
+
+    assert not bead1_copy.exists()
+    assert (archive_cache.directory / f'{bead2.content_id}.zip').exists()
+
+
+def test_archive_in_use_is_not_evicted(box_dir, archive_cache, tmp_path):
+    """Test that a local copy is not removed under an archive reading it."""
+    bead1 = cached_bead(box_dir, archive_cache, 'bead1')
+    bead1.validate()
+    archive_cache.max_size = 1
+
+    cached_bead(box_dir, archive_cache, 'bead2').validate()
+
+    bead1.unpack_data_to(tmp_path / 'data')
+    assert (archive_cache.directory / f'{bead1.content_id}.zip').exists()
+
+
+def test_timeline_has_cached_archives(box_dir, archive_cache):
+    """Test that versions in the timeline read their content through the cache."""
+    box = m.CachedBox('remote', box_dir, archive_cache)
+    (bead,) = box.timeline('bead1')
+    assert isinstance(bead, m.CachedArchive)
+    bead.validate()
+    assert (archive_cache.directory / f'{bead.content_id}.zip').exists()
@@ -0,0 +1,117 @@
+import os
+
+import pytest
+
+from tests.httpserver import NoRangeRequestHandler, serve
+
+from .box import Box
+from .httpstorage import HTTPStorage, write_listings
+from .tech.timestamp import time_from_user
+from .workspace import Workspace
+from . import spec as bead_spec
+
+
+@pytest.fixture
+def local_box(tmp_path):
+    """Create a box with sample beads, published for HTTP."""
+    (tmp_path / 'www' / 'box').mkdir(parents=True)
+    box = Box('local', tmp_path / 'www' / 'box')
+
+    def add_bead(name, freeze_time, data_size=0):
+        ws = Workspace(tmp_path / freeze_time / name)
+        ws.create('kind-' + name)
+        (ws.directory / 'output' / 'data').write_bytes(os.urandom(data_size))
+        box.store(ws, freeze_time)
+
+    add_bead('bead1', '20160704T000000000000+0200')
+    add_bead('bead1', '20160705T000000000000+0200', data_size=1024 ** 2)
+    add_bead('bead2', '20160704T162800000000+0200')
+    box.shard()
+    list(box.all_beads())
+    box.rebuild_filter()
+    write_listings(box)
+    return box
+
+
+@pytest.fixture
+def server(local_box):
+    with serve(local_box.directory.parent) as server:
+        yield server
+
+
+@pytest.fixture
+def http_box(server):
+    url = f'{server.url}/box'
+    box = Box('web', url, HTTPStorage(url))
+    yield box
+    box.storage.close()
+
+
+def archive_requests(server):
+    return [request for request in server.requests if request[1].endswith('.zip')]
+
+
+def test_queries_are_answered_from_published_files(http_box, server):
+    """Test that queries read the published index, not the archives."""
+    assert ['bead1', 'bead1', 'bead2'] == sorted(bead.name for bead in http_box.all_beads())
+    time = time_from_user('20160704T120000000000+0200')
+    context = http_box.get_context(bead_spec.BEAD_NAME, 'bead1', time)
+    assert '20160704T000000000000+0200' == context.prev.freeze_time_str
+    assert '20160705T000000000000+0200' == context.next.freeze_time_str
+    assert not http_box.may_contain('bead3')
+    assert [] == archive_requests(server)
+
+
+def test_members_are_read_with_range_requests(local_box, http_box, server, tmp_path):
+    """Test that only the needed members of an archive are downloaded."""
+    time = time_from_user('20160706T000000000000+0200')
+    bead = http_box.get_context(bead_spec.BEAD_NAME, 'bead1', time).best
+    archive_size = os.path.getsize(
+        local_box.directory.parent / bead.archive_path.relative_to('/'))
+
+    bead.unpack_code_to(tmp_path / 'code')
+    assert all(range_header for _, _, range_header in archive_requests(server))
+    assert server.bytes_sent < archive_size / 4
+
+    bead.unpack_data_to(tmp_path / 'data')
+    assert 1024 ** 2 == (tmp_path / 'data' / 'data').stat().st_size
+    bead.validate()
+
+
+def test_archives_are_downloaded_once_without_range_support(local_box, tmp_path):
+    """Test that archives are not downloaded for every part, when Range is ignored."""
+    with serve(local_box.directory.parent, NoRangeRequestHandler) as server:
+        url = f'{server.url}/box'
+        box = Box('web', url, HTTPStorage(url))
+        time = time_from_user('20160706T000000000000+0200')
+        bead = box.get_context(bead_spec.BEAD_NAME, 'bead1', time).best
+        bead.unpack_data_to(tmp_path / 'data')
+        box.storage.close()
+    assert 1024 ** 2 == (tmp_path / 'data' / 'data').stat().st_size
+    assert 1 == len(archive_requests(server))
+
+
+def test_connections_are_kept_alive(http_box, server):
+    """Test that requests reuse pooled connections."""
+    for _ in range(3):
+        list(http_box.all_beads())
+        http_box.storage._listings.clear()
+    assert len(server.requests) > 10
+    assert server.connections == 1
+
+
+def test_box_is_read_only(http_box, tmp_path):
+    """Test that storing into a box served over HTTP is refused."""
+    ws = Workspace(tmp_path / 'bead3')
+    ws.create('kind')
+    with pytest.raises(PermissionError):
+        http_box.store(ws, '20160704T162800000000+0200')
+
+
+def test_missing_files(http_box):
+    """Test that missing files are reported like local ones."""
+    storage = http_box.storage
+    with pytest.raises(FileNotFoundError):
+        storage.read_bytes(http_box.directory / 'missing.zip')
+    assert not storage.exists(http_box.directory / 'missing.zip')
+    assert {} == storage.list_files(http_box.directory / 'missing')
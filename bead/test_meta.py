@@ -0,0 +1,45 @@
+import copy
+import pickle
+
+import pytest
+
+from . import meta as m
+
+
+def test_read_only():
+    """Test that read-only meta can not be modified, but its copies can."""
+    meta = m.read_only({'inputs': {'a': {'kind': 'k'}}, 'list': [1]})
+    with pytest.raises(TypeError):
+        meta['kind'] = 'x'
+    with pytest.raises(TypeError):
+        meta['inputs']['a'].update(kind='x')
+    with pytest.raises(AttributeError):
+        meta['list'].append(2)
+
+    copied = copy.deepcopy(meta)
+    copied['inputs']['a']['kind'] = 'x'
+    assert 'k' == meta['inputs']['a']['kind']
+    assert {'inputs': {'a': {'kind': 'k'}}, 'list': (1,)} == meta
+    assert meta == pickle.loads(pickle.dumps(meta))
+
+
+def test_interned_strings_are_shared():
+    """Test that equal strings in metadata records are the same object."""
+    spec1, spec2 = (
+        m.InputSpec(''.join(['in', 'put']), ''.join(['ki', 'nd']), 'id', 'time')
+        for _ in range(2))
+    assert spec1.name is spec2.name
+    assert isinstance(spec1.name, m.InputName)
+    assert spec1.kind is spec2.kind
+    assert m.BeadName.interned('name') is m.BeadName.interned('name')
+    assert m.BeadName.interned('name') is not m.InputName.interned('name')
+    with pytest.raises(ValueError):
+        m.BeadName.interned('a/b')
+
+
+def test_unused_interned_strings_are_forgotten():
+    """Test that interning does not keep names alive."""
+    name = m.BeadName.interned(''.join(['forgotten', '-name']))
+    assert (m.BeadName, 'forgotten-name') in m._interned
+    del name
+    assert (m.BeadName, 'forgotten-name') not in m._interned
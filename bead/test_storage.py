@@ -0,0 +1,189 @@
+import threading
+
+import pytest
+
+from .box import Box, UnionBox
+from .boxsync import sync
+from .exceptions import BoxError
+from .storage import LOCAL, MemoryStorage, copy_between
+from .tech.fs import Path
+from .tech.timestamp import time_from_user
+from .workspace import Workspace
+from . import spec as bead_spec
+
+
+@pytest.fixture(params=['local', 'memory'])
+def storage_and_directory(request, tmp_path):
+    """Provide each storage with a directory in it."""
+    if request.param == 'local':
+        return LOCAL, tmp_path / 'storage'
+    return MemoryStorage(), Path('/storage')
+
+
+def test_storage_files(storage_and_directory):
+    """Test the file operations storages share."""
+    storage, directory = storage_and_directory
+    storage.make_directory(directory / 'sub')
+    assert storage.is_directory(directory)
+    assert ['sub'] == storage.list_directories(directory)
+
+    storage.write_bytes(directory / 'file', b'content')
+    storage.append(directory / 'log', b'line1\n')
+    storage.append(directory / 'log', b'line2\n')
+    assert b'content' == storage.read_bytes(directory / 'file')
+    assert b'line2' == storage.read_range(directory / 'log', 6, 5)
+    assert {'file': 7, 'log': 12} == {
+        name: stat.size for name, stat in storage.list_files(directory).items()}
+
+    with pytest.raises(FileNotFoundError):
+        storage.stat(directory / 'missing')
+    assert not storage.exists(directory / 'missing')
+
+
+def test_removed_lock_file_is_not_locked(tmp_path):
+    """Test that a waiter does not hold a lock file removed by the previous holder."""
+    path = tmp_path / 'lock'
+    locked = []
+
+    def lock():
+        with LOCAL.lock(path):
+            locked.append(path.exists())
+
+    with LOCAL.lock(path):
+        waiter = threading.Thread(target=lock)
+        waiter.start()
+        waiter.join(0.2)
+        assert waiter.is_alive()
+        path.unlink()
+    waiter.join()
+    assert [True] == locked
+
+
+def test_storage_publish_and_replace(storage_and_directory):
+    """Test that publish never overwrites, while replace does."""
+    storage, directory = storage_and_directory
+    storage.make_directory(directory)
+    storage.write_bytes(directory / 'temp', b'1')
+    storage.publish(directory / 'temp', directory / 'file')
+    assert ['file'] == list(storage.list_files(directory))
+
+    storage.write_bytes(directory / 'temp', b'2')
+    with pytest.raises(FileExistsError):
+        storage.publish(directory / 'temp', directory / 'file')
+
+    file_id = storage.stat(directory / 'file').file_id
+    storage.replace(directory / 'temp', directory / 'file')
+    assert b'2' == storage.read_bytes(directory / 'file')
+    assert file_id != storage.stat(directory / 'file').file_id
+    storage.remove(directory / 'file')
+    assert {} == storage.list_files(directory)
+
+
+def test_storage_lock_excludes_other_holders(storage_and_directory):
+    """Test that an exclusive lock waits for the shared one to be released."""
+    storage, directory = storage_and_directory
+    storage.make_directory(directory)
+    events = []
+
+    def lock_exclusively():
+        with storage.lock(directory / 'lock'):
+            events.append('exclusive')
+
+    with storage.lock(directory / 'lock', exclusive=False):
+        thread = threading.Thread(target=lock_exclusively)
+        thread.start()
+        thread.join(0.1)
+        events.append('shared released')
+    thread.join()
+    assert ['shared released', 'exclusive'] == events
+
+
+def test_memory_directory_changes_when_files_are_added_or_removed():
+    """Test that directory modification times follow their entries."""
+    storage = MemoryStorage()
+    storage.make_directory(Path('/box'))
+    mtime_ns = storage.stat(Path('/box')).mtime_ns
+    storage.write_bytes(Path('/box/file'), b'')
+    assert mtime_ns < storage.stat(Path('/box')).mtime_ns
+
+    mtime_ns = storage.stat(Path('/box')).mtime_ns
+    storage.write_bytes(Path('/box/file'), b'rewritten in place')
+    assert mtime_ns == storage.stat(Path('/box')).mtime_ns
+
+    storage.remove(Path('/box/file'))
+    assert mtime_ns < storage.stat(Path('/box')).mtime_ns
+
+
+def test_copy_between_storages(tmp_path):
+    """Test copying files between local and memory storages."""
+    memory = MemoryStorage()
+    memory.make_directory(Path('/box'))
+    (tmp_path / 'source').write_bytes(b'content')
+    assert 7 == copy_between(LOCAL, tmp_path / 'source', memory, Path('/box/file'))
+    assert 7 == copy_between(memory, Path('/box/file'), LOCAL, tmp_path / 'copy')
+    assert b'content' == (tmp_path / 'copy').read_bytes()
+
+
+@pytest.fixture
+def memory_box(tmp_path):
+    """Create a box in memory with sample beads."""
+    storage = MemoryStorage()
+    storage.make_directory(Path('/box'))
+    box = Box('memory', Path('/box'), storage)
+
+    def add_bead(name, kind, freeze_time):
+        ws = Workspace(tmp_path / freeze_time / name)
+        ws.create(kind)
+        box.store(ws, freeze_time)
+
+    add_bead('bead1', 'test-bead1', '20160704T000000000000+0200')
+    add_bead('bead1', 'test-bead1', '20160705T000000000000+0200')
+    add_bead('bead2', 'test-bead2', '20160704T162800000000+0200')
+    return box
+
+
+def test_memory_box(memory_box, tmp_path):
+    """Test that a box in memory answers queries like a local box."""
+    assert ['bead1', 'bead1', 'bead2'] == sorted(b.name for b in memory_box.all_beads())
+    assert not (tmp_path / 'box').exists()
+
+    time = time_from_user('20160704T120000000000+0200')
+    context = memory_box.get_context(bead_spec.BEAD_NAME, 'bead1', time)
+    assert context.prev.freeze_time_str == '20160704T000000000000+0200'
+    assert context.next.freeze_time_str == '20160705T000000000000+0200'
+
+    bead = context.best
+    assert bead.content_id == memory_box.find_bead('bead1', bead.content_id).content_id
+    assert memory_box.may_contain('bead1')
+    assert not memory_box.may_contain('bead3')
+
+    bead.validate()
+    bead.unpack_code_to(tmp_path / 'unpacked')
+    assert (tmp_path / 'unpacked').is_dir()
+
+
+def test_memory_box_store_does_not_overwrite(memory_box, tmp_path):
+    """Test that storing the same freeze time again is refused."""
+    ws = Workspace(tmp_path / '20160704T000000000000+0200' / 'bead1')
+    with pytest.raises(BoxError):
+        memory_box.store(ws, '20160704T000000000000+0200')
+    assert 3 == len(list(memory_box.all_beads()))
+
+
+def test_memory_box_shard(memory_box):
+    """Test that a box in memory can be sharded."""
+    assert 3 == memory_box.shard()
+    assert memory_box.is_sharded
+    assert ['bead1', 'bead2'] == memory_box.storage.list_directories(memory_box.directory)
+    assert 2 == len(list(memory_box.timeline('bead1')))
+
+
+def test_sync_between_local_and_memory_boxes(memory_box, tmp_path):
+    """Test that beads are copied between storages."""
+    (tmp_path / 'local').mkdir()
+    local_box = Box('local', tmp_path / 'local')
+    assert 3 == len(sync(memory_box, local_box).copied)
+    assert 0 == len(sync(local_box, memory_box).copied)
+
+    union = UnionBox([memory_box, local_box])
+    assert 6 == len(list(union.all_beads()))
@@ -0,0 +1,81 @@
+import pytest
+
+from .bead import Bead
+from .tech.timestamp import time_from_timestamp
+from .timeline import Timeline
+
+
+class FakeBead(Bead):
+    def __init__(self, freeze_time_str, content_id=None):
+        self.name = 'bead'
+        self.freeze_time_str = freeze_time_str
+        self.content_id = content_id or freeze_time_str
+
+
+T1 = '20160704T000000000000+0200'
+T2 = '20160704T162800000000+0200'
+T3 = '20160704T162800000001+0200'
+# T2 in another time zone
+T2_UTC = '20160704T142800000000+0000'
+
+
+def time(timestamp_str):
+    return time_from_timestamp(timestamp_str)
+
+
+def test_context_between_versions():
+    """Test finding the neighbours of a time with no version."""
+    timeline = Timeline([FakeBead(T3), FakeBead(T1)])
+
+    context = timeline.context(time(T2))
+
+    assert context.bead is None
+    assert context.prev.freeze_time_str == T1
+    assert context.next.freeze_time_str == T3
+
+
+def test_context_exact_match():
+    """Test finding a version by its freeze time, even in another time zone."""
+    timeline = Timeline([FakeBead(T1), FakeBead(T2_UTC), FakeBead(T3)])
+
+    context = timeline.context(time(T2))
+
+    assert context.bead.freeze_time_str == T2_UTC
+    assert context.prev.freeze_time_str == T1
+    assert context.next.freeze_time_str == T3
+
+
+def test_context_at_the_ends():
+    """Test times before the first and after the last version."""
+    timeline = Timeline([FakeBead(T2)])
+
+    assert timeline.context(time(T1)).prev is None
+    assert timeline.context(time(T1)).best.freeze_time_str == T2
+    assert timeline.context(time(T3)).next is None
+
+
+def test_empty_timeline():
+    with pytest.raises(LookupError):
+        Timeline().context(time(T1))
+
+
+def test_merge():
+    """Test merging timelines, e.g. from multiple boxes."""
+    merged = Timeline([FakeBead(T1), FakeBead(T3)]).merge(Timeline([FakeBead(T2)]))
+
+    assert [T1, T2, T3] == [bead.freeze_time_str for bead in merged]
+
+
+def test_same_bead_in_multiple_boxes():
+    """Test that copies of the same bead do not conflict."""
+    merged = Timeline([FakeBead(T2)]).merge(Timeline([FakeBead(T2)]))
+
+    assert 2 == len(merged)
+    assert merged.context(time(T2)).bead.freeze_time_str == T2
+
+
+def test_add():
+    timeline = Timeline([FakeBead(T1), FakeBead(T3)])
+    timeline.add(FakeBead(T2))
+
+    assert [T1, T2, T3] == [bead.freeze_time_str for bead in timeline]
@@ -249,6 +249,37 @@ def test_load_loading_more_than_one_bead(load_workspace, tmp_path_factory):
     assert load_workspace.has_input('bead2')
 
 
+def test_load_verified_replaces_loaded_data(load_workspace, tmp_path_factory):
+    """Test that a verified load replaces the data already loaded."""
+    _load_a_bead(load_workspace, 'bead1', tmp_path_factory)
+    path = tmp_path_factory.mktemp('load_new') / 'new.zip'
+    make_bead(path, {'output/new': b'new data'}, tmp_path_factory)
+
+    load_workspace.load('bead1', Archive(path), verify=True)
+
+    root = load_workspace.directory / 'input/bead1'
+    assert ['new'] == [f.name for f in root.iterdir()]
+    assert ['bead1'] == os.listdir(load_workspace.directory / 'input')
+
+
+def test_load_verified_keeps_loaded_data_for_damaged_bead(
+    load_workspace, tmp_path_factory, monkeypatch
+):
+    """Test that a damaged bead does not replace the data already loaded."""
+    _load_a_bead(load_workspace, 'bead1', tmp_path_factory)
+    monkeypatch.setenv('BEAD_ZIP_COMPRESSION', 'stored')
+    path = tmp_path_factory.mktemp('load_damaged') / 'damaged.zip'
+    make_bead(path, {'output/new': b'0123456789'}, tmp_path_factory)
+    path.write_bytes(path.read_bytes().replace(b'0123456789', b'9876543210'))
+
+    with pytest.raises(InvalidArchive):
+        load_workspace.load('bead1', Archive(path), verify=True)
+
+    root = load_workspace.directory / 'input/bead1'
+    assert b'data for bead1' == (root / 'output1').read_bytes()
+    assert ['bead1'] == os.listdir(load_workspace.directory / 'input')
+
+
 @pytest.fixture
 def input_nick():
     """Provide a test input nickname."""
@@ -0,0 +1,212 @@
+import os
+import stat
+import threading
+
+import pytest
+
+from .exceptions import InvalidArchive
+from .workspace import Workspace
+from . import ziparchive as m
+
+
+@pytest.fixture
+def archive_path(tmp_path, monkeypatch):
+    """Create an archive with stored (easy to damage) data files."""
+    monkeypatch.setenv('BEAD_ZIP_COMPRESSION', 'stored')
+    ws = Workspace(tmp_path / 'ws')
+    ws.create('kind')
+    for i in range(20):
+        (ws.directory / 'output' / f'file{i:02}').write_bytes(f'{i:010}'.encode() * (i + 1) * 100)
+    path = tmp_path / 'ws_20160704T000000000000+0200.zip'
+    ws.pack(path, freeze_time='20160704T000000000000+0200', comment='')
+    return path
+
+
+def damage(path, i):
+    content = path.read_bytes()
+    path.write_bytes(content.replace(f'{i:010}'.encode(), f'{i:010}'[::-1].encode()))
+
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_validate(archive_path, workers):
+    m.ZipArchive(archive_path).validate(workers)
+
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_validate_reports_damaged_file(archive_path, workers):
+    damage(archive_path, 7)
+    with pytest.raises(InvalidArchive) as e:
+        m.ZipArchive(archive_path).validate(workers)
+    assert (archive_path, 'data/file07') == e.value.args
+
+
+def test_read_errors_are_not_reported_as_damage(archive_path, monkeypatch):
+    def unreadable(*args):
+        raise OSError('I/O error')
+    monkeypatch.setattr(m.securehash, 'file', unreadable)
+    with pytest.raises(OSError):
+        m.ZipArchive(archive_path).validate()
+
+
+def test_files_are_hashed_in_parallel_threads(archive_path, monkeypatch):
+    threads = []
+    first_bad_file = m.ZipArchive._first_bad_file
+
+    def recording_first_bad_file(self, *args):
+        threads.append(threading.current_thread())
+        return first_bad_file(self, *args)
+    monkeypatch.setattr(m.ZipArchive, '_first_bad_file', recording_first_bad_file)
+    monkeypatch.setenv(m.VALIDATE_WORKERS_ENV, '3')
+
+    m.ZipArchive(archive_path).validate()
+    assert 3 == len(threads)
+    assert threading.main_thread() not in threads
+
+
+def test_stopped_hashing(archive_path):
+    """Test that hashing stops before the next file, when another thread found a bad one."""
+    damage(archive_path, 0)
+    ziparchive = m.ZipArchive(archive_path)
+    stop = threading.Event()
+    stop.set()
+    assert ziparchive._first_bad_file(['data/file00'], ziparchive.manifest, stop) is None
+
+
+def test_balanced_batches():
+    sizes = {'big': 10 * 2**20, 'medium': 5 * 2**20, 'small1': 1, 'small2': 1, 'small3': 1}
+    batches = m._balanced_batches(sizes, 2)
+    assert [['big'], ['medium', 'small1', 'small2', 'small3']] == batches
+    assert [['big']] == m._balanced_batches({'big': 1}, 4)
+
+
+def test_validate_workers(monkeypatch):
+    monkeypatch.setenv(m.VALIDATE_WORKERS_ENV, '5')
+    assert 5 == m.validate_workers()
+    monkeypatch.setenv(m.VALIDATE_WORKERS_ENV, 'many')
+    assert m.DEFAULT_VALIDATE_WORKERS == m.validate_workers()
+    monkeypatch.delenv(m.VALIDATE_WORKERS_ENV)
+    assert m.DEFAULT_VALIDATE_WORKERS == m.validate_workers()
+
+
+def test_extract_dirs_verified(archive_path, tmp_path):
+    target = tmp_path / 'target'
+    m.ZipArchive(archive_path).extract_dirs_verified([('data', target)])
+    assert b'0000000007' * 800 == (target / 'file07').read_bytes()
+    assert 20 == len(list(target.iterdir()))
+
+
+def test_extract_dirs_verified_removes_extracted_files_of_damaged_archive(archive_path, tmp_path):
+    damage(archive_path, 7)
+    target = tmp_path / 'target'
+    with pytest.raises(InvalidArchive) as e:
+        m.ZipArchive(archive_path).extract_dirs_verified([('data', target)])
+    assert (archive_path, 'data/file07') == e.value.args
+    assert not target.exists()
+
+
+def test_failing_cleanup_does_not_hide_damage(archive_path, tmp_path, monkeypatch):
+    damage(archive_path, 7)
+
+    def not_writable(path):
+        raise PermissionError(path)
+    monkeypatch.setattr(m.tech.fs, 'make_writable', not_writable)
+    with pytest.raises(InvalidArchive):
+        m.ZipArchive(archive_path).extract_dirs_verified(
+            [('data', tmp_path / 'target')], readonly=True)
+
+
+def test_extract_dirs_verified_checks_files_not_extracted(archive_path, tmp_path):
+    damage(archive_path, 7)
+    existing = tmp_path / 'existing'
+    existing.mkdir()
+    (existing / 'keep').write_bytes(b'')
+    with pytest.raises(InvalidArchive) as e:
+        m.ZipArchive(archive_path).extract_dirs_verified([('code', existing)])
+    assert (archive_path, 'data/file07') == e.value.args
+    assert ['keep'] == [path.name for path in existing.iterdir()]
+
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_extract_dir(archive_path, tmp_path, workers):
+    target = tmp_path / 'target'
+    m.ZipArchive(archive_path).extract_dir('data', target, workers)
+    for i in range(20):
+        assert f'{i:010}'.encode() * (i + 1) * 100 == (target / f'file{i:02}').read_bytes()
+
+
+@pytest.mark.parametrize('compression', ['stored', 'deflated'])
+@pytest.mark.parametrize('verified', [False, True])
+def test_extracted_line_ends_are_kept(tmp_path, monkeypatch, compression, verified):
+    monkeypatch.setenv('BEAD_ZIP_COMPRESSION', compression)
+    content = b'line\nother line\r\n\n\r' * 1000
+    ws = Workspace(tmp_path / 'ws')
+    ws.create('kind')
+    (ws.directory / 'output' / 'lines').write_bytes(content)
+    path = tmp_path / 'ws_20160704T000000000000+0200.zip'
+    ws.pack(path, freeze_time='20160704T000000000000+0200', comment='')
+    target = tmp_path / 'target'
+    if verified:
+        m.ZipArchive(path).extract_dirs_verified([('data', target)])
+    else:
+        m.ZipArchive(path).extract_dir('data', target, workers=2)
+    assert content == (target / 'lines').read_bytes()
+
+
+def test_extract_dir_readonly(archive_path, tmp_path):
+    target = tmp_path / 'target'
+    m.ZipArchive(archive_path).extract_dir('data', target, readonly=True)
+    for path in [target, *target.iterdir()]:
+        assert not os.stat(path).st_mode & stat.S_IWUSR
+    # can be removed
+    m.tech.fs.rmtree(target)
+
+
+def test_files_are_extracted_in_parallel_threads(archive_path, tmp_path, monkeypatch):
+    threads = []
+    extract_batch = m.ZipArchive._extract_batch
+
+    def recording_extract_batch(self, *args):
+        threads.append(threading.current_thread())
+        return extract_batch(self, *args)
+    monkeypatch.setattr(m.ZipArchive, '_extract_batch', recording_extract_batch)
+
+    m.ZipArchive(archive_path).extract_dir('data', tmp_path / 'target', workers=3)
+    assert 3 == len(threads)
+    assert threading.main_thread() not in threads
+
+
+def test_stored_files_are_copied_without_reading_them(archive_path, tmp_path, monkeypatch):
+    ziparchive = m.ZipArchive(archive_path)
+    ziparchive.members
+
+    def fail(*args):
+        raise AssertionError('member is read')
+    monkeypatch.setattr(m, 'open_member', fail)
+
+    ziparchive.extract_file('data/file07', tmp_path / 'file07')
+    ziparchive.extract_dir('data', tmp_path / 'data', workers=2)
+
+    content = b'0000000007' * 800
+    assert content == (tmp_path / 'file07').read_bytes()
+    assert content == (tmp_path / 'data' / 'file07').read_bytes()
+
+
+def test_members_are_read_through_one_archive_file_per_batch(archive_path, tmp_path, monkeypatch):
+    ziparchive = m.ZipArchive(archive_path)
+    manifest = ziparchive.manifest
+    names = sorted(manifest)
+    ziparchive.members
+    files = {name: tmp_path / name.replace('/', '_') for name in names}
+    opened = []
+    open_file = type(ziparchive.storage).open
+
+    def recording_open(storage, path):
+        opened.append(path)
+        return open_file(storage, path)
+    monkeypatch.setattr(type(ziparchive.storage), 'open', recording_open)
+
+    assert ziparchive._first_bad_file(names, manifest, m._Stop()) is None
+    assert 1 == len(opened)
+    assert ziparchive._extract_batch(names, files, False, None, m._Stop()) is None
+    assert 2 == len(opened)
+    assert b'0000000007' * 800 == files['data/file07'].read_bytes()
@@ -0,0 +1,116 @@
+import struct
+import zipfile
+
+import pytest
+
+from .storage import LOCAL
+from . import zipdirectory as m
+from . import zipmembers
+
+
+def write_zip(path, names, comment=b''):
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as z:
+        z.comment = comment
+        for name in names:
+            z.writestr(name, f'content of {name}'.encode())
+
+
+def zipfile_members(z: zipfile.ZipFile, manifest):
+    '''
+    Member table as zipfile sees it - what the central directory reader must find.
+    '''
+    return {
+        info.filename: zipmembers.Member(
+            info.filename, info.header_offset, info.compress_type, info.compress_size,
+            info.file_size, info.CRC, manifest.get(info.filename))
+        for info in z.infolist()}
+
+
+def expected_members(path):
+    with zipfile.ZipFile(path) as z:
+        return zipfile_members(z, {})
+
+
+@pytest.mark.parametrize('comment', [b'', b'a comment'])
+def test_find(tmp_path, comment):
+    path = tmp_path / 'test.zip'
+    # 'meta/bead' is also part of the other names
+    write_zip(path, ['data/meta/bead', 'meta/bead', 'meta/bead2', 'Árvíztűrő'], comment)
+
+    directory = m.CentralDirectory.read(LOCAL, path)
+
+    assert list(expected_members(path).values()) == [
+        directory.find(name) for name in directory.names()]
+    assert 'meta/bead' == directory.find('meta/bead').name
+    assert directory.find('meta') is None
+    assert directory.find('missing') is None
+
+
+def test_member_found_can_be_read(tmp_path):
+    path = tmp_path / 'test.zip'
+    write_zip(path, ['a', 'b'])
+
+    member = m.CentralDirectory.read(LOCAL, path).find('b')
+
+    with zipmembers.open_member(LOCAL, path, member) as f:
+        assert b'content of b' == f.read()
+
+
+def test_prepended_data(tmp_path):
+    write_zip(tmp_path / 'test.zip', ['a', 'b'])
+    path = tmp_path / 'prepended.zip'
+    path.write_bytes(b'#!/bin/sh\n' + (tmp_path / 'test.zip').read_bytes())
+
+    directory = m.CentralDirectory.read(LOCAL, path)
+
+    assert expected_members(path)['b'] == directory.find('b')
+
+
+def test_zip64_end_record(tmp_path):
+    path = tmp_path / 'test.zip'
+    with zipfile.ZipFile(path, 'w') as z:
+        for i in range(0x10001):
+            z.writestr(f'file{i}', b'')
+
+    directory = m.CentralDirectory.read(LOCAL, path)
+
+    assert 0x10001 == len(directory)
+    assert expected_members(path)['file65536'] == directory.find('file65536')
+
+
+def test_zip64_values():
+    extra = struct.pack('<HH4s', 0x7075, 4, b'junk') + struct.pack('<HHQQ', 1, 16, 2**33, 2**34)
+    assert [2**33, 100, 2**34] == m._zip64_values(extra, m.ZIP64_MARKER, 100, m.ZIP64_MARKER)
+    with pytest.raises(zipfile.BadZipFile):
+        m._zip64_values(b'', m.ZIP64_MARKER, 100, 0)
+
+
+def test_not_a_zip(tmp_path):
+    path = tmp_path / 'test.zip'
+    path.write_bytes(b'not a zip file')
+    with pytest.raises(zipfile.BadZipFile):
+        m.CentralDirectory.read(LOCAL, path)
+
+
+def test_truncated_directory(tmp_path):
+    path = tmp_path / 'test.zip'
+    write_zip(path, ['a', 'b'])
+    with zipfile.ZipFile(path) as z:
+        start_dir = z.start_dir
+    content = path.read_bytes()
+    path.write_bytes(content[:start_dir + 10] + content[start_dir + 20:])
+    with pytest.raises(zipfile.BadZipFile):
+        m.CentralDirectory.read(LOCAL, path)
+
+
+def test_members(tmp_path):
+    path = tmp_path / 'test.zip'
+    write_zip(path, ['a', 'b'])
+    with zipfile.ZipFile(path) as z:
+        expected = zipfile_members(z, {'a': 'hash'})
+        start_dir = z.start_dir
+
+    directory = m.CentralDirectory.read(LOCAL, path)
+
+    assert expected == directory.members({'a': 'hash'})
+    assert start_dir == directory.offset
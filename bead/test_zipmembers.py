@@ -0,0 +1,95 @@
+import io
+import os
+import zipfile
+
+import pytest
+
+from .storage import LOCAL
+from .zipdirectory import CentralDirectory
+from . import zipmembers as m
+
+
+CONTENT = os.urandom(100 * 1024) + b'compressible' * 100 * 1024
+
+
+@pytest.fixture
+def archive(tmp_path):
+    path = tmp_path / 'archive.zip'
+    with zipfile.ZipFile(path, 'w') as z:
+        z.writestr('stored', CONTENT, compress_type=zipfile.ZIP_STORED)
+        z.writestr('deflated', CONTENT, compress_type=zipfile.ZIP_DEFLATED)
+        z.writestr('ünicode', b'', compress_type=zipfile.ZIP_DEFLATED)
+        z.writestr('bzip2', b'bzip2', compress_type=zipfile.ZIP_BZIP2)
+    return path
+
+
+def members(path):
+    return CentralDirectory.read(LOCAL, path).members({'stored': 'hash'})
+
+
+def read(path, member):
+    with m.open_member(LOCAL, path, member) as f:
+        return f.read()
+
+
+def test_members_are_read_directly(archive):
+    """Test that stored and deflated members are read without the zip directory."""
+    table = members(archive)
+    assert CONTENT == read(archive, table['stored'])
+    assert CONTENT == read(archive, table['deflated'])
+    assert b'' == read(archive, table['ünicode'])
+    assert 'hash' == table['stored'].hash
+    assert table['deflated'].hash is None
+
+
+def test_unsupported_compression(archive):
+    with pytest.raises(NotImplementedError):
+        m.open_member(LOCAL, archive, members(archive)['bzip2'])
+
+
+def test_wrong_offset(archive):
+    """Test that a member not at its offset is noticed."""
+    table = members(archive)
+    moved = m.Member.from_list(
+        ['deflated', table['stored'].header_offset] + table['deflated'].as_list()[2:])
+    with pytest.raises(zipfile.BadZipFile):
+        m.open_member(LOCAL, archive, moved)
+
+
+def test_damaged_content(archive):
+    """Test that damaged content is noticed by its CRC."""
+    member = members(archive)['stored']
+    with open(archive, 'r+b') as f:
+        f.seek(member.header_offset + m.LOCAL_HEADER_SIZE + len('stored') + 1000)
+        f.write(b'X')
+    with pytest.raises(zipfile.BadZipFile):
+        read(archive, member)
+
+
+def test_stored_member_is_copied(archive, tmp_path):
+    """Test that a stored member is copied directly to a file."""
+    table = members(archive)
+    target = tmp_path / 'target'
+    with target.open('wb') as f:
+        m.copy_stored_member(LOCAL, archive, table['stored'], f)
+    assert CONTENT == target.read_bytes()
+    with pytest.raises(ValueError):
+        m.copy_stored_member(LOCAL, archive, table['deflated'], io.BytesIO())
+
+
+def test_truncated_stored_member(archive, tmp_path):
+    table = members(archive)
+    archive.write_bytes(archive.read_bytes()[:table['stored'].header_offset + 1000])
+    with pytest.raises(zipfile.BadZipFile):
+        m.copy_stored_member(LOCAL, archive, table['stored'], io.BytesIO())
+
+
+def test_table_round_trip(archive):
+    table = members(archive)
+    assert table == m.load_members(m.dump_members(table))
+
+
+@pytest.mark.parametrize('table', [{}, [['name']], [['name', 0, 0, 0, 0, 'crc', None]]])
+def test_malformed_table(table):
+    with pytest.raises(ValueError):
+        m.load_members(table)
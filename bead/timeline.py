@@ -0,0 +1,106 @@
+'''
+Versions of beads ordered by freeze time.
+
+Navigating between versions (--prev, --next, --time) is a bisect on
+pre-parsed, integer freeze times instead of comparing parsed datetimes one by one.
+Timelines of the same name from multiple boxes can be merged.
+'''
+
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+import heapq
+from operator import itemgetter
+from typing import Callable, Iterable, Iterator, List
+
+from .bead import Bead
+from .tech.timestamp import microseconds_from_time, microseconds_from_timestamp
+
+
+class BeadContext:
+    def __init__(self, time, bead, prev, next):
+        assert bead is None or bead.freeze_time == time
+        assert prev is None or prev.freeze_time < time
+        assert next is None or next.freeze_time > time
+        assert bead or prev or next
+        self.time = time
+        self.bead = bead
+        self.prev = prev
+        self.next = next
+
+    @property
+    def best(self):
+        if self.bead:
+            return self.bead
+        if not self.prev:
+            return self.next
+        if not self.next:
+            return self.prev
+        if self.time - self.prev.freeze_time < self.next.freeze_time - self.time:
+            return self.prev
+        return self.next
+
+
+class Timeline:
+    '''
+    I am a sequence of beads sorted by freeze time.
+    '''
+
+    def __init__(self, beads: Iterable[Bead] = ()):
+        entries = sorted(
+            ((microseconds_from_timestamp(bead.freeze_time_str), bead) for bead in beads),
+            key=itemgetter(0))
+        self._times: List[int] = [time for time, _ in entries]
+        self._beads: List[Bead] = [bead for _, bead in entries]
+
+    def __len__(self):
+        return len(self._beads)
+
+    def __iter__(self) -> Iterator[Bead]:
+        return iter(self._beads)
+
+    def add(self, bead: Bead):
+        time = microseconds_from_timestamp(bead.freeze_time_str)
+        index = bisect_right(self._times, time)
+        self._times.insert(index, time)
+        self._beads.insert(index, bead)
+
+    def map(self, function: Callable[[Bead], Bead]) -> 'Timeline':
+        '''
+        New timeline with function(bead) for each bead - keeping their freeze times.
+        '''
+        mapped = Timeline()
+        mapped._times = list(self._times)
+        mapped._beads = [function(bead) for bead in self._beads]
+        return mapped
+
+    def merge(self, other: 'Timeline') -> 'Timeline':
+        '''
+        New timeline with the beads of both timelines.
+        '''
+        merged = Timeline()
+        for time, bead in heapq.merge(
+                zip(self._times, self._beads), zip(other._times, other._beads),
+                key=itemgetter(0)):
+            merged._times.append(time)
+            merged._beads.append(bead)
+        return merged
+
+    def context(self, time: datetime) -> BeadContext:
+        '''
+        Beads frozen at, right before and right after time.
+
+        raises LookupError if the timeline is empty.
+        '''
+        microseconds = microseconds_from_time(time)
+        start = bisect_left(self._times, microseconds)
+        end = bisect_right(self._times, microseconds, lo=start)
+        prev = self._beads[start - 1] if start > 0 else None
+        next = self._beads[end] if end < len(self._beads) else None
+        match = None
+        for bead in self._beads[start:end]:
+            assert match is None or match.content_id == bead.content_id, (
+                'multiple beads with same freeze time')
+            match = bead
+        if match or prev or next:
+            return BeadContext(time, match, prev, next)
+        raise LookupError
@@ -9,6 +9,7 @@ from . import layouts
 from . import meta
 from . import tech
 from .bead import Bead
+from .storage import BOOKKEEPING_PREFIX
 
 # technology modules
 persistence = tech.persistence
@@ -180,20 +181,31 @@ class Workspace(Bead):
         input_map[input_nick] = bead_name
         self.input_map = input_map
 
-    def load(self, input_nick, bead):
+    def load(self, input_nick, bead, verify=False):
         '''
         Make output data files in bead available under input directory
+
+        With verify the bead is validated while its data is extracted (see Archive.validate),
+        and the data already loaded is replaced only when the bead is intact.
+        raises InvalidArchive
         '''
         input_dir = self.directory / layouts.Workspace.INPUT
         fs.make_writable(input_dir)
         try:
+            destination_dir = input_dir / input_nick
+            if verify:
+                temp_dir = input_dir / f'{BOOKKEEPING_PREFIX}load.{input_nick}'
+                if os.path.exists(temp_dir):
+                    fs.rmtree(temp_dir)
+                bead.extract_dirs_verified([(layouts.Archive.DATA, temp_dir)], readonly=True)
+                if os.path.exists(destination_dir):
+                    fs.rmtree(destination_dir)
+                os.rename(temp_dir, destination_dir)
+            else:
+                bead.extract_dir(layouts.Archive.DATA, destination_dir, readonly=True)
             self.add_input(
                 input_nick,
                 bead.kind, bead.content_id, bead.freeze_time_str)
-            destination_dir = input_dir / input_nick
-            bead.unpack_data_to(destination_dir)
-            for f in fs.all_subpaths(destination_dir):
-                fs.make_readonly(f)
         finally:
             fs.make_readonly(input_dir)
 
@@ -1,13 +1,24 @@
-from copy import deepcopy
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import heapq
+import io
 import os
 import shutil
+import threading
+from typing import (
+    IO, BinaryIO, Callable, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple)
+from zipfile import ZIP_STORED, ZipFile
+import zlib
 
+from tracelog import TRACELOG
 from .bead import UnpackableBead
 from .exceptions import InvalidArchive
 from . import tech
 from . import layouts
 from . import meta
 from . import zipopener
+from .storage import LOCAL, Storage
+from .zipdirectory import CentralDirectory
+from .zipmembers import Member, SUPPORTED_COMPRESS_TYPES, copy_stored_member, open_member
 
 # technology modules
 timestamp = tech.timestamp
@@ -23,23 +34,122 @@ META_KEYS = (
     meta.INPUTS
 )
 
+# number of threads hashing member contents in validate() and extracting members,
+# can be overridden in the environment
+VALIDATE_WORKERS_ENV = 'BEAD_VALIDATE_WORKERS'
+DEFAULT_VALIDATE_WORKERS = min(8, os.cpu_count() or 1)
+# per member cost of hashing/extracting in bytes - for balancing many small members
+MEMBER_OVERHEAD = 64 * 1024
 
-class ZipArchive(UnpackableBead):
 
-    def __init__(self, filename, box_name=''):
+def validate_workers() -> int:
+    try:
+        return max(1, int(os.environ[VALIDATE_WORKERS_ENV]))
+    except (KeyError, ValueError):
+        return DEFAULT_VALIDATE_WORKERS
+
+
+class ZipArchive(UnpackableBead):
+    '''
+    With a member table (see zipmembers.py) members are read directly,
+    without parsing the zip directory.
+    Without one, single members (meta, manifest) are looked up in the raw zip directory
+    (see zipdirectory.py).
+    '''
+
+    def __init__(
+        self, filename, box_name='', storage: Storage = LOCAL,
+        members: Optional[Dict[str, Member]] = None,
+    ):
         self.archive_filename = filename
         self.box_name = box_name
+        self.storage = storage
+        self._members = members
+        self._central_directory: Optional[CentralDirectory] = None
         self._meta = self._load_meta()
         self._content_id = None
 
     @property
     def zipfile(self):
         try:
-            return zipopener.open(self.archive_filename)
+            return zipopener.open(self.archive_filename, self.storage)
         except (zipopener.BadZipFile, OSError, IOError):
             raise InvalidArchive(self.archive_filename)
 
-    def validate(self):
+    @property
+    def members(self) -> Dict[str, Member]:
+        '''
+        Member table - built from the zip directory, if it was not given.
+        '''
+        if self._members is None:
+            try:
+                manifest = self.manifest
+            except (KeyError, ValueError):
+                manifest = {}
+            if not isinstance(manifest, dict):
+                manifest = {}
+            try:
+                self._members = self.central_directory.members(manifest)
+            except zipopener.BadZipFile:
+                raise InvalidArchive(self.archive_filename)
+        return self._members
+
+    @property
+    def central_directory_offset(self) -> int:
+        return self.central_directory.offset
+
+    @property
+    def central_directory(self) -> CentralDirectory:
+        '''
+        The raw zip directory - for looking up a few members, without parsing all of them.
+        '''
+        if self._central_directory is None:
+            try:
+                self._central_directory = CentralDirectory.read(
+                    self.storage, tech.fs.Path(self.archive_filename))
+            except (zipopener.BadZipFile, OSError):
+                raise InvalidArchive(self.archive_filename)
+        return self._central_directory
+
+    def _member(self, zip_path: str) -> Member:
+        '''
+        raises KeyError, if there is no such member,
+            InvalidArchive, if the archive can not be read.
+        '''
+        if self._members is not None:
+            return self._members[zip_path]
+        try:
+            member = self.central_directory.find(zip_path)
+        except zipopener.BadZipFile:
+            raise InvalidArchive(self.archive_filename)
+        if member is None:
+            raise KeyError(zip_path)
+        return member
+
+    def namelist(self) -> List[str]:
+        if self._members is not None:
+            return list(self._members)
+        try:
+            return self.central_directory.names()
+        except zipopener.BadZipFile:
+            raise InvalidArchive(self.archive_filename)
+
+    def open(self, zip_path: str) -> BinaryIO:
+        '''
+        Open a member for reading.
+
+        raises KeyError, if there is no such member,
+            InvalidArchive, if the archive can not be read.
+        '''
+        member = self._member(zip_path)
+        if member.compress_type not in SUPPORTED_COMPRESS_TYPES:
+            return self.zipfile.open(zip_path)
+        try:
+            return open_member(self.storage, tech.fs.Path(self.archive_filename), member)
+        except (zipopener.BadZipFile, OSError):
+            raise InvalidArchive(self.archive_filename)
+
+    def validate(self, workers: Optional[int] = None, stop: Optional[threading.Event] = None):
         '''
         verify, that
         - all files under code, data, meta are present in the manifest
@@ -51,15 +161,52 @@ class ZipArchive(UnpackableBead):
             - has freeze time
             - has freezed name
             - has inputs (even if empty)
+
+        File contents are hashed by `workers` threads (default: validate_workers()).
+        Hashing stops before the next file, when stop is set - without raising.
+        raises InvalidArchive(archive filename[, name of the first bad file found])
+        '''
+        self._check_structure()
+        bad_file = self._file_with_different_content_id(workers, stop=stop)
+        if bad_file is not None:
+            raise InvalidArchive(self.archive_filename, bad_file)
+
+    def _check_structure(self):
+        '''
+        validate() without checking file contents.
+        '''
+        if not (self._has_well_formed_meta() and self._bead_creation_time_is_in_the_past()):
+            raise InvalidArchive(self.archive_filename)
+        bad_file = self._extra_file() or self._missing_file()
+        if bad_file is not None:
+            raise InvalidArchive(self.archive_filename, bad_file)
+
+    def extract_dirs_verified(
+        self, extractions: Sequence[Tuple[str, tech.fs.Path]], workers: Optional[int] = None,
+        readonly: bool = False,
+    ):
         '''
-        if not all(self._checks()):
-            raise InvalidArchive
+        Extract (zip_dir, fs_dir)-s, while validating the whole archive - in a single pass.
 
-    def _checks(self):
-        yield self._has_well_formed_meta()
-        yield self._bead_creation_time_is_in_the_past()
-        yield self._extra_file() is None
-        yield self._file_with_different_content_id() is None
+        Extracted files are hashed while written, the rest are hashed by `workers` threads.
+        raises InvalidArchive (see validate) - after removing what was extracted
+        '''
+        self._check_structure()
+        manifest = self.manifest
+        created_dirs = [fs_dir for _, fs_dir in extractions if not os.path.exists(fs_dir)]
+        files, dirs = self._extraction_plan(extractions)
+        try:
+            bad_file = self._extract_files(files, dirs, workers, readonly, manifest)
+            if bad_file is None:
+                bad_file = self._file_with_different_content_id(
+                    workers, [name for name in manifest if name not in files])
+            if bad_file is not None:
+                raise InvalidArchive(self.archive_filename, bad_file)
+        except BaseException:
+            _remove_extracted(files.values(), created_dirs)
+            raise
+        if readonly:
+            _make_readonly(dirs)
 
     def _has_well_formed_meta(self):
         meta = self.meta
@@ -81,7 +228,7 @@ class ZipArchive(UnpackableBead):
         code_dir_prefix = layouts.Archive.CODE + '/'
         manifest = self.manifest
         # check that there are no extra files
-        for name in self.zipfile.namelist():
+        for name in self.namelist():
             is_data = name.startswith(data_dir_prefix)
             is_code = name.startswith(code_dir_prefix)
             if is_data or is_code:
@@ -89,15 +236,59 @@ class ZipArchive(UnpackableBead):
                     # unexpected extra file!
                     return name
 
-    def _file_with_different_content_id(self):
-        for name, hash in self.manifest.items():
-            try:
-                info = self.zipfile.getinfo(name)
-            except KeyError:
+    def _missing_file(self) -> Optional[str]:
+        members = self.members
+        for name in self.manifest:
+            if name not in members:
                 return name
-            archived_hash = securehash.file(self.zipfile.open(info), info.file_size)
-            if hash != archived_hash:
+        return None
+
+    def _file_with_different_content_id(
+        self, workers: Optional[int] = None, names: Optional[List[str]] = None,
+        stop: Optional[threading.Event] = None,
+    ) -> Optional[str]:
+        '''
+        A manifest file (of names) missing or having different content - None, if all match.
+
+        Stops at the first mismatch.
+        '''
+        manifest = self.manifest
+        members = self.members
+        if names is None:
+            names = list(manifest)
+        for name in names:
+            if name not in members:
                 return name
+        batches = _balanced_batches(
+            {name: members[name].file_size for name in names},
+            max(1, min(workers or validate_workers(), len(names))))
+        return _first_bad_file_in_parallel(
+            batches, lambda batch, stop: self._first_bad_file(batch, manifest, stop), stop)
+
+    def _first_bad_file(
+        self, names: List[str], manifest: Mapping[str, str], stop: '_Stop'
+    ) -> Optional[str]:
+        '''
+        First of names having a different content than in manifest - None, if all match.
+
+        Uses its own file handles, so it can run in parallel with others.
+        Stops before the next file, when stop is set.
+        '''
+        with _MemberOpener(self) as opener:
+            for name in names:
+                if stop.is_set():
+                    return None
+                try:
+                    archived_hash = securehash.file(
+                        opener.open(name), self.members[name].file_size)
+                except (zipopener.BadZipFile, zlib.error, EOFError):
+                    return name
+                if manifest[name] != archived_hash:
+                    return name
+        return None
+
+    def _file_size(self, name: str) -> int:
+        return self._member(name).file_size
 
     @property
     def manifest(self):
@@ -113,9 +304,9 @@ class ZipArchive(UnpackableBead):
         # there is currently only one meta version
         # and it must match the one defined in the workspace module
         assert self._meta[meta.META_VERSION] == 'aaa947a6-1f7a-11e6-ba3a-0021cc73492e'
-        zipinfo = self.zipfile.getinfo(layouts.Archive.MANIFEST)
-        with self.zipfile.open(zipinfo) as f:
-            return securehash.file(f, zipinfo.file_size)
+        file_size = self._file_size(layouts.Archive.MANIFEST)
+        with self.open(layouts.Archive.MANIFEST) as f:
+            return securehash.file(f, file_size)
 
     @property
     def meta_version(self):
@@ -131,12 +322,12 @@ class ZipArchive(UnpackableBead):
 
     @property
     def meta(self):
-        # create a copy, so that returned meta can be modified without causing
-        # harm to this Archive instance
-        return deepcopy(self._meta)
+        # read-only: shared, not copied
+        return self._meta
 
     def zip_load(self, filename):
-        return persistence.zip_load(self.zipfile, filename)
+        with self.open(filename) as f:
+            return persistence.load(io.TextIOWrapper(f, encoding='utf-8'))
 
     @property
     def input_map(self):
@@ -152,7 +343,7 @@ class ZipArchive(UnpackableBead):
     # -
     def _load_meta(self):
         try:
-            return self.zip_load(layouts.Archive.BEAD_META)
+            return meta.read_only(self.zip_load(layouts.Archive.BEAD_META))
         except:
             raise InvalidArchive(self.archive_filename)
 
@@ -160,31 +351,109 @@ class ZipArchive(UnpackableBead):
         '''
             Extract zip_path from zipfile to fs_path.
         '''
-        fs_path = tech.fs.Path(os.path.normpath(fs_path.as_posix()))
-
-        upperdirs = os.path.dirname(fs_path.as_posix())
-        if upperdirs:
-            tech.fs.ensure_directory(tech.fs.Path(upperdirs))
-
-        with self.zipfile.open(zip_path) as source:
-            with open(fs_path, 'wb') as target:
-                shutil.copyfileobj(source, target)
+        fs_path = _target_path(fs_path)
+
+        member = self._member(zip_path)
+        with open(fs_path, 'wb') as target:
+            if member.compress_type == ZIP_STORED:
+                copy_stored_member(
+                    self.storage, tech.fs.Path(self.archive_filename), member, target)
+            else:
+                with self.open(zip_path) as source:
+                    shutil.copyfileobj(source, target)
+
+    def extract_dir(
+        self, zip_dir: str, fs_dir: tech.fs.Path, workers: Optional[int] = None,
+        readonly: bool = False, stop: Optional[threading.Event] = None,
+    ):
+        '''
+            Extract all files from zipfile under zip_dir to fs_dir - by `workers` threads.
 
-    def extract_dir(self, zip_dir: str, fs_dir: tech.fs.Path):
+            With readonly the files are created read-only,
+            and the directories are made read-only at the end.
+            Extraction stops before the next file, when stop is set.
         '''
-            Extract all files from zipfile under zip_dir to fs_dir.
+        files, dirs = self._extraction_plan([(zip_dir, fs_dir)])
+        self._extract_files(files, dirs, workers, readonly, stop=stop)
+        if readonly and not (stop is not None and stop.is_set()):
+            _make_readonly(dirs)
+
+    def _extraction_plan(
+        self, extractions: Sequence[Tuple[str, tech.fs.Path]]
+    ) -> Tuple[Dict[str, tech.fs.Path], List[tech.fs.Path]]:
         '''
+        -> ({zip_path: fs_path} for files under the zip_dirs, directories to create - sorted)
+        '''
+        names = self.namelist()
+        files = {}
+        dirs = set()
+        for zip_dir, fs_dir in extractions:
+            fs_dir = _normalized(fs_dir)
+            dirs.add(fs_dir)
+            zip_dir_prefix = zip_dir + '/'
+            for zip_path in names:
+                if not zip_path.startswith(zip_dir_prefix):
+                    continue
+                fs_path = _normalized(fs_dir / zip_path[len(zip_dir_prefix):])
+                files[zip_path] = fs_path
+                parent = fs_path.parent
+                while parent not in dirs and parent != parent.parent:
+                    dirs.add(parent)
+                    parent = parent.parent
+        return files, sorted(dirs)
+
+    def _extract_files(
+        self, files: Mapping[str, tech.fs.Path], dirs: List[tech.fs.Path],
+        workers: Optional[int], readonly: bool, manifest: Optional[Mapping[str, str]] = None,
+        stop: Optional[threading.Event] = None,
+    ) -> Optional[str]:
+        '''
+        Create dirs, then extract files by `workers` threads (default: validate_workers()).
 
-        tech.fs.ensure_directory(fs_dir)
-
-        zip_dir_prefix = zip_dir + '/'
-        zip_dir_prefix_len = len(zip_dir_prefix)
+        With a manifest the files are checked against it -> the first bad file or None.
+        '''
+        for dir in dirs:
+            tech.fs.ensure_directory(dir)
+        members = self.members
+        batches = _balanced_batches(
+            {name: members[name].file_size for name in files},
+            max(1, min(workers or validate_workers(), len(files))))
+        return _first_bad_file_in_parallel(
+            batches,
+            lambda batch, stop: self._extract_batch(batch, files, readonly, manifest, stop),
+            stop)
+
+    def _extract_batch(
+        self, names: List[str], files: Mapping[str, tech.fs.Path], readonly: bool,
+        manifest: Optional[Mapping[str, str]], stop: '_Stop',
+    ) -> Optional[str]:
+        '''
+        Extract names to their files -> first file not matching manifest (when given) or None.
 
-        for zip_path in self.zipfile.namelist():
-            if not zip_path.startswith(zip_dir_prefix):
-                continue
-            fs_path = fs_dir / zip_path[zip_dir_prefix_len:]
-            self.extract_file(zip_path, fs_path)
+        Uses its own file handles, so it can run in parallel with others.
+        Stops before the next file, when stop is set.
+        '''
+        mode = 0o444 if readonly else 0o666
+        with _MemberOpener(self) as opener:
+            for name in names:
+                if stop.is_set():
+                    return None
+                fd = os.open(
+                    files[name],
+                    os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0),
+                    mode)
+                with open(fd, 'wb') as target:
+                    if manifest is None:
+                        opener.copy(name, target)
+                        continue
+                    try:
+                        archived_hash = securehash.copy(
+                            opener.open(name), target, self.members[name].file_size)
+                    except (zipopener.BadZipFile, zlib.error, EOFError):
+                        return name
+                if manifest.get(name, archived_hash) != archived_hash:
+                    return name
+        return None
 
     def unpack_code_to(self, fs_dir):
         self.extract_dir(layouts.Archive.CODE, fs_dir)
@@ -193,5 +462,159 @@ class ZipArchive(UnpackableBead):
         self.extract_dir(layouts.Archive.DATA, fs_dir)
 
     def unpack_meta_to(self, workspace):
+        # the workspace keeps only the serialized meta
         workspace.meta = self.meta
         workspace.input_map = self.input_map
+
+
+def _normalized(fs_path: tech.fs.Path) -> tech.fs.Path:
+    return tech.fs.Path(os.path.normpath(fs_path.as_posix()))
+
+
+def _target_path(fs_path: tech.fs.Path) -> tech.fs.Path:
+    '''
+    Normalized fs_path, with its parent directories created.
+    '''
+    fs_path = _normalized(fs_path)
+
+    upperdirs = os.path.dirname(fs_path.as_posix())
+    if upperdirs:
+        tech.fs.ensure_directory(tech.fs.Path(upperdirs))
+    return fs_path
+
+
+def _remove_extracted(fs_paths: Iterable[tech.fs.Path], created_dirs: Iterable[tech.fs.Path]):
+    '''
+    Remove what an extraction has written - as far as possible, never raising.
+
+    Files may be read-only, which can not be removed on Windows.
+    '''
+    for fs_path in fs_paths:
+        try:
+            if os.path.exists(fs_path):
+                tech.fs.make_writable(fs_path)
+                os.remove(fs_path)
+        except OSError as e:
+            TRACELOG(f'Could not remove extracted {fs_path}: {e}')
+    for fs_dir in created_dirs:
+        try:
+            if os.path.exists(fs_dir):
+                tech.fs.rmtree(fs_dir)
+        except OSError as e:
+            TRACELOG(f'Could not remove extracted {fs_dir}: {e}')
+
+
+def _make_readonly(dirs: List[tech.fs.Path]):
+    # deepest first
+    for dir in reversed(dirs):
+        tech.fs.make_readonly(dir)
+
+
+class _MemberOpener:
+    '''
+    Opens members of a ZipArchive with file handles of its own - for use in a single thread.
+
+    The archive is opened once, members are read one at a time by seeking in it.
+    '''
+
+    def __init__(self, ziparchive: ZipArchive):
+        self._ziparchive = ziparchive
+        self._archive_path = tech.fs.Path(ziparchive.archive_filename)
+        self._archive: Optional[BinaryIO] = None
+        self._zipfile: Optional[ZipFile] = None
+
+    @property
+    def archive(self) -> BinaryIO:
+        if self._archive is None:
+            self._archive = self._ziparchive.storage.open(self._archive_path)
+        return self._archive
+
+    def open(self, name: str) -> IO[bytes]:
+        '''
+        Open member name - the previously opened one must be closed (read) before.
+        '''
+        member = self._ziparchive.members[name]
+        if member.compress_type in SUPPORTED_COMPRESS_TYPES:
+            return open_member(
+                self._ziparchive.storage, self._archive_path, member, self.archive)
+        if self._zipfile is None:
+            self._zipfile = zipopener.open_uncached(
+                self._ziparchive.archive_filename, self._ziparchive.storage)
+        return self._zipfile.open(name)
+
+    def copy(self, name: str, target: BinaryIO):
+        '''
+        Copy the content of member name to target - stored members by the kernel, when possible.
+        '''
+        member = self._ziparchive.members[name]
+        if member.compress_type == ZIP_STORED:
+            copy_stored_member(
+                self._ziparchive.storage, self._archive_path, member, target, self.archive)
+        else:
+            with self.open(name) as source:
+                shutil.copyfileobj(source, target)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._archive is not None:
+            self._archive.close()
+        if self._zipfile is not None:
+            self._zipfile.close()
+
+
+class _Stop:
+    '''
+    Tells batches to stop - set by the run, or by the caller through its `cancel` event.
+    '''
+
+    def __init__(self, cancel: Optional[threading.Event] = None):
+        self._event = threading.Event()
+        self._cancel = cancel
+
+    def set(self):
+        self._event.set()
+
+    def is_set(self) -> bool:
+        return self._event.is_set() or (self._cancel is not None and self._cancel.is_set())
+
+
+def _first_bad_file_in_parallel(
+    batches: List[List[str]],
+    process_batch: Callable[[List[str], _Stop], Optional[str]],
+    cancel: Optional[threading.Event] = None,
+) -> Optional[str]:
+    '''
+    process_batch(batch, stop) for all batches - in parallel threads -> the first bad file or None.
+
+    stop is set, when a bad file is found or an exception is raised, or when cancel is set.
+    '''
+    stop = _Stop(cancel)
+    if len(batches) <= 1:
+        return process_batch(batches[0] if batches else [], stop)
+    # zlib and hashlib release the GIL, as does file IO: threads work in parallel
+    with ThreadPoolExecutor(len(batches), thread_name_prefix='bead-zip') as executor:
+        futures = [executor.submit(process_batch, batch, stop) for batch in batches]
+        try:
+            for future in as_completed(futures):
+                bad_file = future.result()
+                if bad_file is not None:
+                    return bad_file
+        finally:
+            stop.set()
+    return None
+
+
+def _balanced_batches(sizes: Mapping[str, int], count: int) -> List[List[str]]:
+    '''
+    Split names into at most count batches of about equal total size.
+    '''
+    batches: List[List[str]] = [[] for _ in range(min(count, len(sizes)))]
+    # (total size, batch index)
+    totals = [(0, i) for i in range(len(batches))]
+    for name in sorted(sizes, key=lambda name: sizes[name], reverse=True):
+        total, i = heapq.heappop(totals)
+        batches[i].append(name)
+        heapq.heappush(totals, (total + sizes[name] + MEMBER_OVERHEAD, i))
+    return batches
@@ -0,0 +1,212 @@
+'''
+Looking up zip archive members in the raw central directory.
+
+zipfile.ZipFile makes a ZipInfo object of every central directory entry on opening
+(see zipopener.py), which takes seconds for archives with 100000+ files,
+while e.g. loading the meta of an archive needs only a few of its entries.
+
+Here the central directory is read as bytes, and only the offsets of its entries are
+collected - into a compact array. Entries are parsed only when looked up by name,
+into zipmembers.Member-s.
+'''
+
+import array
+import bisect
+import io
+import struct
+from typing import Dict, Iterator, List, Mapping, Optional
+from zipfile import BadZipFile
+
+from .storage import Storage
+from .zipmembers import Member
+from . import tech
+
+Path = tech.fs.Path
+
+
+END_SIGNATURE = b'PK\x05\x06'
+END_SIZE = 22
+MAX_COMMENT_SIZE = 0xffff
+# number of entries, central directory size, offset, comment length
+_END_FIELDS = struct.Struct('<4x6xHIIH')
+
+ZIP64_LOCATOR_SIGNATURE = b'PK\x06\x07'
+ZIP64_LOCATOR_SIZE = 20
+# offset of the zip64 end record
+_ZIP64_LOCATOR_FIELDS = struct.Struct('<4x4xQ4x')
+ZIP64_END_SIGNATURE = b'PK\x06\x06'
+ZIP64_END_SIZE = 56
+# number of entries, central directory size, offset
+_ZIP64_END_FIELDS = struct.Struct('<4x8x2x2x4x4x8xQQQ')
+
+ENTRY_SIGNATURE = b'PK\x01\x02'
+ENTRY_SIZE = 46
+# general purpose flag, compression method, crc, compressed size, file size,
+# file name length, extra field length, comment length, local header offset
+_ENTRY_FIELDS = struct.Struct('<4x4xHH4xIIIHHH8xI')
+# file name length, extra field length, comment length
+_ENTRY_LENGTHS = struct.Struct('<28xHHH')
+_UTF8_FLAG = 0x800
+
+ZIP64_EXTRA_ID = 0x0001
+ZIP64_MARKER = 0xffffffff
+_EXTRA_HEADER = struct.Struct('<HH')
+
+
+class CentralDirectory:
+    '''
+    Raw central directory of a zip archive, with the offsets of its entries.
+    '''
+
+    def __init__(self, data: bytes, offset: int, concat: int = 0):
+        '''
+        data is the central directory, starting at offset in the archive.
+
+        concat is the size of data prepended to the archive (local header offsets are off by it).
+        '''
+        self.data = data
+        self.offset = offset
+        self._concat = concat
+        self._entry_offsets = array.array('Q', self._scan())
+
+    @classmethod
+    def read(cls, storage: Storage, archive_path: Path) -> 'CentralDirectory':
+        '''
+        raises BadZipFile
+        '''
+        with storage.open(archive_path) as file:
+            size = file.seek(0, io.SEEK_END)
+            tail_size = min(size, ZIP64_LOCATOR_SIZE + END_SIZE + MAX_COMMENT_SIZE)
+            file.seek(size - tail_size)
+            tail = file.read(tail_size)
+            end = tail.rfind(END_SIGNATURE, 0, len(tail) - END_SIZE + len(END_SIGNATURE))
+            if end < 0:
+                raise BadZipFile(f'No end of central directory in {archive_path}')
+            count, cd_size, cd_offset, _ = _END_FIELDS.unpack_from(tail, end)
+            end_position = size - tail_size + end
+            locator = end - ZIP64_LOCATOR_SIZE
+            if locator >= 0 and tail[locator:locator + 4] == ZIP64_LOCATOR_SIGNATURE:
+                (end_position,) = _ZIP64_LOCATOR_FIELDS.unpack_from(tail, locator)
+                file.seek(end_position)
+                record = file.read(ZIP64_END_SIZE)
+                if len(record) != ZIP64_END_SIZE or record[:4] != ZIP64_END_SIGNATURE:
+                    raise BadZipFile(f'No zip64 end of central directory in {archive_path}')
+                count, cd_size, cd_offset = _ZIP64_END_FIELDS.unpack(record)
+            start = end_position - cd_size
+            if start < 0:
+                raise BadZipFile(f'Bad central directory size in {archive_path}')
+            file.seek(start)
+            data = file.read(cd_size)
+        if len(data) != cd_size:
+            raise BadZipFile(f'Truncated central directory in {archive_path}')
+        directory = cls(data, start, concat=start - cd_offset)
+        if len(directory) != count:
+            raise BadZipFile(f'Bad number of central directory entries in {archive_path}')
+        return directory
+
+    def _scan(self) -> Iterator[int]:
+        data = self.data
+        position = 0
+        while position < len(data):
+            if (
+                position + ENTRY_SIZE > len(data)
+                or data[position:position + 4] != ENTRY_SIGNATURE
+            ):
+                raise BadZipFile(f'Bad central directory entry at {self.offset + position}')
+            name_length, extra_length, comment_length = _ENTRY_LENGTHS.unpack_from(data, position)
+            yield position
+            position += ENTRY_SIZE + name_length + extra_length + comment_length
+        if position != len(data):
+            raise BadZipFile('Truncated central directory')
+
+    def __len__(self):
+        return len(self._entry_offsets)
+
+    def names(self) -> List[str]:
+        return [self._name(position) for position in self._entry_offsets]
+
+    def members(self, hashes: Mapping[str, str]) -> Dict[str, Member]:
+        '''
+        Member table of all entries, with hashes from hashes (e.g. the manifest).
+
+        raises BadZipFile for a malformed entry
+        '''
+        members = (self._member(position, hashes) for position in self._entry_offsets)
+        return {member.name: member for member in members}
+
+    def find(self, name: str) -> Optional[Member]:
+        '''
+        Member named name - None, if there is no such entry.
+
+        raises BadZipFile for a malformed entry
+        '''
+        for raw_name in _encodings(name):
+            position = self.data.find(raw_name)
+            while position >= 0:
+                entry_position = position - ENTRY_SIZE
+                if self._is_entry(entry_position) and self._name(entry_position) == name:
+                    return self._member(entry_position)
+                position = self.data.find(raw_name, position + 1)
+        return None
+
+    def _is_entry(self, position: int) -> bool:
+        i = bisect.bisect_left(self._entry_offsets, position)
+        return i < len(self._entry_offsets) and self._entry_offsets[i] == position
+
+    def _name(self, position: int) -> str:
+        flags = _ENTRY_FIELDS.unpack_from(self.data, position)[0]
+        name_length = _ENTRY_LENGTHS.unpack_from(self.data, position)[0]
+        start = position + ENTRY_SIZE
+        raw_name = self.data[start:start + name_length]
+        return raw_name.decode('utf-8' if flags & _UTF8_FLAG else 'cp437')
+
+    def _member(self, position: int, hashes: Optional[Mapping[str, str]] = None) -> Member:
+        (
+            _, compress_type, crc, compress_size, file_size,
+            name_length, extra_length, _, header_offset
+        ) = _ENTRY_FIELDS.unpack_from(self.data, position)
+        if ZIP64_MARKER in (compress_size, file_size, header_offset):
+            start = position + ENTRY_SIZE + name_length
+            file_size, compress_size, header_offset = _zip64_values(
+                self.data[start:start + extra_length], file_size, compress_size, header_offset)
+        name = self._name(position)
+        return Member(
+            name, header_offset + self._concat, compress_type, compress_size, file_size, crc,
+            hashes.get(name) if hashes else None)
+
+
+def _encodings(name: str) -> List[bytes]:
+    raw_names = [name.encode('utf-8')]
+    try:
+        cp437_name = name.encode('cp437')
+    except UnicodeEncodeError:
+        pass
+    else:
+        if cp437_name != raw_names[0]:
+            raw_names.append(cp437_name)
+    return raw_names
+
+
+def _zip64_values(extra: bytes, *values: int) -> List[int]:
+    '''
+    values (file size, compressed size, header offset) - the ones marked taken from extra.
+
+    raises BadZipFile, if extra has no zip64 field for them
+    '''
+    position = 0
+    while position + _EXTRA_HEADER.size <= len(extra):
+        field_id, size = _EXTRA_HEADER.unpack_from(extra, position)
+        position += _EXTRA_HEADER.size
+        if field_id == ZIP64_EXTRA_ID:
+            field = extra[position:position + size]
+            result = []
+            for value in values:
+                if value == ZIP64_MARKER:
+                    if len(field) < 8:
+                        raise BadZipFile('Corrupt zip64 extra field')
+                    (value,) = struct.unpack_from('<Q', field)
+                    field = field[8:]
+                result.append(value)
+            return result
+        position += size
+    raise BadZipFile('Missing zip64 extra field')
@@ -0,0 +1,230 @@
+'''
+Reading zip archive members directly, by a table of their offsets.
+
+zipfile.ZipFile parses the whole central directory on opening (see zipopener.py),
+which is slow for archives with many files.
+With the offsets and sizes of the members known (e.g. from the .xmeta file),
+a member is read by seeking to its local header - the central directory is not read at all.
+
+Only stored and deflated members can be read this way (these are what beads are saved with),
+others must be read through zipfile.
+'''
+
+import io
+import struct
+from typing import BinaryIO, Dict, List, Mapping, Optional
+from zipfile import BadZipFile, ZIP_DEFLATED, ZIP_STORED
+import zlib
+
+import attr
+
+from .storage import Storage
+from . import tech
+
+Path = tech.fs.Path
+
+
+SUPPORTED_COMPRESS_TYPES = (ZIP_STORED, ZIP_DEFLATED)
+
+LOCAL_HEADER_SIGNATURE = b'PK\x03\x04'
+LOCAL_HEADER_SIZE = 30
+# general purpose flag, file name length, extra field length - of the local header
+_LOCAL_HEADER_FIELDS = struct.Struct('<6xH18xHH')
+_UTF8_FLAG = 0x800
+
+READ_SIZE = 64 * 1024
+
+
+@attr.s(frozen=True, auto_attribs=True)
+class Member:
+    name: str
+    # offset of the local file header
+    header_offset: int
+    compress_type: int
+    compress_size: int
+    file_size: int
+    crc: int
+    # content hash from the manifest, None for files not in the manifest
+    hash: Optional[str] = None
+
+    def as_list(self) -> list:
+        return [
+            self.name, self.header_offset, self.compress_type, self.compress_size,
+            self.file_size, self.crc, self.hash]
+
+    @classmethod
+    def from_list(cls, fields: list) -> 'Member':
+        '''
+        raises ValueError for malformed fields
+        '''
+        try:
+            name, header_offset, compress_type, compress_size, file_size, crc, hash = fields
+        except (TypeError, ValueError):
+            raise ValueError(f'Malformed zip member {fields!r}')
+        ints = (header_offset, compress_type, compress_size, file_size, crc)
+        if not isinstance(name, str) or not all(isinstance(i, int) for i in ints):
+            raise ValueError(f'Malformed zip member {fields!r}')
+        return cls(name, header_offset, compress_type, compress_size, file_size, crc, hash)
+
+
+def dump_members(members: Mapping[str, Member]) -> List[list]:
+    return [member.as_list() for member in members.values()]
+
+
+def load_members(member_lists: List[list]) -> Dict[str, Member]:
+    '''
+    raises ValueError for a malformed table
+    '''
+    if not isinstance(member_lists, list):
+        raise ValueError('Malformed zip member table')
+    members = (Member.from_list(fields) for fields in member_lists)
+    return {member.name: member for member in members}
+
+
+def open_member(
+    storage: Storage, archive_path: Path, member: Member, archive: Optional[BinaryIO] = None,
+) -> BinaryIO:
+    '''
+    Open member of the zip archive at archive_path for reading its uncompressed content.
+
+    With archive (an open file of the zip archive) the member is read through it,
+    leaving it open - it must not be used otherwise, until the member is closed.
+    The content is checked against the member's size and CRC at its end.
+    raises BadZipFile, if the member is not at its offset,
+        NotImplementedError for unsupported compression methods.
+    '''
+    if member.compress_type not in SUPPORTED_COMPRESS_TYPES:
+        raise NotImplementedError(f'Compression method {member.compress_type}')
+    if archive is None:
+        file = _open_at_data(storage, archive_path, member)
+    else:
+        file = _seek_to_data(archive, archive_path, member)
+    return io.BufferedReader(_MemberReader(file, member, close=archive is None), READ_SIZE)
+
+
+def copy_stored_member(
+    storage: Storage, archive_path: Path, member: Member, target: BinaryIO,
+    archive: Optional[BinaryIO] = None,
+):
+    '''
+    Copy the content of a stored (uncompressed) member to target - by the kernel, when possible.
+
+    With archive (an open file of the zip archive) the content is copied from it.
+    The content is not checked against the member's CRC: it does not pass through this process
+    (see ZipArchive.validate for checking the content).
+    raises BadZipFile, if the member is not at its offset or is truncated,
+        ValueError for a compressed member.
+    '''
+    if member.compress_type != ZIP_STORED:
+        raise ValueError(f'{member.name} is compressed')
+    if archive is None:
+        with _open_at_data(storage, archive_path, member) as file:
+            _copy_data(file, member, target)
+    else:
+        _copy_data(_seek_to_data(archive, archive_path, member), member, target)
+
+
+def _copy_data(file: BinaryIO, member: Member, target: BinaryIO):
+    try:
+        tech.fs.copy_range(file, target, file.tell(), member.file_size)
+    except EOFError:
+        raise BadZipFile(f'Truncated member {member.name}')
+
+
+def _open_at_data(storage: Storage, archive_path: Path, member: Member) -> BinaryIO:
+    '''
+    Open the zip archive at archive_path, positioned at the (compressed) data of member.
+
+    raises BadZipFile, if the member is not at its offset
+    '''
+    file = storage.open(archive_path)
+    try:
+        return _seek_to_data(file, archive_path, member)
+    except BaseException:
+        file.close()
+        raise
+
+
+def _seek_to_data(file: BinaryIO, archive_path: Path, member: Member) -> BinaryIO:
+    '''
+    Position the open zip archive file at the (compressed) data of member -> file.
+
+    raises BadZipFile, if the member is not at its offset
+    '''
+    file.seek(member.header_offset)
+    header = file.read(LOCAL_HEADER_SIZE)
+    if len(header) != LOCAL_HEADER_SIZE or header[:4] != LOCAL_HEADER_SIGNATURE:
+        raise BadZipFile(f'No local header for {member.name} in {archive_path}')
+    flags, name_length, extra_length = _LOCAL_HEADER_FIELDS.unpack(header)
+    raw_name = file.read(name_length)
+    name = raw_name.decode('utf-8' if flags & _UTF8_FLAG else 'cp437')
+    if name != member.name:
+        raise BadZipFile(f'Expected {member.name}, found {name} in {archive_path}')
+    file.seek(extra_length, io.SEEK_CUR)
+    return file
+
+
+class _MemberReader(io.RawIOBase):
+    '''
+    Uncompressed content of a member - the file is positioned at its data.
+
+    The file is closed with the reader, unless close is False.
+    '''
+
+    def __init__(self, file: BinaryIO, member: Member, close: bool = True):
+        self._file = file
+        self._close_file = close
+        self._member = member
+        self._compressed_left = member.compress_size
+        self._decompressor = (
+            zlib.decompressobj(-zlib.MAX_WBITS) if member.compress_type == ZIP_DEFLATED else None)
+        self._unconsumed = b''
+        self._size = 0
+        self._crc = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer) -> int:
+        data = self._read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def _read(self, size: int) -> bytes:
+        if not size:
+            return b''
+        if self._decompressor is None:
+            data = self._read_compressed(size)
+        else:
+            while True:
+                if not self._unconsumed and self._compressed_left:
+                    self._unconsumed = self._read_compressed(READ_SIZE)
+                # also returns output pending in the decompressor
+                data = self._decompressor.decompress(self._unconsumed, size)
+                self._unconsumed = self._decompressor.unconsumed_tail
+                if data or not (self._unconsumed or self._compressed_left):
+                    break
+        if data:
+            self._size += len(data)
+            self._crc = zlib.crc32(data, self._crc)
+        else:
+            self._check_end()
+        return data
+
+    def _read_compressed(self, size: int) -> bytes:
+        data = self._file.read(min(size, self._compressed_left))
+        if not data and self._compressed_left:
+            raise BadZipFile(f'Truncated member {self._member.name}')
+        self._compressed_left -= len(data)
+        return data
+
+    def _check_end(self):
+        if self._size != self._member.file_size or self._crc != self._member.crc:
+            raise BadZipFile(f'Bad CRC-32 or size for member {self._member.name}')
+
+    def close(self):
+        try:
+            if self._close_file:
+                self._file.close()
+        finally:
+            super().close()
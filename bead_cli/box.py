@@ -1,10 +1,27 @@
+import os
+
+from bead import boxstats
+from bead import boxsync
+from bead import boxxmeta
 from bead import tech
 from bead.archive import Archive
+from bead.cachedbox import CachedBox
+from bead.exceptions import InvalidArchive
+from bead.httpstorage import is_url, write_listings
+from bead.storage import LOCAL
+from bead.tech.inotify import DirectoryWatch
 from .cmdparse import Command
-from .common import OPTIONAL_ENV, die
+from .common import OPTIONAL_ENV, die, get_unionbox, warning
+from . import arg_help
+from . import arg_metavar
 from .web import rewire
 
 
+DEFAULT_SYNC_JOBS = 4
+# seconds between looking for changes (without inotify, or when it misses them)
+DEFAULT_WATCH_INTERVAL = 5.0
+
+
 class CmdAdd(Command):
     '''
     Define a box.
@@ -12,7 +29,9 @@ class CmdAdd(Command):
 
     def declare(self, arg):
         arg('name')
-        arg('directory', type=tech.fs.Path)
+        arg('directory', help='Box directory, or http(s) URL of a published box')
+        arg('--cached', default=False, action='store_true',
+            help='Read archives through a local cache (for slow, remote boxes)')
         arg(OPTIONAL_ENV)
 
     def run(self, args):
@@ -20,15 +39,18 @@ class CmdAdd(Command):
         Define a box.
         '''
         name: str = args.name
-        directory: tech.fs.Path = args.directory
         env = args.get_env()
 
-        if not directory.is_dir():
-            print(f'ERROR: "{directory}" is not an existing directory!')
-            return
-        location = directory.resolve()
+        if is_url(args.directory):
+            location = args.directory
+        else:
+            directory = tech.fs.Path(args.directory)
+            if not directory.is_dir():
+                print(f'ERROR: "{directory}" is not an existing directory!')
+                return
+            location = directory.resolve()
         try:
-            env.add_box(name, location)
+            env.add_box(name, location, cached=args.cached)
             env.save()
             print(f'Will remember box {name}')
         except ValueError as e:
@@ -48,7 +70,8 @@ class CmdList(Command):
         boxes = args.get_env().get_boxes()
 
         def print_box(box):
-            print(f'{box.name}: {box.location}')
+            cached = ' (cached)' if isinstance(box, CachedBox) else ''
+            print(f'{box.name}: {box.location}{cached}')
         if boxes:
             print('Boxes:')
             print('-------------')
@@ -88,10 +111,247 @@ class CmdXmeta(Command):
 
     def run(self, args):
         archive = Archive(args.zip_archive_filename)
+        archive.save_member_table()
         archive.save_cache()
         print(f'Saved {archive.cache_path}')
 
 
+class CmdShard(Command):
+    '''
+    Store archives in per bead name sub-directories of the box.
+
+    Makes name based lookups in big boxes faster, as only a small directory is listed.
+    Archives already in the box are moved to their sub-directory,
+    and archives saved later are stored there directly.
+    '''
+    def declare(self, arg):
+        arg('name')
+        arg(OPTIONAL_ENV)
+
+    def run(self, args):
+        env = args.get_env()
+        box = env.get_box(args.name)
+        if box is None:
+            die(f'Unknown box {args.name}')
+        moved = box.shard()
+        print(f'Moved {moved} archives into per bead name directories in box {box.name}')
+
+
+class CmdSync(Command):
+    '''
+    Copy beads missing from the destination box.
+
+    Beads are compared by name and content_id, copies are verified.
+    An interrupted sync can be continued by running it again.
+    '''
+    def declare(self, arg):
+        arg('source')
+        arg('destination')
+        arg('-j', '--jobs', dest='jobs', type=int, default=DEFAULT_SYNC_JOBS,
+            help=f'Copy this many archives in parallel (default: {DEFAULT_SYNC_JOBS})')
+        arg(OPTIONAL_ENV)
+
+    def run(self, args):
+        env = args.get_env()
+        source = env.get_box(args.source)
+        destination = env.get_box(args.destination)
+        for name, box in ((args.source, source), (args.destination, destination)):
+            if box is None:
+                die(f'Unknown box {name}')
+        result = boxsync.sync(source, destination, workers=args.jobs)
+        for bead, reason in result.failed:
+            warning(f'Could not copy {bead.archive_filename}: {reason}')
+        megabytes = result.bytes_copied / 1024 ** 2
+        print(
+            f'Copied {len(result.copied)} archives ({megabytes:.1f} MiB)'
+            + f' in {result.seconds:.1f}s ({result.throughput / 1024 ** 2:.1f} MiB/s),'
+            + f' {result.present} already present, {len(result.failed)} failed')
+
+
+class CmdBoxXmeta(Command):
+    '''
+    Write missing or stale .xmeta files for all archives in the box.
+
+    Archives are processed in parallel, each .xmeta is written atomically.
+    An interrupted run can be continued by running it again.
+    '''
+    def declare(self, arg):
+        arg('name')
+        arg('-j', '--jobs', dest='jobs', type=int, default=None,
+            help='Process this many archives in parallel (default: number of CPUs)')
+        arg(OPTIONAL_ENV)
+
+    def run(self, args):
+        env = args.get_env()
+        box = env.get_box(args.name)
+        if box is None:
+            die(f'Unknown box {args.name}')
+
+        def on_progress(done, total, path, error):
+            print(f'[{done}/{total}] {path.name}' + (' - FAILED' if error else ''))
+
+        result = boxxmeta.write_xmetas(box, workers=args.jobs, on_progress=on_progress)
+        for path, reason in result.failed:
+            warning(f'Could not write .xmeta for {path}: {reason}')
+        print(
+            f'Wrote {result.written} .xmeta files in {result.seconds:.1f}s,'
+            + f' {result.up_to_date} already up to date, {len(result.failed)} failed')
+
+
+class CmdStats(Command):
+    '''
+    Report size and lookup cost of boxes.
+    '''
+    def declare(self, arg):
+        arg('--json', dest='json', default=False, action='store_true',
+            help='Print machine readable output')
+        arg('--cold', dest='cold', default=False, action='store_true',
+            help='Open all archives directly, measuring lookup cost without the box index')
+        arg(OPTIONAL_ENV)
+
+    def run(self, args):
+        env = args.get_env()
+        stats = [boxstats.box_stats(box, cold=args.cold) for box in env.get_boxes()]
+        if args.json:
+            print(tech.persistence.dumps([box_stats.as_dict() for box_stats in stats]))
+            return
+        for box_stats in stats:
+            _print_box_stats(box_stats)
+
+
+def _print_box_stats(stats: boxstats.BoxStats):
+    print(f'{stats.name}: {stats.location}')
+    print(f'  archives:          {stats.archives} in {stats.directories} directories')
+    print(f'  size:              {stats.bytes / 1024 ** 2:.1f} MiB')
+    print(f'  without .xmeta:    {stats.without_xmeta}')
+    print(f'  invalid:           {stats.invalid}')
+    print(f'  listing:           {stats.list_seconds:.3f}s')
+    print(f'  opening archives:  {stats.open_seconds:.3f}s')
+    distribution = ', '.join(
+        f'{versions}: {names}' for versions, names in stats.versions_per_name.items())
+    print(f'  versions per name: {distribution or "-"} (versions: names)')
+    for name, size in list(stats.bytes_per_name.items())[:10]:
+        print(f'  {size / 1024 ** 2:10.1f} MiB {name}')
+
+
+class CmdConsumers(Command):
+    '''
+    List beads using a bead as input.
+
+    BEAD_REF is an archive file (exact version) or a bead name (all versions).
+    '''
+    def declare(self, arg):
+        arg('bead_ref', metavar=arg_metavar.BEAD_REF, help=arg_help.BEAD_REF)
+        arg(OPTIONAL_ENV)
+
+    def run(self, args):
+        env = args.get_env()
+        content_id = bead_name = None
+        if os.path.isfile(args.bead_ref):
+            try:
+                content_id = Archive(args.bead_ref).content_id
+            except (InvalidArchive, LookupError):
+                die(f'Not a valid bead archive: {args.bead_ref}')
+        else:
+            bead_name = args.bead_ref
+        consumers = get_unionbox(env).consumers(content_id=content_id, bead_name=bead_name)
+        for bead in sorted(consumers, key=lambda bead: (bead.name, bead.freeze_time_str)):
+            try:
+                input_nicks = ', '.join(
+                    input.name for input in bead.inputs
+                    if input.content_id == content_id
+                    or bead.input_map.get(input.name, input.name) == bead_name)
+            except (InvalidArchive, LookupError):
+                die(f'Damaged archive: {bead.archive_filename}')
+            print(f'{bead.name} {bead.freeze_time_str} [{bead.box_name}] input: {input_nicks}')
+        if not consumers:
+            print('No beads use it as input')
+
+
+class CmdPublish(Command):
+    '''
+    Prepare a box to be served over HTTP (read-only).
+
+    Updates the box index and filter, and writes listings of the box directories.
+    The box directory can be served then by any web server supporting Range requests,
+    and added as a box by its URL.
+    Must be repeated after the box changes.
+    '''
+    def declare(self, arg):
+        arg('name')
+        arg(OPTIONAL_ENV)
+
+    def run(self, args):
+        env = args.get_env()
+        box = env.get_box(args.name)
+        if box is None:
+            die(f'Unknown box {args.name}')
+        beads = len(list(box.all_beads()))
+        box.rebuild_filter()
+        directories = write_listings(box)
+        print(f'Published {beads} beads in {directories} directories of box {box.name}')
+
+
+class CmdWatch(Command):
+    '''
+    Keep box indexes, filters and .xmeta files up to date as archives arrive.
+
+    Runs until interrupted, reporting added (+) and removed (-) archives.
+    On Linux, changes in local boxes are noticed immediately.
+    '''
+    def declare(self, arg):
+        arg('names', nargs='*', metavar='NAME', help='Boxes to watch (default: all boxes)')
+        arg('--interval', type=float, default=DEFAULT_WATCH_INTERVAL,
+            help=f'Seconds between looking for changes (default: {DEFAULT_WATCH_INTERVAL})')
+        arg('--once', default=False, action='store_true',
+            help='Update the boxes once, then exit')
+        arg(OPTIONAL_ENV)
+
+    def run(self, args):
+        env = args.get_env()
+        boxes = env.get_boxes()
+        if args.names:
+            boxes = [box for box in boxes if box.name in args.names]
+            for name in set(args.names) - set(box.name for box in boxes):
+                die(f'Unknown box {name}')
+        tokens = {box.name: None for box in boxes}
+        with DirectoryWatch() as watch:
+            try:
+                while True:
+                    for box in boxes:
+                        tokens[box.name] = _update_box(box, tokens[box.name])
+                    if args.once:
+                        return
+                    watch.watch(
+                        index.directory
+                        for box in boxes if box.storage is LOCAL
+                        for index in box.indexes())
+                    watch.wait(args.interval)
+            except KeyboardInterrupt:
+                pass
+
+
+def _update_box(box, token):
+    '''
+    Process the changes in box since token -> new token
+    '''
+    changes = box.changes(token)
+    for bead in changes.added:
+        if not bead.has_fresh_xmeta():
+            error = boxxmeta.write_xmeta(box.storage, bead.archive_path)
+            if error is not None:
+                warning(f'Could not save {bead.cache_path}: {error}')
+        if token is not None:
+            print(f'+ {box.name} {bead.archive_path.name}')
+    for path in changes.removed:
+        print(f'- {box.name} {path.name}')
+    if token is None:
+        print(f'Watching {len(changes.added)} archives in box {box.name}')
+    if changes:
+        box.rebuild_filter()
+    return changes.token
+
+
 class CmdRewire(Command):
     '''
     Remap inputs.
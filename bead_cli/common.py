@@ -1,11 +1,12 @@
 import os
 import sys
-from typing import NoReturn
+from typing import Callable, NoReturn, Optional
 
 from bead.exceptions import InvalidArchive
 from bead.workspace import Workspace
 from bead import spec as bead_spec
 from bead.archive import Archive
+from bead.archivemap import get_archive
 from bead import box as bead_box
 from bead.tech.fs import Path
 from bead.tech.timestamp import time_from_user, parse_iso8601
@@ -131,22 +132,39 @@ def BEAD_REF_BASE_defaulting_to(name):
 BEAD_REF_BASE = arg_bead_ref_base(nargs=None, default=None)
 
 
+def get_unionbox(env: Environment) -> bead_box.UnionBox:
+    def on_slow_box(box):
+        warning(f'Box "{box.name}" did not answer in {env.box_timeout} seconds - ignored')
+    return bead_box.UnionBox(env.get_boxes(), timeout=env.box_timeout, on_slow_box=on_slow_box)
+
+
 def resolve_bead(env, bead_ref_base, time):
     # prefer exact file name over box search
     if os.path.isfile(bead_ref_base):
-        return Archive(bead_ref_base)
+        return get_archive(bead_ref_base)
 
     # not a file - try box search
-    unionbox = bead_box.UnionBox(env.get_boxes())
+    unionbox = get_unionbox(env)
 
     return unionbox.get_at(bead_spec.BEAD_NAME, bead_ref_base, time)
 
 
-def verify_with_feedback(archive: Archive):
-    print(f'Verifying archive {archive.archive_filename} ...', end='', flush=True)
+def verify_with_feedback(
+    archive: Archive, verify: Optional[Callable[[], None]] = None, message: Optional[str] = None
+):
+    '''
+    Validate archive - or call verify(), which validates it while extracting.
+    '''
+    if message is None:
+        message = f'Verifying archive {archive.archive_filename}'
+    print(f'{message} ...', end='', flush=True)
     try:
-        archive.validate()
+        if verify is None:
+            archive.validate()
+        else:
+            verify()
         print(' OK', flush=True)
-    except InvalidArchive:
-        print(' DAMAGED!', flush=True)
+    except InvalidArchive as e:
+        bad_file = f' ({e.bad_file})' if e.bad_file is not None else ''
+        print(f' DAMAGED!{bad_file}', flush=True)
         raise
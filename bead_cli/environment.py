@@ -5,12 +5,19 @@ User specific environment
 import os
 
 from bead.box import Box
+from bead.cachedbox import ArchiveCache, CachedBox, DEFAULT_MAX_SIZE
+from bead.httpstorage import HTTPStorage, is_url
+from bead.storage import LOCAL
 from bead.tech import persistence
 from bead.tech.fs import Path
 
 ENV_BOXES = 'boxes'
 BOX_NAME = 'name'
 BOX_LOCATION = 'directory'
+BOX_CACHED = 'cached'
+ARCHIVE_CACHE_MAX_SIZE = 'archive_cache_max_size'
+# seconds to wait for a box to answer a query, no limit by default
+BOX_TIMEOUT = 'box_timeout'
 
 
 class Environment:
@@ -23,6 +30,7 @@ class Environment:
     def __init__(self, filename: Path):
         self.filename = filename
         self._content = {}
+        self._archive_cache = None
         if os.path.exists(self.filename):
             self.load()
 
@@ -38,22 +46,52 @@ class Environment:
         with open(self.filename, 'w') as f:
             persistence.dump(self._content, f)
 
+    @property
+    def archive_cache(self):
+        '''
+        Local copies of archives from boxes marked as cached - shared by these boxes.
+        '''
+        if self._archive_cache is None:
+            self._archive_cache = ArchiveCache(
+                Path(self.filename).parent / 'archive-cache',
+                self._content.get(ARCHIVE_CACHE_MAX_SIZE, DEFAULT_MAX_SIZE))
+        return self._archive_cache
+
+    @property
+    def box_timeout(self):
+        return self._content.get(BOX_TIMEOUT)
+
+    def _make_box(self, name, location, cached):
+        if is_url(location):
+            # read-only box served over HTTP
+            storage = HTTPStorage(location)
+        else:
+            location, storage = Path(location), LOCAL
+        if cached:
+            return CachedBox(name, location, self.archive_cache, storage)
+        return Box(name, location, storage)
+
     def get_boxes(self):
-        def box(box_spec):
-            return Box(
-                box_spec.get(BOX_NAME),
-                Path(box_spec.get(BOX_LOCATION)))
-        return [box(spec) for spec in self._content.get(ENV_BOXES, ())]
+        return [
+            self._make_box(spec.get(BOX_NAME), spec.get(BOX_LOCATION), spec.get(BOX_CACHED))
+            for spec in self._content.get(ENV_BOXES, ())]
 
     def set_boxes(self, boxes):
-        self._content[ENV_BOXES] = [
-            {
+        def box_spec(box):
+            location = box.location
+            spec = {
                 BOX_NAME: box.name,
-                BOX_LOCATION: box.location.as_posix()
+                BOX_LOCATION: location if is_url(location) else location.as_posix()
             }
-            for box in boxes]
+            if isinstance(box, CachedBox):
+                spec[BOX_CACHED] = True
+            return spec
+        self._content[ENV_BOXES] = [box_spec(box) for box in boxes]
 
-    def add_box(self, name, directory: Path):
+    def add_box(self, name, directory, cached=False):
+        '''
+        Define a box in directory (a Path), or at an http(s) URL.
+        '''
         boxes = self.get_boxes()
         # check unique box
         for box in boxes:
@@ -63,7 +101,7 @@ class Environment:
                 raise ValueError(
                     f'Box with location {box.location} already exists')
 
-        self.set_boxes(boxes + [Box(name, directory)])
+        self.set_boxes(boxes + [self._make_box(name, directory, cached)])
 
     def forget_box(self, name):
         self.set_boxes(
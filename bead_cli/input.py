@@ -12,7 +12,7 @@ from .common import (
     die, warning
 )
 from .common import BEAD_REF_BASE_defaulting_to, BEAD_OFFSET, BEAD_TIME, resolve_bead, TIME_LATEST
-from bead.box import UnionBox
+from .common import get_unionbox
 from bead.meta import BeadName
 import bead.spec as bead_spec
 from bead.workspace import Workspace
@@ -149,7 +149,7 @@ class CmdUpdate(Command):
             die("--next, --prev can not be specified when updating all inputs")
         workspace = get_workspace(args)
         env = args.get_env()
-        unionbox = UnionBox(env.get_boxes())
+        unionbox = get_unionbox(env)
         for input in workspace.inputs:
             bead_name = workspace.get_input_bead_name(input.name)
             try:
@@ -183,18 +183,19 @@ class CmdUpdate(Command):
             if args.bead_offset and args.bead_time is not TIME_LATEST:
                 die('You can give either --prev/--next or --time, not both')
 
-            boxes = env.get_boxes()
+            unionbox = get_unionbox(env)
+
             try:
                 if args.bead_offset:
                     # handle --prev --next
-                    context = _get_context(boxes, bead_name, input.freeze_time)
+                    context = _get_context(unionbox, bead_name, input.freeze_time)
                     if args.bead_offset == 1:
                         bead = context.next
                     else:
                         bead = context.prev
                 else:
                     # --time
-                    bead = _get_context(boxes, bead_name, args.bead_time).best
+                    bead = _get_context(unionbox, bead_name, args.bead_time).best
             except LookupError:
                 die(f'Could not find bead for "{input.name}" with name "{bead_name}"')
         else:
@@ -208,8 +209,7 @@ class CmdUpdate(Command):
             die('Can not find matching bead')
 
 
-def _get_context(boxes, bead_name, time):
-    unionbox = UnionBox(boxes)
+def _get_context(unionbox, bead_name, time):
     return unionbox.get_context(
         check_type=bead_spec.BEAD_NAME,
         check_param=bead_name,
@@ -242,30 +242,27 @@ class CmdLoad(Command):
     def run(self, args):
         input_nick = args.input_nick
         workspace = get_workspace(args)
-        env = args.get_env()
+        # one for all inputs: its boxes keep their index and filter read between queries
+        unionbox = get_unionbox(args.get_env())
         if input_nick is ALL_INPUTS:
             inputs = workspace.inputs
             if inputs:
                 for input in inputs:
-                    _load(env, workspace, input)
+                    _load(unionbox, workspace, input)
             else:
                 warning('No inputs defined to load.')
         else:
             if not workspace.has_input(input_nick):
                 die(f'No input with name {input_nick}')
-            _load(env, workspace, workspace.get_input(input_nick))
+            _load(unionbox, workspace, workspace.get_input(input_nick))
 
 
-def _load(env, workspace, input):
+def _load(unionbox, workspace, input):
     assert input is not None
     if not workspace.is_loaded(input.name):
         name = workspace.get_input_bead_name(input.name)
         content_id = input.content_id
-        bead = None
-        for box in env.get_boxes():
-            bead = box.find_bead(name, content_id)
-            if bead:
-                break
+        bead = unionbox.find_bead(name, content_id)
         if bead is None:
             warning(
                 f'Could not find archive named "{name}" for input "{input.name}" - not loaded!')
@@ -276,18 +273,15 @@ def _load(env, workspace, input):
 
 
 def _check_load_with_feedback(workspace: Workspace, input_nick, bead):
+    # the bead is verified while loading, current data is replaced only by intact data
     try:
-        verify_with_feedback(bead)
+        verify_with_feedback(
+            bead, lambda: workspace.load(input_nick, bead, verify=True),
+            f'Verifying and loading new data to {input_nick}')
     except InvalidArchive:
         warning(f'Bead for {input_nick} is found but damaged - not loading.')
     else:
         workspace.set_input_bead_name(input_nick, bead.name)
-        if workspace.is_loaded(input_nick):
-            print(f'Removing current data from {input_nick}')
-            workspace.unload(input_nick)
-        print(f'Loading new data to {input_nick} ...', end='', flush=True)
-        workspace.load(input_nick, bead)
-        print(' Done')
 
 
 class CmdUnload(Command):
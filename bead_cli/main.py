@@ -127,6 +127,13 @@ def make_argument_parser(defaults):
             ('list', box.CmdList, 'Show known boxes.'),
             ('forget', box.CmdForget, 'Forget a known box.'),
             ('rewire', box.CmdRewire, 'Remap inputs.'),
+            ('shard', box.CmdShard, 'Store archives in per bead name sub-directories.'),
+            ('sync', box.CmdSync, 'Copy beads missing from the destination box.'),
+            ('stats', box.CmdStats, 'Report size and lookup cost of boxes.'),
+            ('consumers', box.CmdConsumers, 'List beads using a bead as input.'),
+            ('publish', box.CmdPublish, 'Prepare a box to be served over HTTP.'),
+            ('watch', box.CmdWatch, 'Keep box indexes up to date as archives arrive.'),
+            ('xmeta', box.CmdBoxXmeta, 'Write missing or stale .xmeta files in parallel.'),
         ))
 
     parser.autocomplete()
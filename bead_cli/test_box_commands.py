@@ -1,8 +1,11 @@
+import json
 import os
 import pytest
 
 from .test_robot import Robot
 
+from tests.httpserver import serve
+
 from bead.tech.timestamp import timestamp as now_ts
 from bead.workspace import Workspace
 
@@ -209,3 +212,170 @@ def test_rewire(robot, dir1):
     assert robot.stderr == ''
     assert 'a' == robot.read_file('input/input-a/README')
     assert 'b' == robot.read_file('input/input-b/README')
+
+
+def test_shard(robot, dir1):
+    robot.cli('box', 'add', 'box', dir1)
+    robot.cli('new', 'a')
+    robot.cd('a')
+    robot.write_file('output/README', 'a')
+    robot.cli('save')
+    robot.cd('..')
+
+    robot.cli('box', 'shard', 'box')
+    assert 'Moved 1 archives' in robot.stdout
+    assert [] == list((robot.cwd / dir1).glob('*.zip'))
+    assert 1 == len(list((robot.cwd / dir1 / 'a').glob('a_*.zip')))
+
+    robot.cd('a')
+    robot.cli('save')
+    assert 2 == len(list((robot.cwd / '..' / dir1 / 'a').glob('a_*.zip')))
+    robot.cd('..')
+
+    robot.cli('zap', 'a')
+    robot.cli('develop', 'a', '-x')
+    assert 'a' == robot.read_file('a/output/README')
+
+
+def test_cached_box(robot, dir1):
+    robot.cli('box', 'add', '--cached', 'remote', dir1)
+    robot.cli('box', 'list')
+    assert 'remote' in robot.stdout
+    assert '(cached)' in robot.stdout
+
+    robot.cli('new', 'a')
+    robot.cd('a')
+    robot.write_file('output/README', 'a')
+    robot.cli('save')
+    robot.cd('..')
+    robot.cli('new', 'b')
+    robot.cd('b')
+    robot.cli('input', 'add', 'a')
+
+    assert 'a' == robot.read_file('input/a/README')
+    assert 1 == len(list((robot.config_dir / 'archive-cache').glob('*.zip')))
+
+
+def test_sync(robot, dir1, dir2):
+    robot.cli('box', 'add', 'team', dir1)
+    robot.cli('new', 'a')
+    robot.cd('a')
+    robot.write_file('output/README', 'a')
+    robot.cli('save')
+    robot.cd('..')
+    robot.cli('box', 'add', 'release', dir2)
+
+    robot.cli('box', 'sync', 'team', 'release')
+    assert 'Copied 1 archives' in robot.stdout
+    assert 1 == len(list((robot.cwd / dir2).glob('a_*.zip')))
+
+    robot.cli('box', 'sync', 'team', 'release')
+    assert 'Copied 0 archives' in robot.stdout
+    assert '1 already present' in robot.stdout
+
+
+def test_stats(robot, dir1):
+    robot.cli('box', 'add', 'box', dir1)
+    robot.cli('new', 'a')
+    robot.cd('a')
+    robot.cli('save')
+    robot.cli('save')
+    robot.cd('..')
+    (robot.cwd / dir1 / 'junk.zip').write_text('junk')
+
+    robot.cli('box', 'stats')
+    assert 'archives:          3' in robot.stdout
+    assert 'invalid:           1' in robot.stdout
+
+    robot.cli('box', 'stats', '--json', '--cold')
+    (stats,) = json.loads(robot.stdout)
+    assert 'box' == stats['name']
+    assert 3 == stats['archives']
+    assert 3 == stats['without_xmeta']
+    assert 1 == stats['invalid']
+    assert {'2': 1} == stats['versions_per_name']
+    assert ['a'] == list(stats['bytes_per_name'])
+
+
+def test_consumers(robot, dir1):
+    robot.cli('box', 'add', 'box', dir1)
+    robot.cli('new', 'a')
+    robot.cd('a')
+    robot.cli('save')
+    robot.cd('..')
+    robot.cli('new', 'b')
+    robot.cd('b')
+    robot.cli('input', 'add', 'a-data', 'a')
+    robot.cli('save')
+    robot.cd('..')
+
+    robot.cli('box', 'consumers', 'a')
+    assert 'b ' in robot.stdout
+    assert 'input: a-data' in robot.stdout
+
+    (archive,) = (robot.cwd / dir1).glob('a_*.zip')
+    robot.cli('box', 'consumers', archive)
+    assert 'input: a-data' in robot.stdout
+
+    robot.cli('box', 'consumers', 'b')
+    assert 'No beads use it as input' in robot.stdout
+
+
+def test_consumers_of_invalid_archive_is_error(robot, dir1):
+    robot.cli('box', 'add', 'box', dir1)
+    robot.write_file('not-a-bead.zip', 'junk')
+
+    with pytest.raises(SystemExit):
+        robot.cli('box', 'consumers', 'not-a-bead.zip')
+    assert 'ERROR' in robot.stderr
+    assert 'not-a-bead.zip' in robot.stderr
+
+
+def test_publish_and_use_box_over_http(robot, dir1):
+    robot.cli('box', 'add', 'box', dir1)
+    robot.cli('new', 'a')
+    robot.cd('a')
+    robot.write_file('output/README', 'served over HTTP')
+    robot.cli('save')
+    robot.cd('..')
+    robot.cli('box', 'publish', 'box')
+    assert 'Published 1 beads in 1 directories' in robot.stdout
+
+    with serve(robot.cwd) as server, Robot() as reader:
+        reader.cli('box', 'add', 'web', f'{server.url}/dir1')
+        reader.cli('box', 'list')
+        assert f'web: {server.url}/dir1' in reader.stdout
+        reader.cli('develop', '-x', 'a')
+        assert 'served over HTTP' == reader.read_file('a/output/README')
+
+
+def test_watch(robot, dir1):
+    robot.cli('box', 'add', 'box', dir1)
+    robot.cli('new', 'a')
+    robot.cd('a')
+    robot.cli('save')
+    robot.cd('..')
+    for xmeta in (robot.cwd / dir1).glob('*.xmeta'):
+        xmeta.unlink()
+
+    robot.cli('box', 'watch', '--once')
+    assert 'Watching 1 archives in box box' in robot.stdout
+    assert 1 == len(list((robot.cwd / dir1).glob('*.xmeta')))
+
+
+def test_box_xmeta(robot, dir1):
+    robot.cli('box', 'add', 'box', dir1)
+    robot.cli('new', 'a')
+    robot.cd('a')
+    robot.cli('save')
+    robot.cd('..')
+    for xmeta in (robot.cwd / dir1).glob('*.xmeta'):
+        xmeta.unlink()
+
+    robot.cli('box', 'xmeta', 'box', '-j', '2')
+    assert 'Wrote 1 .xmeta files' in robot.stdout
+    assert 1 == len(list((robot.cwd / dir1).glob('*.xmeta')))
+
+    robot.cli('box', 'xmeta', 'box')
+    assert 'Wrote 0 .xmeta files' in robot.stdout
+    assert '1 already up to date' in robot.stdout
@@ -246,3 +246,9 @@ def test_rewire(robot, renamed_e_web_file, remap_e_to_renamed_e_json):
     assert f.input_map == {'e': 'renamed_e'}, f
     assert 'WARNING' in robot.stderr
     assert "Selected name 'renamed_e'" in robot.stderr
+
+
+def test_concurrent_load(robot, bead_with_inputs, box):
+    robot.cli('web --jobs 4 save all.web')
+    web = Sketch.from_file(robot.cwd / 'all.web')
+    assert {'bead_a', 'bead_b', bead_with_inputs} == {bead.name for bead in web.beads}
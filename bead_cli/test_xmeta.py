@@ -1,4 +1,9 @@
+import os
+
+import pytest
+
 from bead.archive import Archive
+from bead.exceptions import InvalidArchive
 from bead.tech.fs import read_file, write_file
 
 
@@ -22,9 +27,24 @@ def test_meta_attributes_are_available_without_reading_the_archive(
 
     robot.cli('xmeta', archive_filename)
     # damage the archive, so that all data must come from the xmeta file
+    # (keeping its size and modification time, so that the xmeta file is not stale)
+    stat = os.stat(archive_filename)
+    with open(archive_filename, 'r+b') as f:
+        f.write(b'\0' * stat.st_size)
+    os.utime(archive_filename, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+    xmeta_archive = Archive(archive_filename)
+    assert archive_attributes == get_meta(xmeta_archive)
+
+
+def test_stale_xmeta_is_ignored(robot, bead_with_inputs, beads):
+    archive_filename = beads[bead_with_inputs].archive_filename
+    robot.cli('xmeta', archive_filename)
+
+    # replace the archive
     with robot.environment:
         write_file(archive_filename, '')
         assert read_file(archive_filename) == ''
 
-    xmeta_archive = Archive(archive_filename)
-    assert archive_attributes == get_meta(xmeta_archive)
+    with pytest.raises(InvalidArchive):
+        Archive(archive_filename)
@@ -17,6 +17,10 @@ from .dummy import Dummy
 from . import rewire
 
 
+# loading archive metadata is latency bound on network mounts
+DEFAULT_LOAD_JOBS = 8
+
+
 class CmdWeb(Command):
     '''
     Visualize the big picture.
@@ -86,6 +90,10 @@ class CmdWeb(Command):
 
     def declare(self, arg):
         arg(OPTIONAL_ENV)
+        arg(
+            '-j', '--jobs', dest='jobs', type=int, default=DEFAULT_LOAD_JOBS,
+            help='Number of archives to load concurrently'
+        )
         arg(
             'words',
             metavar='...',
@@ -100,7 +108,7 @@ class CmdWeb(Command):
             return
         env = args.get_env()
 
-        commands, remaining_words = parse_commands(env, args.words)
+        commands, remaining_words = parse_commands(env, args.words, args.jobs)
         if remaining_words:
             msg = 'Could not fully parse command line.\n'
             if commands:
@@ -114,12 +122,12 @@ class CmdWeb(Command):
             sketch = command(sketch)
 
 
-def parse_commands(env, words):
+def parse_commands(env, words, load_jobs=1):
     remaining_words = words[::-1]
     commands = []
 
     if remaining_words and remaining_words[-1] != 'load':
-        commands.append(LoadAll(env.get_boxes()))
+        commands.append(LoadAll(env.get_boxes(), load_jobs))
 
     while remaining_words:
         remaining = remaining_words[:]
@@ -156,12 +164,13 @@ class ProcessorWithFileName(SketchProcessor):
 
 
 class LoadAll(SketchProcessor):
-    def __init__(self, boxes):
+    def __init__(self, boxes, jobs=1):
         super().__init__([])
         self.boxes = boxes
+        self.jobs = jobs
 
     def __call__(self, _sketch):
-        beads = load_all_beads(self.boxes)
+        beads = load_all_beads(self.boxes, self.jobs)
         print(f"Loaded {len(beads)} beads")
         return self.sketch_from_beads(beads)
 
@@ -290,14 +299,14 @@ SUBCOMMANDS = {
 }
 
 
-def load_all_beads(boxes):
+def load_all_beads(boxes, jobs=1):
     columns = int(os.environ.get('COLUMNS', 80))
     all_beads = []
     import time
     load_start = time.perf_counter()
     # This UnionBox.all_beads is the meat, the rest is just user feedback for big/slow
     # environments
-    for n, bead in enumerate(UnionBox(boxes).all_beads()):
+    for n, bead in enumerate(UnionBox(boxes).all_beads(workers=jobs)):
         load_end = time.perf_counter()
 
         msg = f"\rLoaded bead {n + 1} ({bead.archive_filename})"[:columns]
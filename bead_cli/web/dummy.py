@@ -1,9 +1,9 @@
-from typing import Iterable, Dict, List, TypeVar
+from datetime import datetime
+from typing import Iterable, Dict, List, Optional, TypeVar
 
 import attr
-from cached_property import cached_property
 
-from bead.meta import InputSpec, InputName, BeadName
+from bead.meta import InputSpec, InputName, BeadName, intern
 from bead.tech.timestamp import time_from_timestamp
 from .freshness import Freshness
 
@@ -15,10 +15,10 @@ def input_map_converter(value) -> InputMap:
     """attr converter"""
     if value is None:
         return {}
-    return {InputName(k): BeadName(v) for k, v in value.items()}
+    return {InputName.interned(k): BeadName.interned(v) for k, v in value.items()}
 
 
-@attr.s(auto_attribs=True)
+@attr.s(auto_attribs=True, slots=True)
 class Dummy:
     """
     A bead.Bead look-alike when looking only at the metadata.
@@ -26,24 +26,32 @@ class Dummy:
     Also has metadata for coloring (freshness).
     """
     # these are considered immutable once the object is created
-    name: str = attr.ib(kw_only=True, default="UNKNOWN")
-    content_id: str = attr.ib(kw_only=True)
-    kind: str = attr.ib(kw_only=True)
-    freeze_time_str: str = attr.ib(kw_only=True)
+    name: str = attr.ib(kw_only=True, default="UNKNOWN", converter=intern)
+    content_id: str = attr.ib(kw_only=True, converter=intern)
+    kind: str = attr.ib(kw_only=True, converter=intern)
+    freeze_time_str: str = attr.ib(kw_only=True, converter=intern)
     inputs: List[InputSpec] = attr.ib(kw_only=True, factory=list, converter=list)
 
     # these can be modified after the object is created
     input_map: InputMap = attr.ib(kw_only=True, factory=dict, converter=input_map_converter)
     freshness: Freshness = attr.ib(kw_only=True, default=Freshness.SUPERSEDED, converter=Freshness)
-    box_name: str = attr.ib(kw_only=True, default='')
+    box_name: str = attr.ib(kw_only=True, default='', converter=intern)
 
-    @cached_property
-    def freeze_time(self):
-        return time_from_timestamp(self.freeze_time_str)
+    # parsed once, when needed
+    _freeze_time: Optional[datetime] = attr.ib(init=False, default=None, eq=False, repr=False)
+    _ref: Optional['Ref'] = attr.ib(init=False, default=None, eq=False, repr=False)
 
-    @cached_property
+    @property
+    def freeze_time(self) -> datetime:
+        if self._freeze_time is None:
+            self._freeze_time = time_from_timestamp(self.freeze_time_str)
+        return self._freeze_time
+
+    @property
     def ref(self) -> 'Ref':
-        return Ref.from_bead(self)
+        if self._ref is None:
+            self._ref = Ref.from_bead(self)
+        return self._ref
 
     @classmethod
     def from_bead(cls, bead):
@@ -20,7 +20,8 @@ def encoder(obj):
         return {
             ENCODING: ENCODING_ATTRS,
             CLASS_NAME: obj.__class__.__name__,
-            **attr.asdict(obj, recurse=False),
+            # derived attributes are not saved
+            **attr.asdict(obj, recurse=False, filter=lambda attribute, _value: attribute.init),
         }
     if isinstance(obj, Enum):
         return {
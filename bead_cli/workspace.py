@@ -140,10 +140,6 @@ class CmdDevelop(Command):
             bead = resolve_bead(env, args.bead_ref_base, args.bead_time)
         except LookupError:
             die('Bead not found!')
-        try:
-            verify_with_feedback(bead)
-        except InvalidArchive:
-            die('Bead is damaged')
         if args.workspace is DERIVE_FROM_BEAD_NAME:
             workspace = Workspace(bead.name)
         else:
@@ -152,12 +148,18 @@ class CmdDevelop(Command):
         if os.path.exists(workspace.directory):
             die(f'Workspace "{workspace.name}" directory already exists'
                 ' - do you have an old checkout?')
-        bead.unpack_to(workspace)
-        assert workspace.is_valid
-
+        # the bead is verified while extracting, nothing is left behind if it is damaged
+        extractions = [(layouts.Archive.CODE, workspace.directory)]
         if extract_output:
-            output_directory = workspace.directory / layouts.Workspace.OUTPUT
-            bead.unpack_data_to(output_directory)
+            extractions.append(
+                (layouts.Archive.DATA, workspace.directory / layouts.Workspace.OUTPUT))
+        try:
+            verify_with_feedback(bead, lambda: bead.extract_dirs_verified(extractions))
+        except InvalidArchive:
+            die('Bead is damaged')
+        workspace.create_directories()
+        bead.unpack_meta_to(workspace)
+        assert workspace.is_valid
 
         print(f'Extracted source into {workspace.directory}')
         # XXX: try to load smaller inputs?
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+'''
+Memory footprint of bead metadata records - per bead.
+
+Makes archives the way box index lookups do (from already parsed meta),
+reads their attributes like `bead web` does, and makes web Dummy-es of them.
+Reports the memory they keep allocated (tracemalloc), divided by the number of beads.
+
+The baseline keeps the same attributes in plain, unshared objects
+(parsed meta dict, __dict__ based records, strings not interned) - for comparison.
+
+Usage: dev/memory_benchmark.py [number of beads]
+'''
+
+import gc
+import json
+import os
+import sys
+import tracemalloc
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from bead.archive import Archive  # noqa: E402
+from bead.tech.timestamp import time_from_timestamp  # noqa: E402
+from bead_cli.web.dummy import Dummy  # noqa: E402
+
+
+INPUTS_PER_BEAD = 3
+BEAD_NAMES = 200
+KINDS = 50
+
+
+def records(count):
+    '''
+    Parsed box index meta records - distinct objects, like ones read from JSON lines.
+    '''
+    for i in range(count):
+        inputs = {
+            f'input{j}': {
+                'kind': f'kind{(i + j) % KINDS:040d}',
+                'content_id': f'{(i + j) % count:0128x}',
+                'freeze_time': '20160704T000000000000+0200',
+            }
+            for j in range(INPUTS_PER_BEAD)}
+        yield json.loads(json.dumps({
+            'meta_version': 'aaa947a6-1f7a-11e6-ba3a-0021cc73492e',
+            'content_id': f'{i:0128x}',
+            'kind': f'kind{i % KINDS:040d}',
+            'freeze_time': '20160704T000000000000+0200',
+            'inputs': inputs,
+            'input_map': {'input0': f'bead{(i + 1) % BEAD_NAMES}'},
+        }))
+
+
+def file_name(i):
+    return f'/box/bead{i % BEAD_NAMES}_20160704T000000000000+0200.zip'
+
+
+def bead_records(metas):
+    '''
+    Archive-s and web Dummy-es, as kept by box lookups and `bead web`.
+    '''
+    kept = []
+    for i, cache in enumerate(metas):
+        archive = Archive(file_name(i), 'box', cache=cache)
+        archive.inputs, archive.freeze_time
+        dummy = Dummy.from_bead(archive)
+        dummy.freeze_time
+        kept.append((archive, dummy))
+    return kept
+
+
+def baseline_records(metas):
+    '''
+    The same attributes in plain objects: nothing slotted, shared or interned.
+    '''
+    kept = []
+    for i, cache in enumerate(metas):
+        path = file_name(i)
+        name = path.split('/')[-1].split('_')[0]
+        inputs = [
+            SimpleNamespace(
+                name=input_name, kind=spec['kind'], content_id=spec['content_id'],
+                freeze_time_str=spec['freeze_time'])
+            for input_name, spec in cache['inputs'].items()]
+        freeze_time = time_from_timestamp(cache['freeze_time'])
+        archive = SimpleNamespace(
+            archive_filename=path, box_name='box', name=name, cache=dict(cache),
+            inputs=inputs, freeze_time=freeze_time)
+        dummy = SimpleNamespace(
+            name=name, content_id=cache['content_id'], kind=cache['kind'],
+            freeze_time_str=cache['freeze_time'], inputs=list(inputs),
+            input_map=dict(cache['input_map']), box_name='box', freeze_time=freeze_time)
+        kept.append((archive, dummy))
+    return kept
+
+
+def measure(count, make_records=bead_records):
+    metas = list(records(count))
+    gc.collect()
+    tracemalloc.start()
+    start, _ = tracemalloc.get_traced_memory()
+    kept = make_records(metas)
+    gc.collect()
+    end, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert len(kept) == count
+    return (end - start) / count
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    baseline = measure(count, baseline_records)
+    actual = measure(count)
+    print(f'{count} beads, bytes per bead (archive + web dummy):')
+    print(f'  baseline: {baseline:.0f}')
+    print(f'  bead:     {actual:.0f} ({actual / baseline:.0%} of baseline)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+'''
+Static web server for tests - serving a directory with or without Range requests.
+'''
+
+import contextlib
+import functools
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+import os
+import threading
+
+
+class RangeRequestHandler(SimpleHTTPRequestHandler):
+    '''
+    Static files with keep-alive connections and Range requests - like a real web server.
+    '''
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_error(self, code, message=None, explain=None):
+        if code != 404:
+            return super().send_error(code, message, explain)
+        # keeping the connection open
+        body = b'' if self.command == 'HEAD' else b'Not found'
+        self.send_response(code)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_HEAD(self):
+        self.server.requests.append((self.command, self.path, None))
+        super().do_HEAD()
+
+    def do_GET(self):
+        range_header = self.headers.get('Range')
+        self.server.requests.append((self.command, self.path, range_header))
+        path = self.translate_path(self.path)
+        if range_header is None or not os.path.isfile(path):
+            return super().do_GET()
+        start, end = (int(position) for position in range_header[len('bytes='):].split('-'))
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            f.seek(start)
+            data = f.read(max(0, min(end, size - 1) - start + 1))
+        if start >= size:
+            self.send_response(416)
+            self.send_header('Content-Range', f'bytes */{size}')
+        else:
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{start + len(data) - 1}/{size}')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+        self.server.bytes_sent += len(data)
+
+
+class NoRangeRequestHandler(RangeRequestHandler):
+    '''
+    Static files, ignoring Range requests - like some simple web servers.
+    '''
+
+    def do_GET(self):
+        self.server.requests.append((self.command, self.path, self.headers.get('Range')))
+        SimpleHTTPRequestHandler.do_GET(self)
+
+
+@contextlib.contextmanager
+def serve(directory, handler_class=RangeRequestHandler):
+    '''
+    Serve directory over HTTP -> server, with the URL of directory as server.url
+    '''
+    handler = functools.partial(handler_class, directory=str(directory))
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.requests = []
+    server.connections = 0
+    server.bytes_sent = 0
+    server.url = f'http://127.0.0.1:{server.server_port}'
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()